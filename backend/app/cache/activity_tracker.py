@@ -0,0 +1,198 @@
+"""
+Write-behind "last seen" tracking (users.last_active_at).
+
+JWTAuthMiddleware gọi record() cho mọi request đã xác thực: chỉ ghi vào một
+dict in-process (user_id -> thời điểm mới nhất), không chạm DB. Mỗi
+ACTIVITY_FLUSH_INTERVAL giây buffer được flush thành một bulk UPDATE
+(CASE theo id), nên mỗi user được ghi tối đa một lần mỗi interval dù gửi
+bao nhiêu request.
+
+Nhiều worker (có Redis):
+- Mỗi worker merge buffer của mình vào hash activity:pending (giữ max)
+- Worker lấy được flush lock (TTL = interval) lấy toàn bộ hash ra và ghi DB;
+  các worker khác chỉ merge
+"""
+
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+from sqlalchemy import case, or_, update
+
+from cache.redis_client import redis_client, is_redis_available
+from core.config import settings
+from database.session import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+PENDING_KEY = "activity:pending"
+LOCK_KEY = "activity:flush:lock"
+
+# KEYS: pending | ARGV: user_id, ts, user_id, ts...
+# Merge giữ thời điểm lớn nhất cho mỗi user
+_MERGE_SCRIPT = """
+for i = 1, #ARGV, 2 do
+    local current = tonumber(redis.call('HGET', KEYS[1], ARGV[i]) or '0')
+    if tonumber(ARGV[i + 1]) > current then
+        redis.call('HSET', KEYS[1], ARGV[i], ARGV[i + 1])
+    end
+end
+return 1
+"""
+
+# KEYS: pending | Lấy và xóa hash trong một bước
+_TAKE_SCRIPT = """
+local entries = redis.call('HGETALL', KEYS[1])
+redis.call('DEL', KEYS[1])
+return entries
+"""
+
+
+class ActivityTracker:
+    """Buffer user_id -> last activity (epoch seconds), flush định kỳ xuống users"""
+
+    UPDATE_CHUNK = 1000
+
+    def __init__(self, interval: int = settings.ACTIVITY_FLUSH_INTERVAL, use_redis: bool = is_redis_available):
+        self.interval = interval
+        self._use_redis = use_redis
+        # Chỉ đọc/ghi trên event loop (record, swap buffer) nên không cần lock;
+        # phần chạy trong threadpool chỉ nhận buffer đã tách ra
+        self._pending: Dict[int, int] = {}
+        if use_redis:
+            self._merge_script = redis_client.register_script(_MERGE_SCRIPT)
+            self._take_script = redis_client.register_script(_TAKE_SCRIPT)
+
+        self.recorded = 0
+        self.flushes = 0
+        self.rows_written = 0
+        self.last_flush_ms = 0.0
+
+    def record(self, user_id: int, at: Optional[float] = None) -> None:
+        """Ghi nhận user vừa hoạt động (chỉ in-memory)"""
+        ts = int(at if at is not None else time.time())
+        if ts > self._pending.get(user_id, 0):
+            self._pending[user_id] = ts
+        self.recorded += 1
+
+    def _take_local(self) -> Dict[int, int]:
+        pending, self._pending = self._pending, {}
+        return pending
+
+    def _restore_local(self, entries: Dict[int, int]) -> None:
+        for user_id, ts in entries.items():
+            self.record(user_id, ts)
+        self.recorded -= len(entries)
+
+    def flush(self) -> int:
+        """
+        Đẩy buffer xuống DB (qua Redis nếu có). Trả về số user đã ghi.
+        Chạy đồng bộ trên event loop: chỉ dùng lúc shutdown.
+        """
+        local = self._take_local()
+        try:
+            return self._flush(local)
+        except Exception:
+            self._restore_local(local)
+            return 0
+
+    def _flush(self, local: Dict[int, int]) -> int:
+        """
+        Ghi buffer đã tách khỏi _pending (chạy được trong threadpool).
+        Raise khi không ghi được local: caller trả buffer lại trên event loop.
+        """
+        if not self._use_redis:
+            return self._write(local)
+
+        try:
+            if local:
+                args = []
+                for user_id, ts in local.items():
+                    args.extend((user_id, ts))
+                self._merge_script(keys=[PENDING_KEY], args=args)
+            if not redis_client.set(LOCK_KEY, 1, nx=True, ex=self.interval):
+                return 0  # Worker khác đã flush trong interval này
+            raw = self._take_script(keys=[PENDING_KEY])
+        except Exception as e:
+            logger.error(f"Activity tracker Redis error: {e}")
+            # Redis lỗi: ghi thẳng buffer của worker này
+            return self._write(local)
+
+        entries = {int(raw[i]): int(raw[i + 1]) for i in range(0, len(raw), 2)}
+        try:
+            return self._write(entries)
+        except Exception:
+            # Trả lại Redis để lần flush sau ghi tiếp
+            try:
+                args = []
+                for user_id, ts in entries.items():
+                    args.extend((user_id, ts))
+                if args:
+                    self._merge_script(keys=[PENDING_KEY], args=args)
+            except Exception as e:
+                logger.error(f"Activity tracker restore error: {e}")
+            return 0
+
+    def _write(self, entries: Dict[int, int]) -> int:
+        """Bulk UPDATE users.last_active_at (không bao giờ lùi thời điểm đã ghi)"""
+        if not entries:
+            return 0
+        from models.user import User
+
+        started = time.perf_counter()
+        items = sorted(entries.items())  # Thứ tự id cố định: tránh deadlock giữa các worker
+        db = SessionLocal()
+        try:
+            for i in range(0, len(items), self.UPDATE_CHUNK):
+                chunk = dict(items[i:i + self.UPDATE_CHUNK])
+                last_active = case(
+                    {user_id: datetime.fromtimestamp(ts, tz=timezone.utc) for user_id, ts in chunk.items()},
+                    value=User.id,
+                )
+                db.execute(
+                    update(User)
+                    .where(User.id.in_(chunk))
+                    .where(or_(User.last_active_at.is_(None), User.last_active_at < last_active))
+                    .values(last_active_at=last_active)
+                    .execution_options(synchronize_session=False)
+                )
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Activity flush error: {e}")
+            raise
+        finally:
+            db.close()
+
+        self.flushes += 1
+        self.rows_written += len(items)
+        self.last_flush_ms = round((time.perf_counter() - started) * 1000, 2)
+        return len(items)
+
+    async def run(self) -> None:
+        """Flush loop (chạy như background task trong lifespan)"""
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.interval)
+            # Tách buffer trên loop, chỉ phần ghi DB/Redis chạy trong threadpool
+            local = self._take_local()
+            try:
+                await loop.run_in_executor(None, self._flush, local)
+            except Exception as e:
+                logger.error(f"Activity flush failed: {e}")
+                self._restore_local(local)
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self._pending),
+            "recorded": self.recorded,
+            "flushes": self.flushes,
+            "rows_written": self.rows_written,
+            "last_flush_ms": self.last_flush_ms,
+        }
+
+
+# Singleton tracker instance
+activity_tracker = ActivityTracker()
@@ -0,0 +1,139 @@
+"""
+Binary codec cho giá trị cache (set_cache / get_cache).
+
+Format:
+    byte 0   MAGIC 0xC1 (không bao giờ là byte đầu của UTF-8 hợp lệ, nên
+             không nhầm với giá trị JSON/str cũ)
+    byte 1   VERSION
+    byte 2   type tag (4 bit thấp) | FLAG_ZLIB
+    payload  theo type:
+             NONE/TRUE/FALSE  rỗng
+             INT              signed big-endian, độ dài tối thiểu
+             FLOAT            IEEE 754 double
+             STR              UTF-8
+             BYTES            raw
+             JSON             dict/list/... qua core.serialization (orjson)
+
+Type được giữ nguyên khi đọc lại: str "123" vẫn là str, chỉ giá trị JSON
+mới qua parser. Payload từ CACHE_COMPRESS_MIN_BYTES trở lên được nén zlib
+(chỉ khi nén làm nhỏ đi).
+
+Rolling upgrade:
+- Giá trị không có MAGIC là format cũ (JSON hoặc str raw): decode như trước
+- VERSION lạ (worker mới hơn đã ghi) -> UnknownCodecVersion, caller coi là miss
+"""
+
+import struct
+import zlib
+from typing import Any, Union
+
+from core.config import settings
+from core.serialization import dumps, loads
+
+MAGIC = 0xC1
+VERSION = 1
+
+T_NONE = 0
+T_FALSE = 1
+T_TRUE = 2
+T_INT = 3
+T_FLOAT = 4
+T_STR = 5
+T_BYTES = 6
+T_JSON = 7
+
+FLAG_ZLIB = 0x80
+_TYPE_MASK = 0x0F
+
+_DOUBLE = struct.Struct(">d")
+_HEADERS = {tag: bytes((MAGIC, VERSION, tag)) for tag in range(T_JSON + 1)}
+_HEADERS_ZLIB = {tag: bytes((MAGIC, VERSION, tag | FLAG_ZLIB)) for tag in range(T_JSON + 1)}
+
+
+# Theo thứ tự type tag
+_DECODERS = (
+    lambda payload: None,
+    lambda payload: False,
+    lambda payload: True,
+    lambda payload: int.from_bytes(payload, "big", signed=True),
+    lambda payload: _DOUBLE.unpack(payload)[0],
+    lambda payload: payload.decode("utf-8"),
+    bytes,
+    loads,
+)
+
+
+class UnknownCodecVersion(ValueError):
+    """Giá trị được ghi bởi codec version mới hơn"""
+
+
+def _payload(value: Any):
+    # bool trước int (bool là subclass của int)
+    if value is None:
+        return T_NONE, b""
+    if value is True:
+        return T_TRUE, b""
+    if value is False:
+        return T_FALSE, b""
+    value_type = type(value)
+    if value_type is str:
+        return T_STR, value.encode("utf-8")
+    if value_type is int:
+        return T_INT, value.to_bytes((value.bit_length() + 8) // 8, "big", signed=True)
+    if value_type is float:
+        return T_FLOAT, _DOUBLE.pack(value)
+    if value_type is bytes:
+        return T_BYTES, value
+    return T_JSON, dumps(value)
+
+
+def encode(
+    value: Any,
+    compress_min_bytes: int = settings.CACHE_COMPRESS_MIN_BYTES,
+    compress_level: int = settings.CACHE_COMPRESS_LEVEL,
+) -> bytes:
+    """Encode giá trị thành bytes có type tag (nén nếu payload lớn)"""
+    tag, payload = _payload(value)
+    if compress_min_bytes and len(payload) >= compress_min_bytes:
+        compressed = zlib.compress(payload, compress_level)
+        if len(compressed) < len(payload):
+            return _HEADERS_ZLIB[tag] + compressed
+    return _HEADERS[tag] + payload
+
+
+def _decode_legacy(data: Union[str, bytes]) -> Any:
+    """Format trước codec: JSON, hoặc str raw nếu không parse được"""
+    if isinstance(data, bytes):
+        data = data.decode("utf-8")
+    try:
+        return loads(data)
+    except ValueError:
+        return data
+
+
+def decode(data: Union[str, bytes, None]) -> Any:
+    """
+    Decode giá trị đọc từ cache (None giữ nguyên).
+
+    Raises:
+        UnknownCodecVersion: giá trị do codec version mới hơn ghi
+        ValueError: dữ liệu hỏng
+    """
+    if data is None:
+        return None
+    if not isinstance(data, bytes) or not data or data[0] != MAGIC:
+        return _decode_legacy(data)
+    if len(data) < 3:
+        raise ValueError("Truncated cache value")
+    if data[1] != VERSION:
+        raise UnknownCodecVersion(f"Cache codec version {data[1]} (supported: {VERSION})")
+
+    flags = data[2]
+    payload = data[3:]
+    if flags & FLAG_ZLIB:
+        payload = zlib.decompress(payload)
+    try:
+        decoder = _DECODERS[flags & _TYPE_MASK]
+    except IndexError:
+        raise ValueError(f"Unknown cache value type {flags & _TYPE_MASK}")
+    return decoder(payload)
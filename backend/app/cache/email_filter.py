@@ -0,0 +1,350 @@
+"""
+Email existence filter (scalable Bloom filter).
+
+Chứa mọi email đã đăng ký (đã normalize). Bloom filter không có false
+negative: "không có" là chắc chắn, nên /auth/check-email và duplicate check
+trong register trả lời ngay mà không query MySQL. "Có thể có" thì vẫn hỏi DB.
+
+Scalable: filter gồm nhiều layer, layer i có capacity = CAPACITY * 2^i và
+error rate = ERROR_RATE * 0.5^(i+1), nên tổng false-positive rate luôn
+< ERROR_RATE dù số user tăng vượt capacity ban đầu.
+
+Storage:
+- Redis (dùng chung giữa các worker): mỗi layer là một bitmap; kiểm tra
+  membership là một pipeline GETBIT (một round trip)
+- Không có Redis: bytearray in-process
+
+Filter được build lúc startup từ bảng users (build local rồi upload cả
+bitmap), worker khác dùng lại filter đã có trong Redis. Email không bao giờ
+bị xóa khỏi filter (update_user đổi email chỉ thêm email mới): email cũ chỉ
+còn là một false positive, DB vẫn trả lời đúng.
+"""
+
+import hashlib
+import logging
+import math
+import threading
+import time
+from typing import Iterable, List, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from cache.redis_client import redis_client, is_redis_available
+from core.config import settings
+from database.session import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+GROWTH = 2          # Capacity layer sau / layer trước
+TIGHTENING = 0.5    # Error rate layer sau / layer trước
+
+
+def normalize_email(email: str) -> str:
+    return email.strip().lower()
+
+
+def _hash_pair(email: str) -> Tuple[int, int]:
+    digest = hashlib.blake2b(normalize_email(email).encode("utf-8"), digest_size=16).digest()
+    return int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+
+
+class _Layer:
+    """Kích thước một layer Bloom filter (m bits, k hash functions)"""
+
+    __slots__ = ("index", "capacity", "bits", "hashes")
+
+    def __init__(self, index: int, base_capacity: int, base_error_rate: float):
+        self.index = index
+        self.capacity = base_capacity * GROWTH ** index
+        error_rate = base_error_rate * TIGHTENING ** (index + 1)
+        self.bits = int(math.ceil(-self.capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, int(round(self.bits / self.capacity * math.log(2))))
+
+    def positions(self, h1: int, h2: int) -> List[int]:
+        # Double hashing (Kirsch-Mitzenmacher)
+        return [(h1 + i * h2) % self.bits for i in range(self.hashes)]
+
+
+class _LocalBits:
+    """
+    In-process storage.
+    Bit order giống Redis (bit 0 là MSB của byte đầu) để upload nguyên bitmap.
+    """
+
+    def __init__(self):
+        self.buffers: List[bytearray] = []
+        self.counts: List[int] = []
+        self._lock = threading.Lock()
+
+    def layer_count(self) -> int:
+        return len(self.buffers)
+
+    def get_bits(self, layers: List[_Layer], h1: int, h2: int) -> Tuple[int, List[list]]:
+        buffers = self.buffers
+        bits = [
+            [buffers[layer.index][pos >> 3] & (0x80 >> (pos & 7)) for pos in layer.positions(h1, h2)]
+            for layer in layers if layer.index < len(buffers)
+        ]
+        return len(buffers), bits
+
+    def open_layer(self, layer: _Layer) -> None:
+        with self._lock:
+            while len(self.buffers) <= layer.index:
+                self.buffers.append(bytearray((layer.bits + 7) // 8))
+                self.counts.append(0)
+
+    def add(self, layer: _Layer, positions: Iterable[int], count: int) -> int:
+        self.open_layer(layer)
+        with self._lock:
+            buf = self.buffers[layer.index]
+            for pos in positions:
+                buf[pos >> 3] |= 0x80 >> (pos & 7)
+            self.counts[layer.index] += count
+            return self.counts[layer.index]
+
+    def count(self, layer: _Layer) -> int:
+        with self._lock:
+            return self.counts[layer.index] if layer.index < len(self.counts) else 0
+
+
+class _RedisBits:
+    """Redis storage: bitmap + counter mỗi layer, số layer ở key riêng"""
+
+    def __init__(self, client, prefix: str):
+        self._client = client
+        self._prefix = prefix
+
+    def _key(self, suffix) -> str:
+        return f"{self._prefix}:{suffix}"
+
+    def layer_count(self) -> int:
+        return int(self._client.get(self._key("layers")) or 0)
+
+    def get_bits(self, layers: List[_Layer], h1: int, h2: int) -> Tuple[int, List[list]]:
+        pipe = self._client.pipeline(transaction=False)
+        pipe.get(self._key("layers"))
+        for layer in layers:
+            for pos in layer.positions(h1, h2):
+                pipe.getbit(self._key(layer.index), pos)
+        result = pipe.execute()
+
+        n_layers = int(result[0] or 0)
+        bits, offset = [], 1
+        for layer in layers:
+            if layer.index < n_layers:
+                bits.append(result[offset:offset + layer.hashes])
+            offset += layer.hashes
+        return n_layers, bits
+
+    def open_layer(self, layer: _Layer) -> None:
+        # Chỉ tăng (worker khác có thể đã mở layer mới)
+        if layer.index + 1 > self.layer_count():
+            self._client.set(self._key("layers"), layer.index + 1)
+
+    def add(self, layer: _Layer, positions: Iterable[int], count: int) -> int:
+        pipe = self._client.pipeline(transaction=False)
+        for pos in positions:
+            pipe.setbit(self._key(layer.index), pos, 1)
+        pipe.incrby(self._key(f"{layer.index}:count"), count)
+        return int(pipe.execute()[-1])
+
+    def count(self, layer: _Layer) -> int:
+        return int(self._client.get(self._key(f"{layer.index}:count")) or 0)
+
+    def upload(self, local: _LocalBits) -> None:
+        """Thay filter hiện tại bằng bitmap đã build local; key "layers" ghi sau cùng"""
+        pipe = self._client.pipeline(transaction=True)
+        for index, buf in enumerate(local.buffers):
+            pipe.set(self._key(index), bytes(buf))
+            pipe.set(self._key(f"{index}:count"), local.counts[index])
+        pipe.set(self._key("layers"), len(local.buffers))
+        pipe.execute()
+
+
+class ScalableEmailFilter:
+    """Scalable Bloom filter của các email đã đăng ký"""
+
+    BUILD_CHUNK = 5000
+    READY_CHECK_SECONDS = 5
+
+    def __init__(
+        self,
+        capacity: int = settings.EMAIL_FILTER_CAPACITY,
+        error_rate: float = settings.EMAIL_FILTER_ERROR_RATE,
+        use_redis: bool = is_redis_available,
+    ):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self._layers: List[_Layer] = []
+        self._use_redis = use_redis
+        # Tham số nằm trong key: đổi capacity/error rate thì build filter mới
+        self._prefix = f"emailbf:{capacity}:{error_rate}"
+        self._storage = _RedisBits(redis_client, self._prefix) if use_redis else _LocalBits()
+        self.ready = False
+        self._ready_checked_at = 0.0
+
+        self.checks = 0
+        self.negatives = 0
+        self.false_positives = 0
+
+    def _layer(self, index: int) -> _Layer:
+        while len(self._layers) <= index:
+            self._layers.append(_Layer(len(self._layers), self.capacity, self.error_rate))
+        return self._layers[index]
+
+    def _check_ready(self) -> bool:
+        """Worker không build tự nhận filter khi worker khác build xong"""
+        if self._use_redis and time.monotonic() - self._ready_checked_at >= self.READY_CHECK_SECONDS:
+            self._ready_checked_at = time.monotonic()
+            try:
+                self.ready = self._storage.layer_count() > 0
+            except Exception as e:
+                logger.error(f"Email filter check error: {e}")
+        return self.ready
+
+    def might_contain(self, email: str) -> bool:
+        """
+        False: email chắc chắn chưa đăng ký.
+        True: có thể đã đăng ký (hoặc filter chưa sẵn sàng) -> hỏi DB.
+        """
+        if not self.ready and not self._check_ready():
+            return True
+        self.checks += 1
+        h1, h2 = _hash_pair(email)
+        try:
+            known = max(len(self._layers), 1)
+            n_layers, bits = self._storage.get_bits([self._layer(i) for i in range(known)], h1, h2)
+            if n_layers > known:
+                # Worker khác đã mở layer mới
+                n_layers, bits = self._storage.get_bits([self._layer(i) for i in range(n_layers)], h1, h2)
+        except Exception as e:
+            logger.error(f"Email filter check error: {e}")
+            return True
+
+        if n_layers == 0:
+            # Filter bị xóa khỏi Redis (flush/eviction): không tin negative nữa
+            self.ready = False
+            return True
+        if any(all(layer_bits) for layer_bits in bits):
+            return True
+        self.negatives += 1
+        return False
+
+    def add(self, email: Optional[str]) -> None:
+        """
+        Thêm email (gọi sau khi commit user), không bao giờ raise.
+
+        Với Redis luôn ghi vào filter chung nếu filter đã có, kể cả khi worker
+        này chưa thấy filter sẵn sàng (worker khác build). Filter chưa có thì
+        bỏ qua: _catch_up của worker đang build sẽ thêm email này.
+        """
+        if not email:
+            return
+        try:
+            if self._use_redis:
+                n_layers = self._storage.layer_count()
+                if n_layers == 0:
+                    return
+                self.ready = True
+                self._add_many(self._storage, [email], n_layers)
+            elif self.ready:
+                self._add_many(self._storage, [email])
+        except Exception as e:
+            logger.error(f"Email filter add error: {e}")
+
+    def _add_many(self, storage, emails: List[str], n_layers: Optional[int] = None) -> None:
+        if n_layers is None:
+            n_layers = storage.layer_count()
+        layer = self._layer(max(n_layers, 1) - 1)
+        storage.open_layer(layer)
+        while emails:
+            # Cắt batch ở chỗ còn trống của layer để không vượt capacity (giữ bound
+            # error rate). Layer cuối luôn còn chỗ nên một email không cần đọc count
+            room = layer.capacity - storage.count(layer) if len(emails) > 1 else 1
+            if room <= 0:
+                layer = self._layer(layer.index + 1)
+                storage.open_layer(layer)
+                continue
+            chunk, emails = emails[:room], emails[room:]
+            positions = []
+            for email in chunk:
+                h1, h2 = _hash_pair(email)
+                positions.extend(layer.positions(h1, h2))
+            if storage.add(layer, positions, len(chunk)) >= layer.capacity:
+                # Layer đầy: email tiếp theo vào layer mới (lớn hơn, error rate thấp hơn)
+                layer = self._layer(layer.index + 1)
+                storage.open_layer(layer)
+
+    def record_false_positive(self) -> None:
+        self.false_positives += 1
+
+    def build(self, db: Optional[Session] = None, force: bool = False) -> None:
+        """
+        Build filter từ bảng users (lúc startup).
+        Với Redis, filter đã có sẵn (worker khác / lần chạy trước) thì dùng lại;
+        chỉ một worker build, các worker khác hỏi DB cho đến khi filter sẵn sàng.
+        """
+        from models.user import User
+
+        build_lock_key = f"{self._prefix}:build"
+        if self._use_redis:
+            if not force and self._storage.layer_count() > 0:
+                self.ready = True
+                return
+            if not redis_client.set(build_lock_key, 1, nx=True, ex=300):
+                return
+
+        own_session = db is None
+        if own_session:
+            db = SessionLocal()
+        try:
+            started_at = db.query(func.now()).scalar()
+            local = _LocalBits()
+            local.open_layer(self._layer(0))
+            total, batch = 0, []
+            for (email,) in db.query(User.email).yield_per(self.BUILD_CHUNK):
+                if email:
+                    batch.append(email)
+                if len(batch) >= self.BUILD_CHUNK:
+                    self._add_many(local, batch)
+                    total, batch = total + len(batch), []
+            if batch:
+                self._add_many(local, batch)
+                total += len(batch)
+
+            if self._use_redis:
+                self._storage.upload(local)
+            else:
+                self._storage = local
+            self.ready = True
+            self._catch_up(User, started_at)
+            logger.info(f"Email filter built with {total} emails ({len(local.buffers)} layers)")
+        finally:
+            if own_session:
+                db.close()
+            if self._use_redis:
+                redis_client.delete(build_lock_key)
+
+    def _catch_up(self, User, since) -> None:
+        """Thêm user được tạo trong lúc build (add() bị bỏ qua khi filter chưa có)"""
+        db = SessionLocal()
+        try:
+            emails = [email for (email,) in db.query(User.email).filter(User.created_at >= since) if email]
+        finally:
+            db.close()
+        if emails:
+            self._add_many(self._storage, emails)
+
+    def stats(self) -> dict:
+        return {
+            "ready": self.ready,
+            "layers": len(self._layers),
+            "checks": self.checks,
+            "negatives": self.negatives,
+            "false_positives": self.false_positives,
+        }
+
+
+# Singleton filter instance
+email_filter = ScalableEmailFilter()
@@ -0,0 +1,239 @@
+"""
+Bounded in-process cache với API con của redis-py.
+
+Dùng thay Redis khi Redis không kết nối được lúc khởi động (xem
+cache/redis_client.py). Hỗ trợ các lệnh app dùng: get/mget/set/setex/
+delete/exists/incr/decr/expire/ttl/flushdb, với semantics như redis-py
+(decode_responses=True): giá trị lưu dạng str (bytes giữ nguyên), set với
+ex/px/nx/xx, INCR giữ TTL, key hết hạn coi như không tồn tại.
+
+Giới hạn:
+- TTL thật: key hết hạn bị xóa khi đọc tới, và vài key ở đầu LRU được
+  kiểm tra mỗi lần ghi nên key hết hạn không nằm lại lâu
+- LRU theo số entry và theo byte (ước lượng: key + value + overhead)
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from itertools import islice
+from typing import Any, List, Optional
+
+from redis.exceptions import ResponseError
+
+from core.config import settings
+
+_VALUE = 0
+_EXPIRES = 1  # monotonic, 0 = không hết hạn
+_SIZE = 2
+
+
+def _encode(value: Any):
+    # redis-py gửi mọi giá trị dạng chuỗi; decode_responses trả lại str
+    if isinstance(value, (str, bytes)):
+        return value
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+def _seconds(value) -> float:
+    # ex/px của redis-py nhận int hoặc timedelta
+    return value.total_seconds() if hasattr(value, "total_seconds") else float(value)
+
+
+class MemoryCache:
+    """LRU + TTL cache, thread-safe, giới hạn số entry và số byte"""
+
+    ENTRY_OVERHEAD = 100  # Ước lượng bytes cho entry (list, node OrderedDict, str headers)
+    EXPIRE_SAMPLE = 4  # Key ở đầu LRU kiểm tra hết hạn mỗi lần ghi
+
+    def __init__(
+        self,
+        max_entries: int = settings.MEMORY_CACHE_MAX_ENTRIES,
+        max_bytes: int = settings.MEMORY_CACHE_MAX_BYTES,
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._data: "OrderedDict[str, list]" = OrderedDict()  # key -> [value, expires_at, size]
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expired = 0
+
+    # INTERNALS (gọi khi đang giữ lock)
+
+    def _live(self, key: str, now: float) -> Optional[list]:
+        entry = self._data.get(key)
+        if entry is not None and entry[_EXPIRES] and entry[_EXPIRES] <= now:
+            self._remove(key)
+            self.expired += 1
+            return None
+        return entry
+
+    def _remove(self, key: str) -> None:
+        entry = self._data.pop(key)
+        self._bytes -= entry[_SIZE]
+
+    def _store(self, key: str, value, expires_at: float, now: float) -> None:
+        if key in self._data:
+            self._remove(key)
+        size = len(key) + len(value) + self.ENTRY_OVERHEAD
+        self._data[key] = [value, expires_at, size]
+        self._bytes += size
+        self._trim(now)
+
+    def _trim(self, now: float) -> None:
+        data = self._data
+        for key in list(islice(data, self.EXPIRE_SAMPLE)):
+            expires_at = data[key][_EXPIRES]
+            if expires_at and expires_at <= now:
+                self._remove(key)
+                self.expired += 1
+        while data and (len(data) > self.max_entries or self._bytes > self.max_bytes):
+            key = next(iter(data))
+            self._remove(key)
+            self.evictions += 1
+
+    # STRINGS
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._live(key, time.monotonic())
+            if entry is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[_VALUE]
+
+    def mget(self, keys, *args) -> List[Optional[Any]]:
+        if isinstance(keys, str):
+            keys = [keys, *args]
+        return [self.get(key) for key in keys]
+
+    def set(self, key: str, value, ex=None, px=None, nx: bool = False, xx: bool = False,
+            keepttl: bool = False) -> Optional[bool]:
+        """Như redis SET: trả None khi điều kiện nx/xx không thỏa"""
+        now = time.monotonic()
+        with self._lock:
+            current = self._live(key, now)
+            if (nx and current is not None) or (xx and current is None):
+                return None
+            if ex is not None:
+                expires_at = now + _seconds(ex)
+            elif px is not None:
+                expires_at = now + _seconds(px) / 1000
+            elif keepttl and current is not None:
+                expires_at = current[_EXPIRES]
+            else:
+                expires_at = 0.0
+            self._store(key, _encode(value), expires_at, now)
+            return True
+
+    def setex(self, key: str, time, value) -> bool:
+        return self.set(key, value, ex=time)
+
+    def psetex(self, key: str, time_ms, value) -> bool:
+        return self.set(key, value, px=time_ms)
+
+    def incrby(self, key: str, amount: int = 1) -> int:
+        now = time.monotonic()
+        with self._lock:
+            current = self._live(key, now)
+            try:
+                value = int(current[_VALUE]) + amount if current is not None else amount
+            except ValueError:
+                raise ResponseError("value is not an integer or out of range")
+            # INCR giữ TTL hiện có
+            self._store(key, str(value), current[_EXPIRES] if current is not None else 0.0, now)
+            return value
+
+    def incr(self, key: str, amount: int = 1) -> int:
+        return self.incrby(key, amount)
+
+    def decr(self, key: str, amount: int = 1) -> int:
+        return self.incrby(key, -amount)
+
+    # KEYS
+
+    def delete(self, *keys) -> int:
+        now = time.monotonic()
+        deleted = 0
+        with self._lock:
+            for key in keys:
+                if self._live(key, now) is not None:
+                    self._remove(key)
+                    deleted += 1
+        return deleted
+
+    def exists(self, *keys) -> int:
+        now = time.monotonic()
+        with self._lock:
+            return sum(1 for key in keys if self._live(key, now) is not None)
+
+    def pexpire(self, key: str, time_ms) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._live(key, now)
+            if entry is None:
+                return False
+            entry[_EXPIRES] = now + _seconds(time_ms) / 1000
+            return True
+
+    def expire(self, key: str, time) -> bool:
+        return self.pexpire(key, _seconds(time) * 1000)
+
+    def persist(self, key: str) -> bool:
+        with self._lock:
+            entry = self._live(key, time.monotonic())
+            if entry is None or not entry[_EXPIRES]:
+                return False
+            entry[_EXPIRES] = 0.0
+            return True
+
+    def pttl(self, key: str) -> int:
+        """-2: không tồn tại, -1: không có TTL"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._live(key, now)
+            if entry is None:
+                return -2
+            if not entry[_EXPIRES]:
+                return -1
+            return max(0, int((entry[_EXPIRES] - now) * 1000))
+
+    def ttl(self, key: str) -> int:
+        pttl = self.pttl(key)
+        return pttl if pttl < 0 else (pttl + 999) // 1000
+
+    # SERVER
+
+    def ping(self) -> bool:
+        return True
+
+    def flushdb(self, *args, **kwargs) -> bool:
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+        return True
+
+    def dbsize(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._data),
+            "bytes": self._bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expired": self.expired,
+        }
@@ -0,0 +1,409 @@
+"""
+Two-tier principal cache.
+
+Level 1: in-process LRU với TTL ngắn (mỗi worker)
+Level 2: Redis (dùng chung giữa các worker)
+
+Giữ thông tin tối thiểu để xác thực/phân quyền một request (Principal) nên
+request đã đăng nhập không cần query MySQL ở trạng thái ổn định.
+Invalidate khi user được cập nhật (crud.user); generation counter theo
+user ngăn load đồng thời ghi lại snapshot trước khi cập nhật.
+"""
+
+import logging
+import threading
+from starlette.concurrency import run_in_threadpool
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from cache.codec import encode
+from cache.redis_client import (
+    get_cache, get_many_cache, set_cache, delete_cache, aget_many_cache,
+    cache_client, async_redis_client, is_redis_available,
+)
+from cache.role_registry import role_registry
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+PRINCIPAL_PREFIX = "principal:"
+GENERATION_PREFIX = "principal:gen:"
+
+# KEYS: entry, gen, entry, gen... | ARGV: ttl, gen, value, gen, value...
+# Chỉ ghi entry khi generation hiện tại bằng generation đọc trước khi load
+_PUT_SCRIPT = """
+local stored = {}
+for i = 1, #KEYS, 2 do
+    local expected = ARGV[i + 1]
+    if (redis.call('GET', KEYS[i + 1]) or '0') == expected then
+        redis.call('SET', KEYS[i], ARGV[i + 2], 'EX', ARGV[1])
+        stored[#stored + 1] = 1
+    else
+        stored[#stored + 1] = 0
+    end
+end
+return stored
+"""
+
+# KEYS: entry, gen | ARGV: gen ttl
+_INVALIDATE_SCRIPT = """
+redis.call('INCR', KEYS[2])
+redis.call('EXPIRE', KEYS[2], ARGV[1])
+return redis.call('DEL', KEYS[1])
+"""
+
+# Compare-and-set khi không có Redis (MemoryCache)
+_memory_lock = threading.Lock()
+
+
+class Principal:
+    """
+    Authenticated user snapshot (không gắn với DB session).
+
+    Có cùng API kiểm tra role với models.User (role_name, is_admin, has_role...).
+    version: thời điểm snapshot được load từ DB (ms), hoặc token version
+    nếu principal được dựng từ claims token.
+    """
+
+    __slots__ = ("id", "email", "name", "user_code", "role_id", "role_name", "version")
+
+    def __init__(
+        self,
+        id: int,
+        email: str,
+        name: str,
+        user_code: str,
+        role_id: Optional[int],
+        role_name: Optional[str],
+        version: int,
+    ):
+        self.id = id
+        self.email = email
+        self.name = name
+        self.user_code = user_code
+        self.role_id = role_id
+        self.role_name = role_name
+        self.version = version
+
+    @classmethod
+    def from_user(cls, user) -> "Principal":
+        return cls(
+            id=user.id,
+            email=user.email,
+            name=user.name,
+            user_code=user.user_code,
+            role_id=user.role_id,
+            role_name=role_registry.role_name(user.role_id),
+            version=int(time.time() * 1000),
+        )
+
+    @classmethod
+    def from_claims(cls, payload: dict) -> "Principal":
+        """
+        Principal dựng từ claims token (chỉ đủ để phân quyền).
+        name/user_code là None; dùng services.auth_service.get_principal khi cần profile.
+        """
+        return cls(
+            id=int(payload["sub"]),
+            email=payload.get("email"),
+            name=None,
+            user_code=None,
+            role_id=payload.get("rid"),
+            role_name=payload["role"],
+            version=payload["ver"],
+        )
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Principal":
+        return cls(**{field: data.get(field) for field in cls.__slots__})
+
+    def to_dict(self) -> dict:
+        return {field: getattr(self, field) for field in self.__slots__}
+
+    @property
+    def is_admin(self) -> bool:
+        return self.role_name == "admin"
+
+    @property
+    def is_teacher(self) -> bool:
+        return self.role_name == "teacher"
+
+    @property
+    def is_student(self) -> bool:
+        return self.role_name == "student"
+
+    def has_role(self, role_name: str) -> bool:
+        return self.role_name == role_name
+
+    def has_any_role(self, role_names: list) -> bool:
+        return self.role_name in role_names
+
+    def __repr__(self):
+        return f"<Principal(id={self.id}, role='{self.role_name}')>"
+
+
+class PrincipalCache:
+    """
+    L1 in-process LRU + L2 Redis, keyed by user id.
+
+    Chống ghi lại snapshot cũ: mỗi user có generation counter (principal:gen:{id})
+    được tăng khi invalidate. Lookup đọc generation cùng entry (một MGET); sau
+    khi load từ DB, entry chỉ được ghi nếu generation chưa đổi (compare-and-set).
+    """
+
+    def __init__(
+        self,
+        ttl: int = settings.PRINCIPAL_CACHE_TTL,
+        local_ttl: int = settings.PRINCIPAL_CACHE_LOCAL_TTL,
+        max_entries: int = settings.PRINCIPAL_CACHE_MAX_ENTRIES,
+        use_redis: bool = is_redis_available,
+    ):
+        self.ttl = ttl
+        self.local_ttl = local_ttl
+        self.max_entries = max_entries
+        self._local: "OrderedDict[int, tuple]" = OrderedDict()  # user_id -> (expires_at, principal)
+        self._lock = threading.Lock()
+        # Số lần invalidate trong worker này: L1 chỉ nhận snapshot load trước đó nếu chưa đổi
+        self._epoch = 0
+        self._use_redis = use_redis
+        if use_redis:
+            self._put_script = cache_client.register_script(_PUT_SCRIPT)
+            self._aput_script = async_redis_client.register_script(_PUT_SCRIPT)
+            self._invalidate_script = cache_client.register_script(_INVALIDATE_SCRIPT)
+
+        self.local_hits = 0
+        self.remote_hits = 0
+        self.misses = 0
+        self.stale_skips = 0
+
+    def _get_local(self, user_id: int) -> Optional[Principal]:
+        now = time.monotonic()
+        with self._lock:
+            item = self._local.get(user_id)
+            if item is not None:
+                if item[0] > now:
+                    self._local.move_to_end(user_id)
+                    self.local_hits += 1
+                    return item[1]
+                del self._local[user_id]
+        return None
+
+    def _accept_remote(self, data) -> Optional[Principal]:
+        if not isinstance(data, dict):
+            self.misses += 1
+            return None
+        principal = Principal.from_dict(data)
+        self._store_local(principal)
+        self.remote_hits += 1
+        return principal
+
+    @staticmethod
+    def _keys(user_id: int) -> List[str]:
+        return [PRINCIPAL_PREFIX + str(user_id), GENERATION_PREFIX + str(user_id)]
+
+    def lookup(self, user_id: int) -> Tuple[Optional[Principal], int]:
+        """(principal hoặc None, generation để truyền cho put khi load từ DB)"""
+        principal = self._get_local(user_id)
+        if principal is not None:
+            return principal, 0
+        data, generation = get_many_cache(self._keys(user_id))
+        return self._accept_remote(data), generation or 0
+
+    async def alookup(self, user_id: int) -> Tuple[Optional[Principal], int]:
+        """Async lookup (middleware)"""
+        principal = self._get_local(user_id)
+        if principal is not None:
+            return principal, 0
+        data, generation = await aget_many_cache(self._keys(user_id))
+        return self._accept_remote(data), generation or 0
+
+    def get(self, user_id: int) -> Optional[Principal]:
+        return self.lookup(user_id)[0]
+
+    async def aget(self, user_id: int) -> Optional[Principal]:
+        """Async get (middleware)"""
+        return (await self.alookup(user_id))[0]
+
+    def lookup_many(self, user_ids: Iterable[int]) -> Tuple[Dict[int, Principal], Dict[int, int]]:
+        """
+        Principal của nhiều user: L1 trước, phần còn lại một MGET trên L2.
+        Returns (principal đã cache, generation của các user chưa có trong cache).
+        """
+        found: Dict[int, Principal] = {}
+        remaining = []
+        now = time.monotonic()
+        with self._lock:
+            for user_id in user_ids:
+                item = self._local.get(user_id)
+                if item is not None and item[0] > now:
+                    self._local.move_to_end(user_id)
+                    found[user_id] = item[1]
+                else:
+                    remaining.append(user_id)
+            self.local_hits += len(found)
+
+        generations: Dict[int, int] = {}
+        if remaining:
+            keys = []
+            for user_id in remaining:
+                keys.extend(self._keys(user_id))
+            values = get_many_cache(keys)
+            for i, user_id in enumerate(remaining):
+                data, generation = values[2 * i], values[2 * i + 1]
+                if isinstance(data, dict):
+                    principal = Principal.from_dict(data)
+                    self._store_local(principal)
+                    found[principal.id] = principal
+                    self.remote_hits += 1
+                else:
+                    generations[user_id] = generation or 0
+                    self.misses += 1
+        return found, generations
+
+    def get_many(self, user_ids: Iterable[int]) -> Dict[int, Principal]:
+        """User không có trong cache không có trong kết quả"""
+        return self.lookup_many(user_ids)[0]
+
+    def put(self, principal: Principal, generation: int, epoch: Optional[int] = None) -> Principal:
+        """
+        Lưu principal load từ DB nếu user chưa bị invalidate kể từ lookup
+        (generation) / kể từ khi bắt đầu load trong worker này (epoch).
+        """
+        self.put_many([principal], {principal.id: generation}, epoch)
+        return principal
+
+    def put_many(self, principals: List[Principal], generations: Dict[int, int], epoch: Optional[int] = None) -> None:
+        if not principals:
+            return
+        if self._use_redis:
+            keys, args = [], [self.ttl]
+            for principal in principals:
+                keys.extend(self._keys(principal.id))
+                args.extend((generations.get(principal.id, 0), encode(principal.to_dict())))
+            try:
+                stored = self._put_script(keys=keys, args=args)
+            except Exception as e:
+                logger.error(f"Principal cache put error: {e}")
+                return
+        else:
+            stored = self._put_memory(principals, generations)
+        self._store_local_if_current(principals, stored, epoch)
+
+    async def aput(self, principal: Principal, generation: int, epoch: Optional[int] = None) -> Principal:
+        """Async put (middleware)"""
+        if self._use_redis:
+            try:
+                stored = await self._aput_script(
+                    keys=self._keys(principal.id),
+                    args=[self.ttl, generation, encode(principal.to_dict())],
+                )
+            except Exception as e:
+                logger.error(f"Principal cache put error: {e}")
+                return principal
+        else:
+            stored = self._put_memory([principal], {principal.id: generation})
+        self._store_local_if_current([principal], stored, epoch)
+        return principal
+
+    def _put_memory(self, principals: List[Principal], generations: Dict[int, int]) -> List[int]:
+        # MemoryCache: compare-and-set dưới lock của worker (không có worker khác)
+        stored = []
+        with _memory_lock:
+            for principal in principals:
+                entry_key, generation_key = self._keys(principal.id)
+                if (get_cache(generation_key) or 0) == generations.get(principal.id, 0):
+                    set_cache(entry_key, principal.to_dict(), ttl=self.ttl)
+                    stored.append(1)
+                else:
+                    stored.append(0)
+        return stored
+
+    def _store_local_if_current(self, principals: List[Principal], stored: List[int], epoch: Optional[int]) -> None:
+        for principal, ok in zip(principals, stored):
+            if not int(ok):
+                self.stale_skips += 1
+                continue
+            with self._lock:
+                if epoch is not None and epoch != self._epoch:
+                    self.stale_skips += 1
+                    continue
+            self._store_local(principal)
+
+    @property
+    def epoch(self) -> int:
+        return self._epoch
+
+    def get_or_load(self, user_id: int, loader: Callable[[], object]) -> Optional[Principal]:
+        """
+        Lấy principal từ cache, nếu miss thì gọi loader() (trả về User hoặc None)
+        và lưu kết quả nếu user không bị invalidate trong lúc load.
+        """
+        epoch = self._epoch
+        principal, generation = self.lookup(user_id)
+        if principal is not None:
+            return principal
+        user = loader()
+        if user is None:
+            return None
+        role_registry.ensure(user.role_id)
+        return self.put(Principal.from_user(user), generation, epoch)
+
+    async def aget_or_load(self, user_id: int, loader: Callable[[], object]) -> Optional[Principal]:
+        """Async get_or_load: loader (sync, DB) chạy trong threadpool"""
+        epoch = self._epoch
+        principal, generation = await self.alookup(user_id)
+        if principal is not None:
+            return principal
+        user = await run_in_threadpool(loader)
+        if user is None:
+            return None
+        await role_registry.aensure(user.role_id)
+        return await self.aput(Principal.from_user(user), generation, epoch)
+
+    def invalidate(self, user_id: int) -> None:
+        """
+        Tăng generation và xóa principal khỏi L1 (worker này) và L2 (gọi sau khi commit).
+        Load đang chạy với generation cũ sẽ không ghi lại snapshot trước commit.
+        """
+        with self._lock:
+            self._epoch += 1
+            self._local.pop(user_id, None)
+        entry_key, generation_key = self._keys(user_id)
+        if self._use_redis:
+            self._invalidate_script(keys=[entry_key, generation_key], args=[self.ttl * 2])
+            return
+        with _memory_lock:
+            cache_client.incr(generation_key)
+            cache_client.expire(generation_key, self.ttl * 2)
+            delete_cache(entry_key)
+
+    def _store_local(self, principal: Principal) -> None:
+        with self._lock:
+            self._local[principal.id] = (time.monotonic() + self.local_ttl, principal)
+            self._local.move_to_end(principal.id)
+            while len(self._local) > self.max_entries:
+                self._local.popitem(last=False)
+
+    def stats(self) -> dict:
+        lookups = self.local_hits + self.remote_hits + self.misses
+        return {
+            "local_entries": len(self._local),
+            "local_hits": self.local_hits,
+            "remote_hits": self.remote_hits,
+            "misses": self.misses,
+            "stale_skips": self.stale_skips,
+            "hit_ratio": round((self.local_hits + self.remote_hits) / lookups, 4) if lookups else 0.0,
+        }
+
+
+# Singleton cache instance
+principal_cache = PrincipalCache()
+
+
+def invalidate_principal(user_id: int) -> None:
+    """Shortcut cho principal_cache.invalidate, không bao giờ raise"""
+    try:
+        principal_cache.invalidate(user_id)
+    except Exception as e:
+        logger.error(f"Principal cache invalidation error: {e}")
@@ -1,8 +1,26 @@
+"""
+Redis cache helpers.
+
+- Sync API (set_cache, get_cache...): redis.Redis, cho code chạy trong threadpool
+- Async API (aset_cache, aget_cache...): redis.asyncio trên connection pool
+  riêng, cho middleware và route async (không block event loop)
+
+Khi Redis không kết nối được lúc khởi động, cả hai API dùng MemoryCache
+in-process (không có I/O nên gọi từ event loop không block).
+
+Giá trị cache được encode bằng cache.codec (binary, có type tag) nên các
+helper dùng client không decode response (cache_client, async_redis_client);
+redis_client (decode_responses=True) dành cho key native (scripts, locks...).
+"""
+
 import redis
-import json
+import redis.asyncio as aioredis
 import logging
-from typing import Any, Optional
+from typing import Any, Dict, List, Optional
+from cache.codec import UnknownCodecVersion, decode, encode
+from cache.memory_cache import MemoryCache
 from core.config import settings
+from core.server_timing import timed
 
 logger = logging.getLogger(__name__)
 
@@ -22,59 +40,68 @@ try:
         decode_responses=True
     )
     redis_client.ping()
+    is_redis_available = True
     logger.info(f"Redis connected: {REDIS_HOST}:{REDIS_PORT}")
 except redis.ConnectionError as e:
     logger.warning(f"Redis unavailable, using in-memory fallback: {e}")
-    
-    class DummyRedis:
-        """Fallback in-memory cache when Redis is not available"""
-        def __init__(self):
-            self._cache = {}
-        
-        def set(self, key, value, *args, **kwargs):
-            self._cache[key] = value
-            return True
+    # Dùng để chọn in-process fallback cho các tính năng cần lệnh Redis đầy đủ (scripts...)
+    is_redis_available = False
+    redis_client = MemoryCache()
 
-        def setex(self, key, ttl, value):
-            self._cache[key] = value
-            return True
+# Binary client cho giá trị cache (MemoryCache giữ nguyên bytes)
+cache_client = redis.Redis(
+    host=REDIS_HOST,
+    port=REDIS_PORT,
+    db=REDIS_DB,
+    password=REDIS_PASSWORD,
+) if is_redis_available else redis_client
 
-        def get(self, key, *args, **kwargs):
-            return self._cache.get(key)
-
-        def delete(self, key, *args, **kwargs):
-            if key in self._cache:
-                del self._cache[key]
-                return 1
-            return 0
-            
-        def flushdb(self, *args, **kwargs):
-            self._cache.clear()
-            return True
+# Async client (binary): connection được tạo lazily trên event loop đang chạy
+async_redis_client = aioredis.Redis(
+    connection_pool=aioredis.ConnectionPool(
+        host=REDIS_HOST,
+        port=REDIS_PORT,
+        db=REDIS_DB,
+        password=REDIS_PASSWORD,
+        max_connections=settings.REDIS_ASYNC_MAX_CONNECTIONS,
+    )
+) if is_redis_available else None
 
-    redis_client = DummyRedis()
+
+def _decode(value: Optional[bytes]) -> Optional[Any]:
+    """Giá trị không decode được coi như miss"""
+    try:
+        return decode(value)
+    except UnknownCodecVersion:
+        # Worker mới hơn đã ghi (rolling upgrade)
+        return None
+    except Exception as e:
+        logger.warning(f"Cache decode error: {e}")
+        return None
 
 
-def set_cache(key: str, value: Any, ttl: int = DEFAULT_TTL) -> bool:
+@timed("redis")
+def set_cache(key: str, value: Any, ttl: int = DEFAULT_TTL, nx: bool = False) -> bool:
     """
     Lưu giá trị vào Redis cache
     
     Args:
         key: Khóa để lưu trữ giá trị
-        value: Giá trị cần lưu (sẽ tự động chuyển thành JSON)
+        value: Giá trị cần lưu (encode bằng cache.codec)
         ttl: Thời gian sống của key (giây), mặc định là 1 giờ
+        nx: Chỉ lưu nếu key chưa tồn tại
         
     Returns:
-        bool: True nếu lưu thành công, False nếu có lỗi
+        bool: True nếu lưu thành công, False nếu có lỗi (hoặc key đã có với nx)
     """
     try:
-        serialized_value = json.dumps(value) if not isinstance(value, (str, int, float, bool)) else value
-        return redis_client.set(key, serialized_value, ex=ttl)
+        return bool(cache_client.set(key, encode(value), ex=ttl, nx=nx))
     except Exception as e:
         logger.error(f"Cache set error: {e}")
         return False
 
 
+@timed("redis")
 def get_cache(key: str) -> Optional[Any]:
     """
     Lấy giá trị từ Redis cache
@@ -86,19 +113,63 @@ def get_cache(key: str) -> Optional[Any]:
         Any: Giá trị của key hoặc None nếu không tìm thấy
     """
     try:
-        value = redis_client.get(key)
-        if value is None:
-            return None
-        
-        try:
-            return json.loads(value)
-        except json.JSONDecodeError:
-            return value
+        return _decode(cache_client.get(key))
     except Exception as e:
         logger.error(f"Cache get error: {e}")
         return None
 
 
+@timed("redis")
+def get_many_cache(keys: List[str]) -> List[Optional[Any]]:
+    """
+    Lấy nhiều giá trị trong một round trip (MGET)
+    
+    Args:
+        keys: Danh sách khóa
+        
+    Returns:
+        List: Giá trị theo thứ tự của keys (None nếu không tìm thấy hoặc có lỗi)
+    """
+    if not keys:
+        return []
+    try:
+        values = cache_client.mget(keys)
+    except Exception as e:
+        logger.error(f"Cache mget error: {e}")
+        return [None] * len(keys)
+    return [_decode(value) for value in values]
+
+
+@timed("redis")
+def set_many_cache(mapping: Dict[str, Any], ttl: int = DEFAULT_TTL) -> bool:
+    """
+    Lưu nhiều giá trị trong một round trip (pipeline)
+    
+    Args:
+        mapping: key -> giá trị (encode bằng cache.codec)
+        ttl: Thời gian sống của các key (giây)
+        
+    Returns:
+        bool: True nếu lưu thành công, False nếu có lỗi
+    """
+    if not mapping:
+        return True
+    try:
+        if not is_redis_available:
+            for key, value in mapping.items():
+                cache_client.set(key, encode(value), ex=ttl)
+            return True
+        pipe = cache_client.pipeline(transaction=False)
+        for key, value in mapping.items():
+            pipe.set(key, encode(value), ex=ttl)
+        pipe.execute()
+        return True
+    except Exception as e:
+        logger.error(f"Cache mset error: {e}")
+        return False
+
+
+@timed("redis")
 def delete_cache(key: str) -> bool:
     """
     Xóa giá trị khỏi Redis cache
@@ -110,12 +181,19 @@ def delete_cache(key: str) -> bool:
         bool: True nếu xóa thành công, False nếu có lỗi
     """
     try:
-        return bool(redis_client.delete(key))
+        return bool(cache_client.delete(key))
     except Exception as e:
         logger.error(f"Cache delete error: {e}")
         return False
 
 
+def cache_stats() -> dict:
+    """Backend của các cache helper (metrics)"""
+    if is_redis_available:
+        return {"backend": "redis"}
+    return {"backend": "memory", **redis_client.stats()}
+
+
 def flush_cache() -> bool:
     """
     Xóa toàn bộ cache (chỉ sử dụng trong môi trường phát triển)
@@ -128,3 +206,63 @@ def flush_cache() -> bool:
     except Exception as e:
         logger.error(f"Cache flush error: {e}")
         return False
+
+
+# ASYNC API (middleware / async routes)
+
+@timed("redis")
+async def aset_cache(key: str, value: Any, ttl: int = DEFAULT_TTL, nx: bool = False) -> bool:
+    """Async set_cache"""
+    try:
+        if async_redis_client is None:
+            return bool(cache_client.set(key, encode(value), ex=ttl, nx=nx))
+        return bool(await async_redis_client.set(key, encode(value), ex=ttl, nx=nx))
+    except Exception as e:
+        logger.error(f"Cache set error: {e}")
+        return False
+
+
+@timed("redis")
+async def aget_cache(key: str) -> Optional[Any]:
+    """Async get_cache"""
+    try:
+        if async_redis_client is None:
+            return _decode(cache_client.get(key))
+        return _decode(await async_redis_client.get(key))
+    except Exception as e:
+        logger.error(f"Cache get error: {e}")
+        return None
+
+
+@timed("redis")
+async def aget_many_cache(keys: List[str]) -> List[Optional[Any]]:
+    """Async get_many_cache (MGET)"""
+    if not keys:
+        return []
+    try:
+        if async_redis_client is None:
+            values = cache_client.mget(keys)
+        else:
+            values = await async_redis_client.mget(keys)
+    except Exception as e:
+        logger.error(f"Cache mget error: {e}")
+        return [None] * len(keys)
+    return [_decode(value) for value in values]
+
+
+@timed("redis")
+async def adelete_cache(key: str) -> bool:
+    """Async delete_cache"""
+    try:
+        if async_redis_client is None:
+            return bool(cache_client.delete(key))
+        return bool(await async_redis_client.delete(key))
+    except Exception as e:
+        logger.error(f"Cache delete error: {e}")
+        return False
+
+
+async def close_async_cache() -> None:
+    """Đóng async connection pool (lifespan shutdown)"""
+    if async_redis_client is not None:
+        await async_redis_client.aclose()
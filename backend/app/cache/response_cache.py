@@ -0,0 +1,180 @@
+"""
+Two-level HTTP response cache.
+
+Level 1: in-process LRU với TTL ngắn (mỗi worker)
+Level 2: Redis (dùng chung giữa các worker)
+
+Invalidation theo tag: mỗi tag có một version lưu trong Redis. Entry ghi lại
+version của các tag tại thời điểm tạo; khi tag bị invalidate, version đổi và
+mọi entry cũ của tag đó trở thành miss. Level 1 của worker hiện tại bị xóa
+ngay, các worker khác tự hết hạn sau RESPONSE_CACHE_LOCAL_TTL giây.
+
+Middleware dùng aget/atag_versions/aput (async Redis); invalidation chạy
+trong threadpool (crud) nên dùng API sync.
+"""
+
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional
+
+from cache.redis_client import get_cache, set_cache, aget_cache, aget_many_cache, aset_cache
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+ENTRY_PREFIX = "rc:entry:"
+TAG_PREFIX = "rc:tag:"
+
+
+def make_etag(body: bytes) -> str:
+    """Strong ETag từ nội dung response"""
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+class ResponseCache:
+    """
+    Response cache với L1 in-process + L2 Redis.
+
+    Entry là dict JSON-serializable:
+        {"etag": str, "body": str, "media_type": str, "tags": {tag: version}}
+    """
+
+    def __init__(
+        self,
+        ttl: int = settings.RESPONSE_CACHE_TTL,
+        local_ttl: int = settings.RESPONSE_CACHE_LOCAL_TTL,
+        max_entries: int = settings.RESPONSE_CACHE_MAX_ENTRIES,
+    ):
+        self.ttl = ttl
+        self.local_ttl = local_ttl
+        self.max_entries = max_entries
+        self._local: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (expires_at, entry)
+        self._tag_keys: Dict[str, set] = {}  # tag -> local keys
+        # Invalidation runs from threadpool (crud), lookups from the event loop
+        self._lock = threading.Lock()
+
+        self.local_hits = 0
+        self.remote_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def build_key(method: str, path: str, query: str, principal: Optional[str]) -> str:
+        raw = f"{method}|{path}|{query}|{principal or '-'}"
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    def _get_local(self, key: str) -> Optional[dict]:
+        now = time.monotonic()
+        with self._lock:
+            item = self._local.get(key)
+            if item is not None:
+                if item[0] > now:
+                    self._local.move_to_end(key)
+                    self.local_hits += 1
+                    return item[1]
+                self._drop_local(key)
+        return None
+
+    def _accept_remote(self, key: str, entry, current_tags: Optional[Dict[str, int]]) -> Optional[dict]:
+        if not isinstance(entry, dict) or entry.get("tags") != current_tags:
+            self.misses += 1
+            return None
+        self._store_local(key, entry)
+        self.remote_hits += 1
+        return entry
+
+    def get(self, key: str) -> Optional[dict]:
+        """Tìm entry ở L1, rồi L2. Trả về None nếu miss hoặc entry đã cũ."""
+        entry = self._get_local(key)
+        if entry is not None:
+            return entry
+        entry = get_cache(ENTRY_PREFIX + key)
+        current = self.tag_versions(entry.get("tags", {})) if isinstance(entry, dict) else None
+        return self._accept_remote(key, entry, current)
+
+    async def aget(self, key: str) -> Optional[dict]:
+        """Async get (middleware)"""
+        entry = self._get_local(key)
+        if entry is not None:
+            return entry
+        entry = await aget_cache(ENTRY_PREFIX + key)
+        current = await self.atag_versions(entry.get("tags", {})) if isinstance(entry, dict) else None
+        return self._accept_remote(key, entry, current)
+
+    def tag_versions(self, tags: Iterable[str]) -> Dict[str, int]:
+        """
+        Version hiện tại của các tag.
+        Gọi TRƯỚC khi tạo response để không lưu dữ liệu cũ với version mới.
+        """
+        return {tag: get_cache(TAG_PREFIX + tag) or 0 for tag in tags}
+
+    async def atag_versions(self, tags: Iterable[str]) -> Dict[str, int]:
+        """Async tag_versions (một MGET cho mọi tag)"""
+        tags = list(tags)
+        values = await aget_many_cache([TAG_PREFIX + tag for tag in tags])
+        return {tag: value or 0 for tag, value in zip(tags, values)}
+
+    def put(self, key: str, entry: dict, tag_versions: Dict[str, int]) -> None:
+        entry = dict(entry, tags=tag_versions)
+        set_cache(ENTRY_PREFIX + key, entry, ttl=self.ttl)
+        self._store_local(key, entry)
+
+    async def aput(self, key: str, entry: dict, tag_versions: Dict[str, int]) -> None:
+        entry = dict(entry, tags=tag_versions)
+        await aset_cache(ENTRY_PREFIX + key, entry, ttl=self.ttl)
+        self._store_local(key, entry)
+
+    def invalidate_tags(self, tags: Iterable[str]) -> None:
+        """Invalidate mọi entry gắn với các tag (gọi sau khi commit)"""
+        version = time.time_ns()
+        for tag in tags:
+            # Tag version phải sống lâu hơn entry
+            set_cache(TAG_PREFIX + tag, version, ttl=self.ttl * 2)
+            with self._lock:
+                for key in self._tag_keys.pop(tag, ()):
+                    self._local.pop(key, None)
+
+    def _store_local(self, key: str, entry: dict) -> None:
+        with self._lock:
+            self._drop_local(key)
+            self._local[key] = (time.monotonic() + self.local_ttl, entry)
+            for tag in entry.get("tags", {}):
+                self._tag_keys.setdefault(tag, set()).add(key)
+            while len(self._local) > self.max_entries:
+                oldest = next(iter(self._local))
+                self._drop_local(oldest)
+
+    def _drop_local(self, key: str) -> None:
+        item = self._local.pop(key, None)
+        if item is None:
+            return
+        for tag in item[1].get("tags", {}):
+            keys = self._tag_keys.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tag_keys[tag]
+
+    def stats(self) -> dict:
+        lookups = self.local_hits + self.remote_hits + self.misses
+        return {
+            "local_entries": len(self._local),
+            "local_hits": self.local_hits,
+            "remote_hits": self.remote_hits,
+            "misses": self.misses,
+            "hit_ratio": round((self.local_hits + self.remote_hits) / lookups, 4) if lookups else 0.0,
+        }
+
+
+# Singleton cache instance
+response_cache = ResponseCache()
+
+
+def invalidate_tags(tags: Iterable[str]) -> None:
+    """Shortcut cho response_cache.invalidate_tags, không bao giờ raise"""
+    try:
+        response_cache.invalidate_tags(tags)
+    except Exception as e:
+        logger.error(f"Response cache invalidation error: {e}")
@@ -0,0 +1,208 @@
+"""
+In-memory role registry.
+
+Bảng roles chỉ có vài dòng nên mỗi worker giữ toàn bộ trong memory:
+role_id -> RoleEntry (kèm permission bitmask đã compile). Kiểm tra quyền,
+role name của principal, /auth/roles... không còn query DB hay lazy-load
+relationship. Đọc registry chỉ là tra dict, không bao giờ chạm Redis/DB
+(trừ lần load lazy đầu tiên khi startup chưa load).
+
+- Load lúc startup (main.py), hoặc lazily ở lần dùng đầu tiên
+- Worker thực hiện create_role/update_role reload ngay sau commit
+- Worker khác: background task (run) so version tag "roles" (response cache)
+  mỗi ROLE_REGISTRY_REFRESH_SECONDS giây và reload trong threadpool nếu đổi
+- role_id chưa thấy bao giờ (role vừa tạo ở worker khác): ensure()/aensure()
+  buộc reload một lần (trong threadpool); vẫn không có thì coi là role không
+  tồn tại, không phải role mặc định
+"""
+
+import asyncio
+import logging
+import threading
+from typing import Dict, Iterable, List, Optional, Set
+
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from cache.response_cache import response_cache
+from core.config import settings
+from core.permissions import Permission, ROLE_PERMISSIONS, DEFAULT_ROLE_NAME
+from database.session import SessionLocal
+from models.role import Role
+
+logger = logging.getLogger(__name__)
+
+
+class RoleEntry:
+    """Snapshot của một role (không gắn với DB session)"""
+
+    __slots__ = ("id", "name", "display_name", "description", "is_active", "created_at", "permissions")
+
+    def __init__(self, role):
+        self.id = role.id
+        self.name = role.name
+        self.display_name = role.display_name
+        self.description = role.description
+        self.is_active = role.is_active
+        self.created_at = role.created_at
+        self.permissions = ROLE_PERMISSIONS.get(role.name, Permission.NONE)
+
+    def to_simple(self) -> dict:
+        return {"id": self.id, "name": self.name, "display_name": self.display_name}
+
+    def __repr__(self):
+        return f"<RoleEntry(id={self.id}, name='{self.name}', permissions={int(self.permissions)})>"
+
+
+class RoleRegistry:
+    """role_id -> RoleEntry, thay thế mọi lần đọc bảng roles trên hot path"""
+
+    def __init__(self, refresh_seconds: int = settings.ROLE_REGISTRY_REFRESH_SECONDS):
+        self.refresh_seconds = refresh_seconds
+        self._by_id: Dict[int, RoleEntry] = {}
+        self._by_name: Dict[str, RoleEntry] = {}
+        self._masks: Dict[tuple, int] = {}  # role names -> role-id bitmask
+        self._missing: Set[int] = set()  # role_id không có sau lần reload gần nhất
+        self._version = None
+        self._loaded = False
+        # Reload chạy từ threadpool (crud, refresh) và lúc startup
+        self._lock = threading.Lock()
+
+        self.reloads = 0
+
+    def load(self, db: Optional[Session] = None) -> None:
+        """(Re)load toàn bộ roles từ DB (sync: không gọi trên event loop)"""
+        own_session = db is None
+        if own_session:
+            db = SessionLocal()
+        try:
+            version = self._current_version()
+            entries = [RoleEntry(role) for role in db.query(Role).order_by(Role.id).all()]
+        finally:
+            if own_session:
+                db.close()
+
+        with self._lock:
+            # Swap cả dict: reader không bao giờ thấy registry đang build dở
+            self._by_id = {entry.id: entry for entry in entries}
+            self._by_name = {entry.name: entry for entry in entries}
+            self._masks = {}
+            self._missing = set()
+            self._version = version
+            self._loaded = True
+            self.reloads += 1
+
+    def _current_version(self):
+        return response_cache.tag_versions(["roles"])["roles"]
+
+    def _ensure_loaded(self) -> None:
+        if not self._loaded:
+            self.load()
+
+    async def run(self) -> None:
+        """Refresh loop (background task trong lifespan): reload khi version tag "roles" đổi"""
+        while True:
+            await asyncio.sleep(self.refresh_seconds)
+            try:
+                version = (await response_cache.atag_versions(["roles"]))["roles"]
+                if version != self._version:
+                    await run_in_threadpool(self.load)
+            except Exception as e:
+                logger.error(f"Role registry refresh error: {e}")
+
+    def get(self, role_id: Optional[int]) -> Optional[RoleEntry]:
+        """Role của user; role_id None -> role mặc định (student), role_id không tồn tại -> None"""
+        self._ensure_loaded()
+        if role_id is None:
+            return self._by_name.get(DEFAULT_ROLE_NAME)
+        return self._by_id.get(role_id)
+
+    def ensure(self, role_id: Optional[int]) -> Optional[RoleEntry]:
+        """
+        get() nhưng reload một lần cho mỗi role_id lạ (có thể là role vừa tạo
+        ở worker khác). Sync DB: gọi từ threadpool, hoặc qua aensure().
+        """
+        entry = self.get(role_id)
+        if entry is None and role_id is not None and role_id not in self._missing:
+            try:
+                self.load()
+            except Exception as e:
+                logger.error(f"Role registry reload error: {e}")
+            entry = self._by_id.get(role_id)
+            if entry is None:
+                with self._lock:
+                    self._missing.add(role_id)
+        return entry
+
+    async def aensure(self, role_id: Optional[int]) -> Optional[RoleEntry]:
+        """Async ensure(): chỉ sang threadpool khi role_id chưa biết"""
+        entry = self.get(role_id)
+        if entry is None and role_id is not None and role_id not in self._missing:
+            entry = await run_in_threadpool(self.ensure, role_id)
+        return entry
+
+    def get_by_name(self, name: str) -> Optional[RoleEntry]:
+        self._ensure_loaded()
+        return self._by_name.get(name)
+
+    def role_name(self, role_id: Optional[int]) -> Optional[str]:
+        """Tên role; role_id None -> student, role không tồn tại -> None (không coi là student)"""
+        if role_id is None:
+            return DEFAULT_ROLE_NAME
+        entry = self.get(role_id)
+        return entry.name if entry else None
+
+    def permissions(self, role_id: Optional[int]) -> Permission:
+        entry = self.get(role_id)
+        return entry.permissions if entry else Permission.NONE
+
+    def has_permission(self, role_id: Optional[int], permission: Permission) -> bool:
+        """True nếu role có đủ mọi bit trong `permission`"""
+        return self.permissions(role_id) & permission == permission
+
+    def role_mask(self, role_names: Iterable[str]) -> int:
+        """Bitmask các role_id có tên trong role_names (compile một lần mỗi version)"""
+        self._ensure_loaded()
+        key = tuple(role_names)
+        mask = self._masks.get(key)
+        if mask is None:
+            mask = 0
+            for name in key:
+                entry = self._by_name.get(name)
+                if entry is not None:
+                    mask |= 1 << entry.id
+            self._masks[key] = mask
+        return mask
+
+    def in_roles(self, role_id: Optional[int], mask: int) -> bool:
+        entry = self.get(role_id)
+        return entry is not None and bool(mask >> entry.id & 1)
+
+    def catalog(self) -> List[dict]:
+        """Roles đang active (id, name, display_name) cho /auth/roles, bootstrap"""
+        self._ensure_loaded()
+        return [entry.to_simple() for entry in self._by_id.values() if entry.is_active]
+
+    def all_roles(self) -> List[RoleEntry]:
+        """Tất cả roles (kể cả inactive)"""
+        self._ensure_loaded()
+        return list(self._by_id.values())
+
+    def stats(self) -> dict:
+        return {
+            "roles": len(self._by_id),
+            "reloads": self.reloads,
+            "version": self._version,
+        }
+
+
+# Singleton registry instance
+role_registry = RoleRegistry()
+
+
+def reload_role_registry(db: Optional[Session] = None) -> None:
+    """Reload registry sau khi roles thay đổi (gọi sau commit), không bao giờ raise"""
+    try:
+        role_registry.load(db)
+    except Exception as e:
+        logger.error(f"Role registry reload error: {e}")
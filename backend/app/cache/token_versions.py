@@ -0,0 +1,101 @@
+"""
+Per-user token version map (Redis, nguồn gốc là cột users.token_version).
+
+Access token dạng claims mang theo "ver". Token chỉ hợp lệ khi "ver" bằng
+version hiện tại của user; bump version khi đổi role hoặc logout sẽ thu hồi
+mọi token đã cấp trước đó. Mỗi lần kiểm tra là một GET O(1).
+
+Fail closed: key không có trong Redis (chưa cache, bị evict, Redis flush)
+hoặc Redis lỗi thì đọc lại version từ DB, không bao giờ coi là version 0.
+Không có Redis (MemoryCache riêng từng worker) thì không cache version, vì
+bump ở worker này không thu hồi được token ở worker khác; claims token khi
+đó cũng không được cấp nữa (CLAIMS_TOKENS_ENABLED).
+"""
+
+import logging
+import time
+from typing import Optional
+
+from sqlalchemy import update
+from starlette.concurrency import run_in_threadpool
+
+from cache.redis_client import get_cache, set_cache, aget_cache, aset_cache, delete_cache, is_redis_available
+from core.config import settings
+from core.server_timing import timed
+from database.session import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+TOKEN_VERSION_PREFIX = "tokver:"
+
+# Version phải sống lâu hơn mọi token được cấp với nó
+TOKEN_VERSION_TTL = settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60 + 3600
+
+# Claims token cần version map dùng chung giữa các worker
+CLAIMS_TOKENS_ENABLED = settings.AUTH_CLAIMS_TOKENS and is_redis_available
+if settings.AUTH_CLAIMS_TOKENS and not is_redis_available:
+    logger.warning("AUTH_CLAIMS_TOKENS disabled: Redis unavailable, issuing legacy tokens")
+
+
+@timed("db.get_token_version")
+def _load_token_version(user_id: int) -> Optional[int]:
+    from models.user import User
+
+    db = SessionLocal()
+    try:
+        row = db.query(User.token_version).filter(User.id == user_id).first()
+    finally:
+        db.close()
+    return None if row is None else row[0] or 0
+
+
+def get_token_version(user_id: int) -> Optional[int]:
+    """Version hiện tại của user (None nếu user không tồn tại)"""
+    key = TOKEN_VERSION_PREFIX + str(user_id)
+    if is_redis_available:
+        version = get_cache(key)
+        if version is not None:
+            return version
+    version = _load_token_version(user_id)
+    if version is not None and is_redis_available:
+        # nx: không ghi đè version mới hơn do bump chạy song song
+        set_cache(key, version, ttl=TOKEN_VERSION_TTL, nx=True)
+    return version
+
+
+async def aget_token_version(user_id: int) -> Optional[int]:
+    """Async get_token_version (middleware)"""
+    key = TOKEN_VERSION_PREFIX + str(user_id)
+    if is_redis_available:
+        version = await aget_cache(key)
+        if version is not None:
+            return version
+    version = await run_in_threadpool(_load_token_version, user_id)
+    if version is not None and is_redis_available:
+        await aset_cache(key, version, ttl=TOKEN_VERSION_TTL, nx=True)
+    return version
+
+
+def bump_token_version(user_id: int) -> int:
+    """
+    Thu hồi mọi token đã cấp cho user.
+
+    Version lấy theo thời gian nên các worker bump đồng thời vẫn luôn khác
+    version cũ, không cần read-modify-write. Ghi DB trước rồi mới ghi Redis;
+    ghi Redis lỗi thì xóa key để lần đọc sau lấy lại từ DB.
+    """
+    from models.user import User
+
+    version = time.time_ns()
+    db = SessionLocal()
+    try:
+        db.execute(update(User).where(User.id == user_id).values(token_version=version))
+        db.commit()
+    finally:
+        db.close()
+    if is_redis_available:
+        key = TOKEN_VERSION_PREFIX + str(user_id)
+        if not set_cache(key, version, ttl=TOKEN_VERSION_TTL):
+            delete_cache(key)
+    logger.info(f"Token version bumped for user {user_id}")
+    return version
@@ -0,0 +1,353 @@
+"""
+User directory search index.
+
+Index in-memory (mỗi worker) trên name, email và user_code:
+- Token được normalize: lowercase, bỏ dấu tiếng Việt ("Nguyễn" -> "nguyen")
+- Danh sách token đã sort + bisect cho prefix match, token -> set user id
+- Query nhiều từ là AND của các prefix match, lọc theo role_id
+
+Build lúc startup từ bảng users, cập nhật sau mỗi lần ghi user (crud.user).
+Worker khác đồng bộ qua change log trong Redis: mỗi thay đổi là một entry
+(seq, user_id); worker đọc phần đuôi log mà nó chưa thấy (tối đa mỗi
+SYNC_INTERVAL giây) và load lại đúng các user đó bằng một query IN. Log đã
+bị trim quá điểm của worker thì build lại ở background thread, trong lúc đó
+search vẫn dùng index cũ.
+"""
+
+import bisect
+import heapq
+import logging
+import re
+import threading
+import time
+import unicodedata
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy.orm import Session
+
+from cache.redis_client import redis_client, is_redis_available
+from core.config import settings
+from database.session import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+LOG_KEY = "usersearch:log"
+SEQ_KEY = "usersearch:seq"
+
+_SPLIT = re.compile(r"[\s@._+\-]+")
+
+# KEYS: seq, log | ARGV: log_size, user ids...
+# Tăng seq và ghi entry "seq:user_id" atomic: reader thấy seq mới thì log cũng đã có entry
+_PUBLISH_SCRIPT = """
+local n = #ARGV - 1
+local last = redis.call('INCRBY', KEYS[1], n)
+for i = 1, n do
+    redis.call('RPUSH', KEYS[2], (last - n + i) .. ':' .. ARGV[i + 1])
+end
+redis.call('LTRIM', KEYS[2], -tonumber(ARGV[1]), -1)
+return last
+"""
+
+# KEYS: seq, log | ARGV: seq đã áp dụng, log_size
+# Đọc seq và các entry sau seq đã áp dụng atomic (mỗi seq đúng một entry, nên
+# đó là n entry cuối). Chậm hơn log_size thì không đọc: caller build lại.
+_TAIL_SCRIPT = """
+local last = tonumber(redis.call('GET', KEYS[1]) or '0')
+local n = last - tonumber(ARGV[1])
+if n <= 0 or n > tonumber(ARGV[2]) then
+    return {last}
+end
+local entries = redis.call('LRANGE', KEYS[2], -n, -1)
+table.insert(entries, 1, last)
+return entries
+"""
+
+
+def normalize_text(text: str) -> str:
+    """Lowercase + bỏ dấu (đ -> d)"""
+    text = unicodedata.normalize("NFD", text.lower().replace("đ", "d"))
+    return "".join(ch for ch in text if not unicodedata.combining(ch))
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    return [token for token in _SPLIT.split(normalize_text(text or "")) if token]
+
+
+class UserSearchIndex:
+    """Prefix/token index của user directory"""
+
+    SYNC_INTERVAL = 1.0
+
+    def __init__(self, log_size: int = settings.USER_SEARCH_LOG_SIZE, use_redis: bool = is_redis_available):
+        self.log_size = log_size
+        self._use_redis = use_redis
+        self._docs: Dict[int, dict] = {}          # user_id -> document
+        self._sort_keys: Dict[int, str] = {}      # user_id -> normalized name
+        self._doc_tokens: Dict[int, set] = {}     # user_id -> tokens
+        self._postings: Dict[str, set] = {}       # token -> user ids
+        self._tokens: List[str] = []              # sorted tokens (prefix range bằng bisect)
+        # Ghi từ threadpool (crud), đọc từ các request search
+        self._lock = threading.RLock()
+        self._seq = 0
+        self._synced_at = 0.0
+        self._rebuilding = False
+        self.ready = False
+
+        self.searches = 0
+        self.full_rebuilds = 0
+        if use_redis:
+            self._publish_script = redis_client.register_script(_PUBLISH_SCRIPT)
+            self._tail_script = redis_client.register_script(_TAIL_SCRIPT)
+
+    # DOCUMENTS
+
+    @staticmethod
+    def _document(user) -> dict:
+        return {
+            "id": user.id,
+            "user_code": user.user_code,
+            "name": user.name,
+            "email": user.email,
+            "role_id": user.role_id,
+        }
+
+    @staticmethod
+    def _doc_token_set(doc: dict) -> set:
+        tokens = set(tokenize(doc["name"]))
+        tokens.update(tokenize(doc["email"]))
+        email = normalize_text(doc["email"] or "")
+        if email:
+            tokens.add(email)  # Cho phép gõ cả email "nguyen.van.a@..."
+        if doc["user_code"]:
+            tokens.add(doc["user_code"].lower())
+        return tokens
+
+    def _upsert_locked(self, doc: dict) -> None:
+        user_id = doc["id"]
+        new_tokens = self._doc_token_set(doc)
+        old_tokens = self._doc_tokens.get(user_id, set())
+        for token in old_tokens - new_tokens:
+            self._remove_posting(token, user_id)
+        for token in new_tokens - old_tokens:
+            posting = self._postings.get(token)
+            if posting is None:
+                posting = self._postings[token] = set()
+                bisect.insort(self._tokens, token)
+            posting.add(user_id)
+        self._docs[user_id] = doc
+        self._sort_keys[user_id] = normalize_text(doc["name"] or "")
+        self._doc_tokens[user_id] = new_tokens
+
+    def _remove_locked(self, user_id: int) -> None:
+        for token in self._doc_tokens.pop(user_id, ()):
+            self._remove_posting(token, user_id)
+        self._docs.pop(user_id, None)
+        self._sort_keys.pop(user_id, None)
+
+    def _remove_posting(self, token: str, user_id: int) -> None:
+        posting = self._postings.get(token)
+        if posting is None:
+            return
+        posting.discard(user_id)
+        if not posting:
+            del self._postings[token]
+            i = bisect.bisect_left(self._tokens, token)
+            if i < len(self._tokens) and self._tokens[i] == token:
+                del self._tokens[i]
+
+    # BUILD / UPDATE
+
+    def build(self, db: Optional[Session] = None) -> None:
+        """Build lại toàn bộ index từ bảng users"""
+        from models.user import User
+
+        own_session = db is None
+        if own_session:
+            db = SessionLocal()
+        try:
+            seq = self._remote_seq()
+            query = db.query(User.id, User.user_code, User.name, User.email, User.role_id)
+            docs = [self._document(row) for row in query.yield_per(5000)]
+        finally:
+            if own_session:
+                db.close()
+
+        postings: Dict[str, set] = {}
+        doc_tokens: Dict[int, set] = {}
+        for doc in docs:
+            tokens = doc_tokens[doc["id"]] = self._doc_token_set(doc)
+            for token in tokens:
+                postings.setdefault(token, set()).add(doc["id"])
+
+        with self._lock:
+            self._docs = {doc["id"]: doc for doc in docs}
+            self._sort_keys = {doc["id"]: normalize_text(doc["name"] or "") for doc in docs}
+            self._doc_tokens = doc_tokens
+            self._postings = postings
+            self._tokens = sorted(postings)
+            self._seq = seq
+            self._synced_at = time.monotonic()
+            self.ready = True
+            self.full_rebuilds += 1
+        logger.info(f"User search index built with {len(docs)} users, {len(postings)} tokens")
+
+    def upsert_users(self, users: Iterable) -> None:
+        """Cập nhật index sau khi commit (user ORM hoặc row có id/user_code/name/email/role_id)"""
+        users = list(users)
+        if not self.ready or not users:
+            return
+        with self._lock:
+            for user in users:
+                self._upsert_locked(self._document(user))
+        self._publish([user.id for user in users])
+
+    def remove_users(self, user_ids: Iterable[int]) -> None:
+        user_ids = list(user_ids)
+        if not self.ready or not user_ids:
+            return
+        with self._lock:
+            for user_id in user_ids:
+                self._remove_locked(user_id)
+        self._publish(user_ids)
+
+    # CROSS-WORKER SYNC
+
+    def _remote_seq(self) -> int:
+        if not self._use_redis:
+            return 0
+        try:
+            return int(redis_client.get(SEQ_KEY) or 0)
+        except Exception as e:
+            logger.error(f"User search seq error: {e}")
+            return 0
+
+    def _publish(self, user_ids: List[int]) -> None:
+        """Ghi change log: mỗi user id một entry "seq:user_id" """
+        if not self._use_redis:
+            return
+        try:
+            last = int(self._publish_script(keys=[SEQ_KEY, LOG_KEY], args=[self.log_size, *user_ids]))
+            with self._lock:
+                # Thay đổi của chính worker này đã có trong index
+                if self._seq == last - len(user_ids):
+                    self._seq = last
+        except Exception as e:
+            logger.error(f"User search publish error: {e}")
+
+    def sync(self) -> None:
+        """Áp dụng thay đổi từ worker khác (throttled, một request sync tại một thời điểm)"""
+        if not self._use_redis:
+            return
+        with self._lock:
+            now = time.monotonic()
+            if self._rebuilding or now - self._synced_at < self.SYNC_INTERVAL:
+                return
+            self._synced_at = now
+            applied = self._seq
+        try:
+            result = self._tail_script(keys=[SEQ_KEY, LOG_KEY], args=[applied, self.log_size])
+        except Exception as e:
+            logger.error(f"User search sync error: {e}")
+            return
+
+        remote = int(result[0])
+        if remote == applied:
+            return
+        changes = [tuple(map(int, entry.split(":"))) for entry in result[1:]]
+        if remote < applied or not changes or changes[0][0] != applied + 1:
+            # Log đã bị trim quá điểm của worker này (hoặc Redis bị reset): build lại
+            self._rebuild_in_background()
+            return
+
+        self._reload({user_id for seq, user_id in changes})
+        with self._lock:
+            self._seq = max(self._seq, remote)
+
+    def _rebuild_in_background(self) -> None:
+        """Full rebuild ngoài request path; search dùng index cũ cho đến khi swap"""
+        with self._lock:
+            if self._rebuilding:
+                return
+            self._rebuilding = True
+
+        def run():
+            try:
+                self.build()
+            except Exception as e:
+                logger.error(f"User search rebuild error: {e}")
+            finally:
+                with self._lock:
+                    self._rebuilding = False
+
+        threading.Thread(target=run, name="user-search-rebuild", daemon=True).start()
+
+    def _reload(self, user_ids: set) -> None:
+        if not user_ids:
+            return
+        from models.user import User
+
+        db = SessionLocal()
+        try:
+            rows = db.query(User.id, User.user_code, User.name, User.email, User.role_id) \
+                .filter(User.id.in_(user_ids)).all()
+        finally:
+            db.close()
+        with self._lock:
+            for row in rows:
+                self._upsert_locked(self._document(row))
+            for user_id in user_ids - {row.id for row in rows}:
+                self._remove_locked(user_id)
+
+    # SEARCH
+
+    def _prefix_match(self, term: str) -> set:
+        """User ids có ít nhất một token bắt đầu bằng term"""
+        tokens = self._tokens
+        i = bisect.bisect_left(tokens, term)
+        result = set()
+        while i < len(tokens) and tokens[i].startswith(term):
+            result |= self._postings[tokens[i]]
+            i += 1
+        return result
+
+    def search(self, query: str, role_id: Optional[int] = None, limit: int = 20) -> Optional[List[dict]]:
+        """
+        Tìm user theo prefix của các từ trong query (AND), lọc theo role_id.
+        Trả về None nếu index chưa sẵn sàng.
+        """
+        if not self.ready:
+            return None
+        self.sync()
+        self.searches += 1
+
+        terms = sorted(set(tokenize(query)), key=len, reverse=True)
+        if not terms:
+            return []
+        with self._lock:
+            # Term dài nhất thường chọn lọc nhất: giao từ đó trước
+            matches = self._prefix_match(terms[0])
+            for term in terms[1:]:
+                if not matches:
+                    break
+                matches &= self._prefix_match(term)
+            docs = self._docs
+            if role_id is not None:
+                matches = [user_id for user_id in matches if docs[user_id]["role_id"] == role_id]
+            sort_keys = self._sort_keys
+            top = heapq.nsmallest(limit, matches, key=lambda user_id: (sort_keys[user_id], user_id))
+            return [docs[user_id] for user_id in top]
+
+    def stats(self) -> dict:
+        return {
+            "ready": self.ready,
+            "users": len(self._docs),
+            "tokens": len(self._tokens),
+            "seq": self._seq,
+            "searches": self.searches,
+            "full_rebuilds": self.full_rebuilds,
+            "rebuilding": self._rebuilding,
+        }
+
+
+# Singleton index instance
+user_search_index = UserSearchIndex()
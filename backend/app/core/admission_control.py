@@ -0,0 +1,235 @@
+"""
+Admission control / load shedding.
+
+Giới hạn số request được xử lý đồng thời trong mỗi worker để khi MySQL
+chậm, request không dồn ứ trong worker cho đến khi tất cả cùng timeout.
+
+- In-flight limit thích ứng theo latency quan sát được (AIMD)
+- Hàng đợi ngắn, có giới hạn, ưu tiên theo class của request
+- Từ chối bằng 503 + Retry-After khi quá tải
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from enum import IntEnum
+
+from starlette.middleware.base import BaseHTTPMiddleware
+from fastapi import Request, status
+from fastapi.responses import JSONResponse
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class RequestPriority(IntEnum):
+    """Request classes, lower value = admitted first"""
+    CRITICAL = 0  # Login, health checks
+    NORMAL = 1    # Writes and everything else
+    BULK = 2      # Bulk reads
+
+
+# Paths admitted ahead of everything else
+CRITICAL_PATHS = [
+    "/auth/login",
+    "/health",
+    "/healthz",
+]
+
+
+def classify_request(method: str, path: str) -> RequestPriority:
+    """Map a request to its admission priority class"""
+    if path == "/" or any(path.startswith(p) for p in CRITICAL_PATHS):
+        return RequestPriority.CRITICAL
+    if method in ("GET", "HEAD"):
+        return RequestPriority.BULK
+    return RequestPriority.NORMAL
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    Per-worker in-flight limiter with a bounded priority queue.
+
+    The limit grows additively while observed latency stays under the
+    target and shrinks multiplicatively (at most once per target interval)
+    when it does not. All state is touched only from the event loop, so no
+    locking is needed.
+    """
+
+    BACKOFF_RATIO = 0.9
+
+    def __init__(
+        self,
+        initial_limit: int = settings.ADMISSION_INITIAL_CONCURRENCY,
+        min_limit: int = settings.ADMISSION_MIN_CONCURRENCY,
+        max_limit: int = settings.ADMISSION_MAX_CONCURRENCY,
+        max_queue: int = settings.ADMISSION_MAX_QUEUE,
+        queue_timeout_ms: int = settings.ADMISSION_QUEUE_TIMEOUT_MS,
+        latency_target_ms: int = settings.ADMISSION_LATENCY_TARGET_MS,
+    ):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = float(min(max(initial_limit, self.min_limit), self.max_limit))
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout_ms / 1000
+        self.latency_target = latency_target_ms / 1000
+
+        self.in_flight = 0
+        self._waiters = []  # heap of (priority, seq, future)
+        self._seq = itertools.count()
+        self._last_decrease = 0.0
+
+        # Counters
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    def _has_capacity(self) -> bool:
+        return self.in_flight < int(self.limit)
+
+    async def acquire(self, priority: RequestPriority) -> bool:
+        """
+        Wait for an in-flight slot.
+
+        Returns:
+            bool: True if admitted (caller must call release), False if shed
+        """
+        # Fast path: free slot and nobody of equal or higher priority waiting
+        if self._has_capacity() and not (self._waiters and self._waiters[0][0] <= priority):
+            self.in_flight += 1
+            self.admitted += 1
+            return True
+
+        if len(self._waiters) >= self.max_queue:
+            # Queue full: shed the lowest-priority waiter if the newcomer outranks it
+            worst = max(self._waiters) if self._waiters else None
+            if worst is None or worst[0] <= priority:
+                self.rejected += 1
+                return False
+            self._waiters.remove(worst)
+            heapq.heapify(self._waiters)
+            worst[2].set_result(False)
+            self.rejected += 1
+
+        future = asyncio.get_running_loop().create_future()
+        entry = (int(priority), next(self._seq), future)
+        heapq.heappush(self._waiters, entry)
+
+        try:
+            await asyncio.wait({future}, timeout=self.queue_timeout)
+        except asyncio.CancelledError:
+            # Client went away while queued
+            if future.done() and future.result():
+                self.release(None)
+            else:
+                self._discard(entry)
+            raise
+
+        if future.done():
+            return future.result()
+
+        # Queued longer than the target: shed
+        self._discard(entry)
+        self.timed_out += 1
+        return False
+
+    def release(self, latency: float | None) -> None:
+        """Free a slot, feed the observed latency back and wake waiters"""
+        if latency is not None:
+            self._adjust(latency)
+        self.in_flight -= 1
+        self._wake()
+
+    def _adjust(self, latency: float) -> None:
+        if latency > self.latency_target:
+            now = time.monotonic()
+            if now - self._last_decrease >= self.latency_target:
+                self.limit = max(self.min_limit, self.limit * self.BACKOFF_RATIO)
+                self._last_decrease = now
+        elif self.in_flight >= int(self.limit):
+            # Only grow while the limit is actually binding
+            self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+
+    def _wake(self) -> None:
+        while self._waiters and self._has_capacity():
+            _, _, future = heapq.heappop(self._waiters)
+            if future.done():
+                continue
+            self.in_flight += 1
+            self.admitted += 1
+            future.set_result(True)
+
+    def _discard(self, entry) -> None:
+        try:
+            self._waiters.remove(entry)
+            heapq.heapify(self._waiters)
+        except ValueError:
+            pass
+        if not entry[2].done():
+            entry[2].cancel()
+
+    def stats(self) -> dict:
+        """Snapshot of limiter state for metrics"""
+        return {
+            "limit": int(self.limit),
+            "in_flight": self.in_flight,
+            "queued": len(self._waiters),
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+        }
+
+
+# Singleton limiter for this worker
+admission_limiter = AdaptiveConcurrencyLimiter()
+
+
+class AdmissionControlMiddleware(BaseHTTPMiddleware):
+    """
+    Admission Control Middleware
+
+    - Admits requests up to the adaptive in-flight limit
+    - Queues the overflow briefly, highest priority class first
+    - Returns 503 with Retry-After when the queue is full or the wait is too long
+    """
+
+    SKIP_PATHS = [
+        "/docs",
+        "/redoc",
+        "/openapi.json",
+        "/static",
+        "/favicon.ico",
+    ]
+
+    def __init__(self, app, limiter: AdaptiveConcurrencyLimiter = None):
+        super().__init__(app)
+        self.limiter = limiter or admission_limiter
+
+    async def dispatch(self, request: Request, call_next):
+        path = request.url.path
+        if any(path.startswith(p) for p in self.SKIP_PATHS):
+            return await call_next(request)
+
+        priority = classify_request(request.method, path)
+        if not await self.limiter.acquire(priority):
+            retry_after = settings.ADMISSION_RETRY_AFTER_SECONDS
+            logger.warning(f"Request shed ({priority.name}): {request.method} {path}")
+            return JSONResponse(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                content={
+                    "detail": "Server is busy. Please retry shortly.",
+                    "retry_after": retry_after
+                },
+                headers={"Retry-After": str(retry_after)},
+            )
+
+        start_time = time.perf_counter()
+        latency = None
+        try:
+            response = await call_next(request)
+            latency = time.perf_counter() - start_time
+            return response
+        finally:
+            self.limiter.release(latency)
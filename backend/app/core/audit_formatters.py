@@ -6,9 +6,10 @@ và dễ dàng mở rộng format mới.
 """
 
 import logging
-import json
 from datetime import datetime, timezone, timedelta
 
+from core.serialization import dumps_str
+
 # Vietnam timezone (UTC+7)
 VN_TZ = timezone(timedelta(hours=7))
 
@@ -32,7 +33,7 @@ class AuditLogFormatter(logging.Formatter):
             if hasattr(record, field):
                 log_data[field] = getattr(record, field)
         
-        return json.dumps(log_data, ensure_ascii=False)
+        return dumps_str(log_data)
 
 
 class ColoredConsoleFormatter(logging.Formatter):
@@ -5,6 +5,7 @@ from core.audit import extract_client_info
 from core.audit_action_mapping import map_request_to_action
 from crud.audit_log import create_audit_log
 from core.audit_logger import log_audit_event
+from core.server_timing import current_timings, phase
 import logging
 import time
 
@@ -60,15 +61,16 @@ class AuditMiddleware(BaseHTTPMiddleware):
         
         # Create audit log entry
         try:
-            self._log_request(
-                request=request,
-                response=response,
-                user_id=user_id,
-                user_email=user_email,
-                ip_address=ip_address,
-                user_agent=user_agent,
-                duration_ms=duration_ms
-            )
+            with phase("audit"):
+                self._log_request(
+                    request=request,
+                    response=response,
+                    user_id=user_id,
+                    user_email=user_email,
+                    ip_address=ip_address,
+                    user_agent=user_agent,
+                    duration_ms=duration_ms
+                )
         except Exception as e:
             # Don't fail the request if audit logging fails
             logger.error(f"Audit middleware error: {e}")
@@ -91,6 +93,12 @@ class AuditMiddleware(BaseHTTPMiddleware):
             # Map HTTP method to action
             action = map_request_to_action(request.method, request.url.path)
             
+            # Duration with per-phase breakdown (set by ServerTimingMiddleware)
+            details = {"duration_ms": round(duration_ms, 2)}
+            timings = current_timings()
+            if timings is not None:
+                details["phases"] = timings.as_dict()
+            
             # Create audit log in database
             create_audit_log(
                 db=db,
@@ -102,7 +110,7 @@ class AuditMiddleware(BaseHTTPMiddleware):
                 status_code=response.status_code,
                 ip_address=ip_address,
                 user_agent=user_agent,
-                details={"duration_ms": round(duration_ms, 2)}
+                details=details
             )
             
             # Log to audit logger (console + file + iCloud)
@@ -0,0 +1,287 @@
+"""
+Breached-password corpus lookup.
+
+Corpus (vài triệu password đã bị lộ) được build một lần thành file index
+và memory-map lúc chạy: lookup là binary search trên file, không load vào
+memory nên mỗi worker gần như không tốn RAM (page cache dùng chung giữa
+các worker), mỗi lookup chỉ chạm vài page.
+
+File format (little-endian):
+    header   32 bytes   magic "BPWH", version, digest size, count, bloom bits/hashes
+    fanout   65536 x u64 số record có 2 byte đầu <= i (thu hẹp binary search)
+    records  count x 20 SHA-1 digest đã sort, không trùng
+    bloom    (tùy chọn) Bloom filter trên digest, loại phần lớn password
+             không có trong corpus trước khi binary search
+
+Build:
+    cd backend/app && python -m core.breached_passwords build rockyou.txt breached.idx
+    python -m core.breached_passwords build pwned-passwords-sha1.txt breached.idx --format sha1 --bloom-bits 10
+"""
+
+import argparse
+import hashlib
+import heapq
+import logging
+import math
+import mmap
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import threading
+import time
+from array import array
+from typing import Iterator, List, Optional
+
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"BPWH"
+VERSION = 1
+DIGEST_SIZE = 20
+HEADER = struct.Struct("<4sBBxxQQII")  # magic, version, digest size, count, bloom bits, bloom hashes, reserved
+FANOUT_ENTRIES = 1 << 16
+FANOUT = struct.Struct(f"<{FANOUT_ENTRIES}Q")
+RECORDS_OFFSET = HEADER.size + FANOUT.size
+
+
+def password_digest(password: str) -> bytes:
+    return hashlib.sha1(password.encode("utf-8")).digest()
+
+
+def _bloom_positions(digest: bytes, bits: int, hashes: int) -> List[int]:
+    # Digest đã phân bố đều: dùng trực tiếp làm hai hash (double hashing)
+    h1 = int.from_bytes(digest[4:12], "little")
+    h2 = int.from_bytes(digest[12:20], "little") | 1
+    return [(h1 + i * h2) % bits for i in range(hashes)]
+
+
+class BreachedPasswordIndex:
+    """Lookup trong file index đã build (memory-mapped, mở lazily)"""
+
+    def __init__(self, path: str = settings.BREACHED_PASSWORDS_PATH):
+        self.path = path
+        self._mm: Optional[mmap.mmap] = None
+        self._opened = False
+        self._lock = threading.Lock()
+        self.count = 0
+        self._fanout = None
+        self._bloom_offset = 0
+        self._bloom_bits = 0
+        self._bloom_hashes = 0
+
+        self.lookups = 0
+        self.hits = 0
+        self.bloom_rejects = 0
+
+    def _open(self) -> bool:
+        if self._opened:
+            return self._mm is not None
+        with self._lock:
+            if self._opened:
+                return self._mm is not None
+            self._opened = True
+            if not self.path:
+                return False
+            try:
+                with open(self.path, "rb") as f:
+                    mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                magic, version, digest_size, count, bloom_bits, bloom_hashes, _ = HEADER.unpack_from(mm, 0)
+                if magic != MAGIC or version != VERSION or digest_size != DIGEST_SIZE:
+                    raise ValueError("not a breached-password index (rebuild with python -m core.breached_passwords)")
+            except (OSError, ValueError) as e:
+                logger.error(f"Breached password index unavailable ({self.path}): {e}")
+                return False
+            # Lookup đọc ngẫu nhiên: tắt read-ahead
+            if hasattr(mm, "madvise") and hasattr(mmap, "MADV_RANDOM"):
+                mm.madvise(mmap.MADV_RANDOM)
+            self.count = count
+            # Fanout trong file là little-endian: copy ra array (512 KB) theo byte order của máy
+            fanout = array("Q", mm[HEADER.size:RECORDS_OFFSET])
+            if sys.byteorder != "little":
+                fanout.byteswap()
+            self._fanout = fanout
+            self._bloom_offset = RECORDS_OFFSET + count * DIGEST_SIZE
+            self._bloom_bits = bloom_bits
+            self._bloom_hashes = bloom_hashes
+            self._mm = mm
+            logger.info(f"Breached password index loaded: {count} hashes ({self.path})")
+            return True
+
+    @property
+    def available(self) -> bool:
+        return self._open()
+
+    def contains_digest(self, digest: bytes) -> bool:
+        if not self._open():
+            return False
+        self.lookups += 1
+        mm = self._mm
+
+        if self._bloom_bits:
+            offset = self._bloom_offset
+            for pos in _bloom_positions(digest, self._bloom_bits, self._bloom_hashes):
+                if not mm[offset + (pos >> 3)] & (0x80 >> (pos & 7)):
+                    self.bloom_rejects += 1
+                    return False
+
+        prefix = digest[0] << 8 | digest[1]
+        lo = self._fanout[prefix - 1] if prefix else 0
+        hi = self._fanout[prefix]
+        while lo < hi:
+            mid = (lo + hi) >> 1
+            start = RECORDS_OFFSET + mid * DIGEST_SIZE
+            record = mm[start:start + DIGEST_SIZE]
+            if record < digest:
+                lo = mid + 1
+            elif record > digest:
+                hi = mid
+            else:
+                self.hits += 1
+                return True
+        return False
+
+    def contains(self, password: str) -> bool:
+        """True nếu password có trong corpus (False nếu chưa cấu hình corpus)"""
+        return self.contains_digest(password_digest(password))
+
+    def stats(self) -> dict:
+        return {
+            "available": self._mm is not None,
+            "entries": self.count,
+            "lookups": self.lookups,
+            "hits": self.hits,
+            "bloom_rejects": self.bloom_rejects,
+        }
+
+
+# Singleton index instance
+breached_passwords = BreachedPasswordIndex()
+
+
+# BUILDER
+
+def _iter_digests(source: str, fmt: str) -> Iterator[bytes]:
+    """plain: mỗi dòng một password (UTF-8); sha1: mỗi dòng "HEX[:count]" (Pwned Passwords)"""
+    with open(source, "rb") as f:
+        for line in f:
+            line = line.rstrip(b"\r\n")
+            if not line:
+                continue
+            if fmt == "sha1":
+                try:
+                    digest = bytes.fromhex(line.split(b":", 1)[0].decode("ascii"))
+                except ValueError:
+                    continue
+                if len(digest) == DIGEST_SIZE:
+                    yield digest
+            else:
+                yield hashlib.sha1(line).digest()
+
+
+def _write_run(digests: List[bytes], directory: str, index: int) -> str:
+    digests.sort()
+    path = os.path.join(directory, f"run{index}")
+    with open(path, "wb") as f:
+        f.write(b"".join(digests))
+    return path
+
+
+def _read_run(f) -> Iterator[bytes]:
+    while True:
+        chunk = f.read(DIGEST_SIZE * 4096)
+        if not chunk:
+            return
+        for i in range(0, len(chunk), DIGEST_SIZE):
+            yield chunk[i:i + DIGEST_SIZE]
+
+
+def build_index(source: str, output: str, fmt: str = "plain", bloom_bits_per_entry: int = 0,
+                run_size: int = 2_000_000) -> int:
+    """
+    Build file index từ corpus (external sort: corpus lớn hơn RAM vẫn build được).
+    File mới được ghi ra file tạm rồi os.replace: worker đang map file cũ không bị ảnh hưởng.
+    Returns số hash (đã bỏ trùng).
+    """
+    output = os.path.abspath(output)
+    workdir = tempfile.mkdtemp(dir=os.path.dirname(output))
+    try:
+        # 1. Sorted runs
+        runs, batch, total = [], [], 0
+        for digest in _iter_digests(source, fmt):
+            batch.append(digest)
+            if len(batch) >= run_size:
+                runs.append(_write_run(batch, workdir, len(runs)))
+                total, batch = total + len(batch), []
+        runs.append(_write_run(batch, workdir, len(runs)))
+        total += len(batch)
+
+        # Bloom size theo số dòng (cận trên số hash không trùng)
+        bloom_bits = bloom_bits_per_entry * max(total, 1) if bloom_bits_per_entry else 0
+        bloom_hashes = max(1, round(bloom_bits_per_entry * math.log(2))) if bloom_bits else 0
+        bloom = bytearray((bloom_bits + 7) // 8)
+
+        # 2. Merge + dedupe, đếm fanout, ghi records
+        counts = array("Q", bytes(8 * FANOUT_ENTRIES))
+        count, previous = 0, None
+        tmp_output = output + ".tmp"
+        files = [open(path, "rb") for path in runs]
+        try:
+            with open(tmp_output, "wb") as out:
+                out.seek(RECORDS_OFFSET)
+                buffer = []
+                for digest in heapq.merge(*(_read_run(f) for f in files)):
+                    if digest == previous:
+                        continue
+                    previous = digest
+                    buffer.append(digest)
+                    counts[digest[0] << 8 | digest[1]] += 1
+                    if bloom_bits:
+                        for pos in _bloom_positions(digest, bloom_bits, bloom_hashes):
+                            bloom[pos >> 3] |= 0x80 >> (pos & 7)
+                    count += 1
+                    if len(buffer) >= 65536:
+                        out.write(b"".join(buffer))
+                        buffer = []
+                out.write(b"".join(buffer))
+                out.write(bloom)
+
+                fanout, running = [], 0
+                for c in counts:
+                    running += c
+                    fanout.append(running)
+                out.seek(0)
+                out.write(HEADER.pack(MAGIC, VERSION, DIGEST_SIZE, count, bloom_bits, bloom_hashes, 0))
+                out.write(FANOUT.pack(*fanout))
+        finally:
+            for f in files:
+                f.close()
+        os.replace(tmp_output, output)
+        return count
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Breached-password index")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="Build index từ corpus")
+    build.add_argument("source")
+    build.add_argument("output")
+    build.add_argument("--format", choices=("plain", "sha1"), default="plain")
+    build.add_argument("--bloom-bits", type=int, default=0, help="Bloom filter bits per entry (0 = không dùng)")
+    check = commands.add_parser("check", help="Kiểm tra password trong index")
+    check.add_argument("index")
+    check.add_argument("passwords", nargs="+")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        started = time.perf_counter()
+        n = build_index(args.source, args.output, args.format, args.bloom_bits)
+        print(f"{n} hashes -> {args.output} ({os.path.getsize(args.output) / 1e6:.1f} MB, {time.perf_counter() - started:.1f}s)")
+    else:
+        index = BreachedPasswordIndex(args.index)
+        for password in args.passwords:
+            print(f"{password}: {'breached' if index.contains(password) else 'not found'}")
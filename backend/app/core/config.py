@@ -9,6 +9,21 @@ class Settings:
     - Database: MySQL connection settings
     - JWT: Authentication token settings
     - Redis: Caching settings
+    - Memory cache: Bounded in-process fallback when Redis is down
+    - Admission control: Per-worker load shedding
+    - Rate limiting: Per-client request limits
+    - Response cache: HTTP response caching for idempotent GETs
+    - Observability: Server-Timing header
+    - Principal cache: Authenticated user snapshots
+    - Password hashing: bcrypt process pool
+    - Breached passwords: Memory-mapped corpus index
+    - Role registry: In-memory roles and permissions
+    - Email filter: Bloom filter for email existence checks
+    - User import: Bulk CSV/NDJSON import
+    - User search: In-memory directory index
+    - User lookup: Batch lookup by ids
+    - Activity tracking: Write-behind last_active_at
+    - User stats: Aggregate reconciliation
     """
     
     # Database settings
@@ -22,6 +37,10 @@ class Settings:
     SECRET_KEY: str = os.getenv("SECRET_KEY", "your_secret_key")
     ALGORITHM: str = os.getenv("ALGORITHM", "HS256")
     ACCESS_TOKEN_EXPIRE_MINUTES: int = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "480"))  # 8 hours
+    # Token mang role + version claims để phân quyền không cần DB (opt-in).
+    # Logout thu hồi theo version của user: đăng xuất mọi thiết bị của user đó
+    AUTH_CLAIMS_TOKENS: bool = os.getenv("AUTH_CLAIMS_TOKENS", "false").lower() == "true"
+    TOKEN_CACHE_MAX_ENTRIES: int = int(os.getenv("TOKEN_CACHE_MAX_ENTRIES", "10000"))  # Verified-token cache
     
     # Redis settings
     REDIS_HOST: str = os.getenv("REDIS_HOST", "redis")
@@ -29,6 +48,83 @@ class Settings:
     REDIS_DB: int = int(os.getenv("REDIS_DB", "0"))
     REDIS_PASSWORD: str = os.getenv("REDIS_PASSWORD", "")
     REDIS_DEFAULT_TTL: int = int(os.getenv("REDIS_DEFAULT_TTL", "3600"))  # 1 hour
+    REDIS_ASYNC_MAX_CONNECTIONS: int = int(os.getenv("REDIS_ASYNC_MAX_CONNECTIONS", "64"))  # Async pool, per worker
+    # Cache codec: nén zlib giá trị từ ngưỡng này (0 = không nén)
+    CACHE_COMPRESS_MIN_BYTES: int = int(os.getenv("CACHE_COMPRESS_MIN_BYTES", "1024"))
+    CACHE_COMPRESS_LEVEL: int = int(os.getenv("CACHE_COMPRESS_LEVEL", "1"))
+    
+    # Memory cache settings (dùng khi Redis không kết nối được, mỗi worker)
+    MEMORY_CACHE_MAX_ENTRIES: int = int(os.getenv("MEMORY_CACHE_MAX_ENTRIES", "50000"))
+    MEMORY_CACHE_MAX_BYTES: int = int(os.getenv("MEMORY_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))  # Ước lượng
+    
+    # Admission control settings (per worker process)
+    ADMISSION_INITIAL_CONCURRENCY: int = int(os.getenv("ADMISSION_INITIAL_CONCURRENCY", "32"))
+    ADMISSION_MIN_CONCURRENCY: int = int(os.getenv("ADMISSION_MIN_CONCURRENCY", "4"))
+    ADMISSION_MAX_CONCURRENCY: int = int(os.getenv("ADMISSION_MAX_CONCURRENCY", "128"))
+    ADMISSION_MAX_QUEUE: int = int(os.getenv("ADMISSION_MAX_QUEUE", "64"))
+    ADMISSION_QUEUE_TIMEOUT_MS: int = int(os.getenv("ADMISSION_QUEUE_TIMEOUT_MS", "200"))
+    ADMISSION_LATENCY_TARGET_MS: int = int(os.getenv("ADMISSION_LATENCY_TARGET_MS", "500"))
+    ADMISSION_RETRY_AFTER_SECONDS: int = int(os.getenv("ADMISSION_RETRY_AFTER_SECONDS", "1"))
+    
+    # Rate limiting settings
+    RATE_LIMIT_MAX_KEYS: int = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))  # Tracked clients per worker
+    RATE_LIMIT_LOCAL_BATCH: int = int(os.getenv("RATE_LIMIT_LOCAL_BATCH", "4"))  # Max tokens leased per Redis call
+    
+    # Response cache settings
+    RESPONSE_CACHE_TTL: int = int(os.getenv("RESPONSE_CACHE_TTL", "300"))  # Redis level (seconds)
+    RESPONSE_CACHE_LOCAL_TTL: int = int(os.getenv("RESPONSE_CACHE_LOCAL_TTL", "5"))  # In-process level (seconds)
+    RESPONSE_CACHE_MAX_ENTRIES: int = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "2048"))
+    
+    # Observability settings
+    # Server-Timing header cho mọi request (admin luôn nhận được header)
+    SERVER_TIMING_ENABLED: bool = os.getenv("SERVER_TIMING_ENABLED", "false").lower() == "true"
+    
+    # Principal cache settings
+    PRINCIPAL_CACHE_TTL: int = int(os.getenv("PRINCIPAL_CACHE_TTL", "900"))  # Redis level (seconds)
+    PRINCIPAL_CACHE_LOCAL_TTL: int = int(os.getenv("PRINCIPAL_CACHE_LOCAL_TTL", "10"))  # In-process level (seconds)
+    PRINCIPAL_CACHE_MAX_ENTRIES: int = int(os.getenv("PRINCIPAL_CACHE_MAX_ENTRIES", "10000"))
+    
+    # Password hashing settings (per worker process)
+    BCRYPT_POOL_WORKERS: int = int(os.getenv("BCRYPT_POOL_WORKERS", "-1"))  # -1 = all cores, 0 = inline
+    BCRYPT_POOL_MAX_QUEUE: int = int(os.getenv("BCRYPT_POOL_MAX_QUEUE", "32"))  # Jobs waiting beyond the workers
+    BCRYPT_POOL_TIMEOUT_SECONDS: float = float(os.getenv("BCRYPT_POOL_TIMEOUT_SECONDS", "10"))
+    BCRYPT_RETRY_AFTER_SECONDS: int = int(os.getenv("BCRYPT_RETRY_AFTER_SECONDS", "1"))
+    # bcrypt cost: calibrate một lần cho deployment (lưu trong Redis) để mỗi hash mất
+    # ~BCRYPT_TARGET_MS, hoặc cố định bằng BCRYPT_ROUNDS
+    BCRYPT_ROUNDS: int = int(os.getenv("BCRYPT_ROUNDS", "0"))  # 0 = auto-calibrate
+    BCRYPT_TARGET_MS: int = int(os.getenv("BCRYPT_TARGET_MS", "250"))
+    BCRYPT_MIN_ROUNDS: int = int(os.getenv("BCRYPT_MIN_ROUNDS", "12"))  # passlib default, không calibrate thấp hơn
+    BCRYPT_MAX_ROUNDS: int = int(os.getenv("BCRYPT_MAX_ROUNDS", "16"))
+    
+    # Breached passwords settings
+    # File build bằng: python -m core.breached_passwords build <corpus> <output>; rỗng = tắt
+    BREACHED_PASSWORDS_PATH: str = os.getenv("BREACHED_PASSWORDS_PATH", "")
+    
+    # Role registry settings
+    # Worker khác thấy thay đổi roles sau tối đa bấy nhiêu giây (worker ghi thấy ngay)
+    ROLE_REGISTRY_REFRESH_SECONDS: int = int(os.getenv("ROLE_REGISTRY_REFRESH_SECONDS", "30"))
+    
+    # Email filter settings (scalable Bloom filter, tự mở layer mới khi vượt capacity)
+    EMAIL_FILTER_CAPACITY: int = int(os.getenv("EMAIL_FILTER_CAPACITY", "100000"))
+    EMAIL_FILTER_ERROR_RATE: float = float(os.getenv("EMAIL_FILTER_ERROR_RATE", "0.001"))
+    
+    # User import settings
+    USER_IMPORT_MAX_ROWS: int = int(os.getenv("USER_IMPORT_MAX_ROWS", "20000"))
+    USER_IMPORT_BATCH_SIZE: int = int(os.getenv("USER_IMPORT_BATCH_SIZE", "500"))  # Rows per INSERT + commit
+    USER_IMPORT_HASH_SLICE: int = int(os.getenv("USER_IMPORT_HASH_SLICE", "4"))  # Passwords per pool job
+    
+    # User search settings
+    USER_SEARCH_LOG_SIZE: int = int(os.getenv("USER_SEARCH_LOG_SIZE", "10000"))  # Change log entries kept in Redis
+    
+    # User lookup settings
+    USER_LOOKUP_MAX_IDS: int = int(os.getenv("USER_LOOKUP_MAX_IDS", "500"))  # Ids per GET/POST /api/users batch
+    
+    # Activity tracking settings
+    # Mỗi user được ghi last_active_at tối đa một lần mỗi interval (giây)
+    ACTIVITY_FLUSH_INTERVAL: int = int(os.getenv("ACTIVITY_FLUSH_INTERVAL", "60"))
+    
+    # User stats settings
+    USER_STATS_RECONCILE_INTERVAL: int = int(os.getenv("USER_STATS_RECONCILE_INTERVAL", "3600"))  # Seconds
 
 
 # Singleton settings instance
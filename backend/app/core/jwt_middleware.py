@@ -3,8 +3,8 @@ from fastapi import Request, status
 from fastapi.responses import JSONResponse
 from jose import JWTError
 from core.security import decode_access_token
-from crud.user import get_user
-from database.session import SessionLocal
+from services.auth_service import aresolve_principal
+from cache.activity_tracker import activity_tracker
 import logging
 
 logger = logging.getLogger(__name__)
@@ -23,12 +23,28 @@ IGNORE_PATHS = [
 ]
 
 
+def request_token(request: Request) -> str | None:
+    """Get token from cookie first, then Authorization header"""
+    # Priority 1: HttpOnly cookie
+    cookie_token = request.cookies.get(COOKIE_NAME)
+    if cookie_token:
+        return cookie_token
+    
+    # Priority 2: Authorization header (backward compatible)
+    authorization = request.headers.get("Authorization")
+    if authorization and authorization.startswith("Bearer "):
+        return authorization.split(" ")[1]
+    
+    return None
+
+
 class JWTAuthMiddleware(BaseHTTPMiddleware):
     """
     JWT Authentication Middleware
     
     - Validates JWT token from HttpOnly cookie or Authorization header
-    - Sets request.state.user for authenticated requests
+    - Sets request.state.user (a cached Principal) for authenticated requests
+    - Records user activity in the write-behind tracker (no DB write per request)
     - Returns 401 for invalid/missing tokens
     """
     
@@ -36,18 +52,7 @@ class JWTAuthMiddleware(BaseHTTPMiddleware):
         super().__init__(app)
 
     def _get_token(self, request: Request) -> str | None:
-        """Get token from cookie first, then Authorization header"""
-        # Priority 1: HttpOnly cookie
-        cookie_token = request.cookies.get(COOKIE_NAME)
-        if cookie_token:
-            return cookie_token
-        
-        # Priority 2: Authorization header (backward compatible)
-        authorization = request.headers.get("Authorization")
-        if authorization and authorization.startswith("Bearer "):
-            return authorization.split(" ")[1]
-        
-        return None
+        return request_token(request)
 
     def _should_skip_auth(self, path: str) -> bool:
         """Check if path should skip authentication"""
@@ -74,18 +79,15 @@ class JWTAuthMiddleware(BaseHTTPMiddleware):
                 content={"detail": "Invalid token"},
             )
         
-        # Get user from database with proper session handling
-        db = SessionLocal()
+        # Resolve principal from token claims or cache (database only on cache miss)
         try:
-            user = get_user(db, int(payload["sub"]))
+            user = await aresolve_principal(payload)
         except Exception as e:
             logger.error(f"Error getting user: {e}")
             return JSONResponse(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 content={"detail": "Internal server error"},
             )
-        finally:
-            db.close()
         
         if user is None:
             return JSONResponse(
@@ -95,4 +97,5 @@ class JWTAuthMiddleware(BaseHTTPMiddleware):
         
         # Set user in request state for use in routes
         request.state.user = user
+        activity_tracker.record(user.id)
         return await call_next(request)
\ No newline at end of file
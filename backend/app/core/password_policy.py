@@ -6,6 +6,8 @@ Password validation utilities.
 import re
 from typing import Tuple, List
 
+from core.breached_passwords import breached_passwords
+
 
 class PasswordPolicy:
     """
@@ -72,6 +74,9 @@ def validate_password(password: str) -> Tuple[bool, List[str]]:
     ]
     if password.lower() in weak_passwords:
         errors.append("Password is too common. Please choose a stronger password")
+    elif breached_passwords.contains(password):
+        # Corpus password bị lộ (BREACHED_PASSWORDS_PATH), lookup trên file memory-mapped
+        errors.append("Password has appeared in a data breach. Please choose a different password")
     
     is_valid = len(errors) == 0
     return is_valid, errors
@@ -0,0 +1,333 @@
+"""
+Dedicated process pool cho bcrypt.
+
+bcrypt tốn CPU (~100ms+/lần). Chạy trên anyio threadpool thì một đợt login
+đầu giờ học sẽ chiếm hết thread và giữ GIL, làm chậm mọi endpoint khác.
+Pool này đẩy bcrypt sang các process riêng (dùng hết số core), với hàng đợi
+có giới hạn: quá sâu thì từ chối ngay (429) thay vì để request chờ mãi.
+
+Cost (rounds) được calibrate một lần cho cả deployment: worker calibrate
+đầu tiên (đo thời gian hash, chọn cost lớn nhất vẫn nằm trong
+BCRYPT_TARGET_MS) lưu kết quả vào Redis, các worker khác dùng lại giá trị đó.
+BCRYPT_ROUNDS cố định cost và bỏ qua calibrate. Hash chỉ được rehash khi
+cost thấp hơn target, không bao giờ hạ cost.
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Callable, Optional
+
+from passlib.hash import bcrypt as bcrypt_handler
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+ROUNDS_KEY = "bcrypt:rounds"  # Cost đã calibrate, dùng chung cho mọi worker
+
+
+# WORKER-SIDE FUNCTIONS (chạy trong process con, phải là top-level để pickle được)
+
+_handlers = {}  # rounds -> configured bcrypt handler
+
+
+def _handler(rounds: int):
+    handler = _handlers.get(rounds)
+    if handler is None:
+        handler = _handlers[rounds] = bcrypt_handler.using(rounds=rounds)
+    return handler
+
+
+def _hash_job(password: str, rounds: int) -> str:
+    return _handler(rounds).hash(password)
+
+
+def hash_many_job(passwords: list, rounds: int) -> list:
+    """Hash nhiều password trong một job (bulk import)"""
+    handler = _handler(rounds)
+    return [handler.hash(password) for password in passwords]
+
+
+def _verify_job(password: str, hashed_password: str) -> bool:
+    return bcrypt_handler.verify(password, hashed_password)
+
+
+def _calibrate_job(target_ms: float, min_rounds: int, max_rounds: int) -> int:
+    """
+    Chọn cost lớn nhất có thời gian hash <= target_ms (không nhỏ hơn min_rounds).
+    Mỗi round tăng 1 thì thời gian gấp đôi, nên chỉ cần đo ở min_rounds rồi ngoại suy.
+    """
+    handler = _handler(min_rounds)
+    handler.hash("calibration")  # warm-up
+    samples = []
+    for _ in range(3):
+        start = time.perf_counter()
+        handler.hash("calibration")
+        samples.append((time.perf_counter() - start) * 1000)
+    base_ms = min(samples)
+
+    rounds = min_rounds
+    while rounds < max_rounds and base_ms * 2 ** (rounds + 1 - min_rounds) <= target_ms:
+        rounds += 1
+    return rounds
+
+
+def hash_rounds(hashed_password: str) -> Optional[int]:
+    """Cost của một bcrypt hash ("$2b$12$..." -> 12), None nếu không phải bcrypt"""
+    try:
+        prefix, ident, rounds = hashed_password.split("$", 3)[:3]
+        return int(rounds) if prefix == "" and ident.startswith("2") else None
+    except (AttributeError, ValueError):
+        return None
+
+
+class PasswordPoolBusy(Exception):
+    """
+    Raised khi pool không nhận/không xong job kịp (main.py trả về status_code):
+    hàng đợi đầy -> 429, job quá BCRYPT_POOL_TIMEOUT_SECONDS -> 503
+    """
+
+    def __init__(
+        self,
+        retry_after: int = settings.BCRYPT_RETRY_AFTER_SECONDS,
+        status_code: int = 429,
+        message: str = "Password hashing queue is full",
+    ):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.status_code = status_code
+
+
+class PasswordPoolTimeout(PasswordPoolBusy):
+    """Job không xong trong BCRYPT_POOL_TIMEOUT_SECONDS (503)"""
+
+    def __init__(self, retry_after: int = settings.BCRYPT_RETRY_AFTER_SECONDS):
+        super().__init__(retry_after, status_code=503, message="Password hashing timed out")
+
+
+class PasswordHashPool:
+    """
+    Bounded process pool cho hash/verify password.
+
+    - Pool được tạo bằng start() lúc app khởi động (lifespan), hoặc lazily ở
+      lần dùng đầu tiên (script); không fork khi import
+    - Process con dùng forkserver/spawn, không fork: fork từ một thread của
+      threadpool có thể copy lock đang bị thread khác giữ vào process con
+    - `pending` = job đã nhận nhưng chưa xong (đang chạy + đang chờ);
+      vượt quá max_workers + max_queue thì raise PasswordPoolBusy
+    - workers = 0: chạy inline trên thread gọi (dev/test)
+    """
+
+    LATENCY_SAMPLES = 1024
+
+    def __init__(
+        self,
+        workers: int = settings.BCRYPT_POOL_WORKERS,
+        max_queue: int = settings.BCRYPT_POOL_MAX_QUEUE,
+        timeout: float = settings.BCRYPT_POOL_TIMEOUT_SECONDS,
+    ):
+        self.workers = workers if workers >= 0 else (os.cpu_count() or 1)
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._executor = None
+        self._lock = threading.Lock()
+        self._rounds = settings.BCRYPT_ROUNDS or None  # None = chưa calibrate
+        self._calibration_lock = threading.Lock()
+
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.failed = 0
+        self.timeouts = 0
+        self._latencies = deque(maxlen=self.LATENCY_SAMPLES)  # ms, submit -> result
+
+    @property
+    def capacity(self) -> int:
+        return max(self.workers, 1) + self.max_queue
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context(method),
+            )
+            logger.info(f"Password hash pool started with {self.workers} workers ({method})")
+        return self._executor
+
+    def start(self) -> None:
+        """Tạo process pool trước khi nhận request (gọi từ lifespan)"""
+        if self.workers == 0:
+            return
+        with self._lock:
+            self._get_executor()
+
+    def submit(self, fn: Callable, *args) -> Future:
+        """Đưa job vào pool. Raise PasswordPoolBusy nếu hàng đợi đầy."""
+        with self._lock:
+            if self.pending >= self.capacity:
+                self.rejected += 1
+                raise PasswordPoolBusy()
+            self.pending += 1
+            submitted_at = time.perf_counter()
+
+            if self.workers == 0:
+                future = Future()
+            else:
+                try:
+                    future = self._get_executor().submit(fn, *args)
+                except Exception:
+                    self.pending -= 1
+                    raise
+
+        def on_done(f: Future):
+            with self._lock:
+                self.pending -= 1
+                if f.cancelled() or f.exception() is not None:
+                    self.failed += 1
+                else:
+                    self.completed += 1
+                    self._latencies.append((time.perf_counter() - submitted_at) * 1000)
+
+        future.add_done_callback(on_done)
+
+        if self.workers == 0:
+            try:
+                future.set_result(fn(*args))
+            except Exception as e:
+                future.set_exception(e)
+        return future
+
+    def _timed_out(self) -> PasswordPoolTimeout:
+        with self._lock:
+            self.timeouts += 1
+        return PasswordPoolTimeout()
+
+    def run(self, fn: Callable, *args):
+        """Sync: chờ kết quả (dùng trong sync route/crud chạy trên threadpool)"""
+        future = self.submit(fn, *args)
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            future.cancel()  # Bỏ job nếu chưa chạy
+            raise self._timed_out() from None
+
+    async def run_async(self, fn: Callable, *args):
+        """Async: chờ kết quả mà không chiếm thread nào"""
+        future = self.submit(fn, *args)
+        try:
+            # wait_for hủy wrapper khi hết giờ, wrapper hủy luôn job nếu chưa chạy
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            raise self._timed_out() from None
+
+    def _resolve_rounds(self) -> int:
+        """Cost chung của deployment trong Redis; chưa có thì calibrate rồi lưu (SET NX)"""
+        # Import tại chỗ: process con của pool import module này, không cần Redis
+        from cache.redis_client import redis_client, is_redis_available
+
+        if is_redis_available:
+            try:
+                stored = redis_client.get(ROUNDS_KEY)
+                if stored:
+                    return int(stored)
+            except Exception as e:
+                logger.warning(f"Reading bcrypt cost from Redis failed: {e}")
+
+        rounds = self.run(
+            _calibrate_job,
+            settings.BCRYPT_TARGET_MS,
+            settings.BCRYPT_MIN_ROUNDS,
+            settings.BCRYPT_MAX_ROUNDS,
+        )
+        logger.info(f"bcrypt cost calibrated to {rounds} (target {settings.BCRYPT_TARGET_MS}ms)")
+        if not is_redis_available:
+            logger.warning("bcrypt cost calibrated per worker (no Redis); set BCRYPT_ROUNDS to pin it")
+            return rounds
+        try:
+            # Worker khác calibrate xong trước thì dùng giá trị của worker đó
+            if not redis_client.set(ROUNDS_KEY, rounds, nx=True):
+                rounds = int(redis_client.get(ROUNDS_KEY) or rounds)
+        except Exception as e:
+            logger.warning(f"Storing bcrypt cost in Redis failed: {e}")
+        return rounds
+
+    @property
+    def rounds(self) -> int:
+        """Target cost: BCRYPT_ROUNDS, hoặc cost chung của deployment (resolve ở lần dùng đầu tiên)"""
+        if self._rounds is None:
+            with self._calibration_lock:
+                if self._rounds is None:
+                    self._rounds = self._resolve_rounds()
+        return self._rounds
+
+    def needs_rehash(self, hashed_password: str) -> bool:
+        """True nếu hash có cost thấp hơn target (không bao giờ hạ cost)"""
+        rounds = hash_rounds(hashed_password)
+        return rounds is None or rounds < self.rounds
+
+    async def aneeds_rehash(self, hashed_password: str) -> bool:
+        target = self._rounds or await asyncio.to_thread(lambda: self.rounds)
+        rounds = hash_rounds(hashed_password)
+        return rounds is None or rounds < target
+
+    def hash(self, password: str) -> str:
+        return self.run(_hash_job, password, self.rounds)
+
+    def verify(self, password: str, hashed_password: str) -> bool:
+        return self.run(_verify_job, password, hashed_password)
+
+    async def ahash(self, password: str) -> str:
+        rounds = self._rounds or await asyncio.to_thread(lambda: self.rounds)
+        return await self.run_async(_hash_job, password, rounds)
+
+    async def averify(self, password: str, hashed_password: str) -> bool:
+        return await self.run_async(_verify_job, password, hashed_password)
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> dict:
+        with self._lock:
+            samples = sorted(self._latencies)
+        def pct(p):
+            return round(samples[min(len(samples) - 1, int(len(samples) * p))], 2) if samples else 0.0
+        return {
+            "workers": self.workers,
+            "rounds": self._rounds,
+            "queue_depth": max(0, self.pending - max(self.workers, 1)),
+            "pending": self.pending,
+            "capacity": self.capacity,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "failed": self.failed,
+            "timeouts": self.timeouts,
+            "latency_ms_p50": pct(0.5),
+            "latency_ms_p95": pct(0.95),
+        }
+
+
+# Singleton pool for this worker
+password_pool = PasswordHashPool()
+
+
+if __name__ == "__main__":
+    # Xem cost nào phù hợp với máy này: cd backend/app && python -m core.password_pool
+    target = settings.BCRYPT_TARGET_MS
+    for r in range(settings.BCRYPT_MIN_ROUNDS, settings.BCRYPT_MAX_ROUNDS + 1):
+        start = time.perf_counter()
+        _hash_job("calibration", r)
+        elapsed = (time.perf_counter() - start) * 1000
+        print(f"rounds={r:<3}{elapsed:>9.1f}ms")
+        if elapsed > target * 4:
+            break
+    print(f"calibrated for target {target}ms: rounds={_calibrate_job(target, settings.BCRYPT_MIN_ROUNDS, settings.BCRYPT_MAX_ROUNDS)}")
@@ -0,0 +1,33 @@
+"""
+Permission flags và quyền mặc định theo role.
+
+Mỗi role được compile thành một bitmask (cache.role_registry) nên kiểm tra
+quyền chỉ là một phép AND trên role_id, không cần đọc relationship ORM.
+"""
+
+from enum import IntFlag
+
+
+class Permission(IntFlag):
+    """Permission bits"""
+    NONE = 0
+    VIEW_CONTENT = 1 << 0     # Xem nội dung học tập
+    SUBMIT_WORK = 1 << 1      # Nộp bài tập
+    MANAGE_CONTENT = 1 << 2   # Quản lý nội dung giảng dạy, bài tập
+    VIEW_STUDENTS = 1 << 3    # Theo dõi sinh viên
+    MANAGE_USERS = 1 << 4     # Quản lý users
+    MANAGE_ROLES = 1 << 5     # Quản lý roles
+    MANAGE_SYSTEM = 1 << 6    # Full quyền hệ thống (metrics, cấu hình...)
+
+
+ALL_PERMISSIONS = Permission(sum(Permission))
+
+# Quyền theo tên role; role không có trong đây (tạo thêm qua create_role) không có quyền nào
+ROLE_PERMISSIONS = {
+    "admin": ALL_PERMISSIONS,
+    "teacher": Permission.VIEW_CONTENT | Permission.MANAGE_CONTENT | Permission.VIEW_STUDENTS,
+    "student": Permission.VIEW_CONTENT | Permission.SUBMIT_WORK,
+}
+
+# Role dùng cho user chưa được gán role (giống User.role_name)
+DEFAULT_ROLE_NAME = "student"
@@ -1,47 +1,534 @@
+"""
+Per-client rate limiting.
+
+RateLimitMiddleware áp dụng các quota policy khai báo trong QUOTA_POLICIES:
+mỗi request được phân loại theo route class (auth, write, read, export) và
+phải qua mọi policy của class đó; mỗi policy đếm theo IP, theo user (JWT
+sub) hoặc cả hai, với limit/window/burst riêng.
+
+- Policy theo IP: middleware ngoài cùng của main app (mọi request)
+- Policy theo user: middleware trong protected app, sau JWTAuthMiddleware,
+  dùng principal đã resolve (request.state.user); request chưa đăng nhập
+  chỉ chịu policy theo IP
+- Request bị một policy từ chối được hoàn token cho các policy đã cho qua:
+  retry bị chặn không làm cạn quota khác
+
+GCRALimiter (mặc định): limit dùng chung giữa mọi worker qua Redis.
+- GCRA (token bucket dạng "theoretical arrival time"): mỗi key chỉ là một
+  số trong Redis, kiểm tra + cập nhật là một Lua script atomic (async
+  client, không block event loop)
+- Worker giữ một lease vài token cho key đang gửi liên tục, nên phần lớn
+  request của client "nóng" không cần round trip; tổng số token cấp ra
+  không bao giờ vượt limit
+- Redis lỗi / không có: fallback về SlidingWindowLimiter in-process
+
+SlidingWindowLimiter: sliding-window counter, mỗi client chỉ giữ 4 số
+(window hiện tại, count window hiện tại, count window trước, lần cuối thấy)
+thay vì list timestamp. Số request trong cửa sổ trượt được ước lượng bằng
+    previous * (phần window trước còn nằm trong cửa sổ) + current
+
+- Client idle được evict dần (vài key mỗi request, amortized O(1)), tổng số
+  key bị chặn bởi RATE_LIMIT_MAX_KEYS: memory không tăng theo số IP từng gặp
+- State chỉ được chạm từ event loop nên không cần lock
+"""
+
+import logging
+import math
+import re
+import time
+from collections import OrderedDict
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
 from starlette.middleware.base import BaseHTTPMiddleware
 from fastapi import Request
 from fastapi.responses import JSONResponse
-import time
-from collections import defaultdict
-from threading import Lock
+from cache.redis_client import async_redis_client, is_redis_available
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimitResult(NamedTuple):
+    allowed: bool
+    retry_after: float  # Giây đến khi được gửi tiếp (0 khi allowed)
+    remaining: int      # Số request còn được gửi ngay
+    reset: float        # Giây đến khi quota hồi đầy
+
+
+# Index trong state list của mỗi key
+_WINDOW, _CURRENT, _PREVIOUS, _SEEN = range(4)
+
+
+class SlidingWindowLimiter:
+    """
+    Sliding-window counter limiter, keyed by client.
+    Key được giữ theo thứ tự lần cuối thấy (OrderedDict) nên key idle lâu
+    nhất luôn ở đầu: eviction chỉ cần nhìn vài key đầu tiên.
+    """
+
+    EVICT_PER_HIT = 2  # Số key idle tối đa bị evict mỗi request
+
+    def __init__(self, limit: int, window: float = 1.0, max_keys: int = settings.RATE_LIMIT_MAX_KEYS):
+        self.limit = limit
+        self.window = window
+        self.max_keys = max_keys
+        self._state: "OrderedDict[str, list]" = OrderedDict()
+
+        self.allowed = 0
+        self.rejected = 0
+        self.evicted = 0
+
+    def hit(self, key: str, now: Optional[float] = None) -> RateLimitResult:
+        """Ghi nhận một request của key"""
+        if now is None:
+            now = time.monotonic()
+        window = self.window
+        window_start = now - now % window
+
+        state = self._state.get(key)
+        if state is None:
+            state = self._state[key] = [window_start, 0, 0, now]
+        else:
+            self._state.move_to_end(key)
+            state[_SEEN] = now
+            if state[_WINDOW] != window_start:
+                # Sang window mới: count hiện tại thành count window trước (nếu liền kề)
+                state[_PREVIOUS] = state[_CURRENT] if window_start - state[_WINDOW] <= window else 0
+                state[_CURRENT] = 0
+                state[_WINDOW] = window_start
+        self._evict(now)
+
+        elapsed = now - window_start
+        previous_weight = state[_PREVIOUS] * (1 - elapsed / window)
+        # Quota hồi đầy khi cả window hiện tại trượt ra khỏi cửa sổ
+        reset = 2 * window - elapsed if state[_CURRENT] else window - elapsed
+        if previous_weight + state[_CURRENT] < self.limit:
+            state[_CURRENT] += 1
+            self.allowed += 1
+            remaining = int(self.limit - previous_weight - state[_CURRENT])
+            return RateLimitResult(True, 0.0, max(remaining, 0), 2 * window - elapsed)
+
+        self.rejected += 1
+        return RateLimitResult(False, self._retry_after(state, elapsed), 0, reset)
+
+    def refund(self, key: str) -> None:
+        """Hoàn request vừa được cho qua (request bị policy khác từ chối)"""
+        state = self._state.get(key)
+        if state is not None and state[_CURRENT] > 0:
+            state[_CURRENT] -= 1
+            self.allowed -= 1
+
+    def _retry_after(self, state: list, elapsed: float) -> float:
+        """Thời gian đến khi ước lượng xuống dưới limit (nếu không có request mới)"""
+        window = self.window
+        if state[_CURRENT] >= self.limit or not state[_PREVIOUS]:
+            # Phải chờ sang window sau; khi đó current thành previous
+            room = self.limit - 1
+            wait = window - elapsed
+            if state[_CURRENT] > room:
+                wait += window * (1 - room / state[_CURRENT])
+            return wait
+        # Chờ phần window trước trượt ra đủ
+        needed = 1 - (self.limit - 1 - state[_CURRENT]) / state[_PREVIOUS]
+        return max(window * needed - elapsed, 0.0)
+
+    def _evict(self, now: float) -> None:
+        state = self._state
+        idle_before = now - 2 * self.window  # Không còn ảnh hưởng tới ước lượng
+        for _ in range(self.EVICT_PER_HIT):
+            oldest = next(iter(state.values()))
+            if oldest[_SEEN] > idle_before and len(state) <= self.max_keys:
+                return
+            state.popitem(last=False)
+            self.evicted += 1
+
+    def stats(self) -> dict:
+        return {
+            "keys": len(self._state),
+            "allowed": self.allowed,
+            "rejected": self.rejected,
+            "evicted": self.evicted,
+        }
+
+
+# KEYS: bucket | ARGV: emission interval (ms), burst tolerance (ms), tokens requested
+# Bucket lưu TAT (theoretical arrival time, ms theo đồng hồ Redis).
+# Cấp tối đa số token đang có (<= requested).
+# Returns {granted, remaining | retry_after_ms (khi granted = 0), reset_ms}
+_GCRA_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local interval = tonumber(ARGV[1])
+local tolerance = tonumber(ARGV[2])
+local tat = tonumber(redis.call('GET', KEYS[1]) or now)
+if tat < now then
+    tat = now
+end
+local available = math.floor((now + tolerance - tat) / interval)
+local granted = math.min(tonumber(ARGV[3]), available)
+if granted <= 0 then
+    return {0, math.ceil(tat - tolerance + interval - now), math.ceil(tat - now)}
+end
+tat = tat + granted * interval
+redis.call('SET', KEYS[1], tat, 'PX', math.max(math.ceil(tat - now), 1))
+return {granted, available - granted, math.ceil(tat - now)}
+"""
+
+# Index trong lease list của mỗi key
+_TOKENS, _EXPIRES, _BATCH, _REMAINING, _RESET_AT, _BLOCKED_UNTIL = range(6)
+
+
+class GCRALimiter:
+    """
+    Distributed GCRA limiter: `limit` request mỗi `window` giây cho mỗi key,
+    dùng chung giữa các worker (Redis), burst tối đa `burst` (mặc định = limit).
+
+    Lease: khi key gửi liên tục, worker xin dần 1, 2, 4... (tối đa local_batch)
+    token mỗi lần gọi Redis và tiêu local. Token chưa dùng hết hạn sau một
+    window (client chỉ bị chặt hơn một chút, không bao giờ lỏng hơn limit).
+    Key bị từ chối được nhớ local đến hết Retry-After: client spam không tốn
+    round trip cho mỗi request bị chặn.
+    """
+
+    EVICT_PER_HIT = 2
+    REDIS_RETRY_SECONDS = 5  # Sau lỗi Redis, dùng fallback bấy nhiêu giây rồi thử lại
+
+    def __init__(
+        self,
+        limit: int,
+        window: float = 1.0,
+        name: str = "default",
+        burst: Optional[int] = None,
+        local_batch: int = settings.RATE_LIMIT_LOCAL_BATCH,
+        max_keys: int = settings.RATE_LIMIT_MAX_KEYS,
+        use_redis: bool = is_redis_available,
+    ):
+        self.limit = limit
+        self.window = window
+        self.prefix = f"ratelimit:{name}:"
+        self.burst = burst or limit
+        # Quota nhỏ (vd. login): lease lớn sẽ giữ phần lớn quota ở một worker
+        self.local_batch = max(1, min(local_batch, self.burst // 4))
+        self.max_keys = max_keys
+        self._interval_ms = window * 1000 / limit
+        self._tolerance_ms = self._interval_ms * self.burst
+        self._leases: "OrderedDict[str, list]" = OrderedDict()
+        # Fallback giữ cùng burst và tốc độ trung bình (burst request mỗi burst/limit window)
+        self._fallback = SlidingWindowLimiter(self.burst, window * self.burst / limit, max_keys)
+        self._use_redis = use_redis
+        self._redis_down_until = 0.0
+        if use_redis:
+            self._script = async_redis_client.register_script(_GCRA_SCRIPT)
+
+        self.local_hits = 0
+        self.redis_calls = 0
+        self.allowed = 0
+        self.rejected = 0
+        self.fallbacks = 0
+
+    async def hit(self, key: str, now: Optional[float] = None) -> RateLimitResult:
+        if now is None:
+            now = time.monotonic()
+        if not self._use_redis or now < self._redis_down_until:
+            self.fallbacks += 1
+            return self._fallback.hit(key, now)
+
+        lease = self._leases.get(key)
+        if lease is not None:
+            self._leases.move_to_end(key)
+            if lease[_TOKENS] > 0 and lease[_EXPIRES] > now:
+                lease[_TOKENS] -= 1
+                self.local_hits += 1
+                self.allowed += 1
+                return RateLimitResult(True, 0.0, lease[_REMAINING] + lease[_TOKENS], max(lease[_RESET_AT] - now, 0.0))
+            if lease[_BLOCKED_UNTIL] > now:
+                self.local_hits += 1
+                self.rejected += 1
+                return RateLimitResult(False, lease[_BLOCKED_UNTIL] - now, 0, max(lease[_RESET_AT] - now, 0.0))
+        self._evict(now)
+
+        # Key vẫn đang gửi (lease còn gần đây): xin batch gấp đôi lần trước
+        recent = lease is not None and lease[_EXPIRES] > now - self.window
+        batch = min(lease[_BATCH] * 2, self.local_batch) if recent else 1
+        try:
+            granted, value, reset_ms = await self._script(
+                keys=[self.prefix + key], args=[self._interval_ms, self._tolerance_ms, batch]
+            )
+        except Exception as e:
+            logger.error(f"Rate limit Redis error, using in-process limits: {e}")
+            self._redis_down_until = now + self.REDIS_RETRY_SECONDS
+            self.fallbacks += 1
+            return self._fallback.hit(key, now)
+        self.redis_calls += 1
+
+        reset = int(reset_ms) / 1000
+        # Request khác cùng key có thể đã đổi lease trong lúc chờ Redis
+        lease = self._leases.get(key)
+        if lease is None:
+            lease = self._leases[key] = [0, 0.0, 1, 0, 0.0, 0.0]
+        lease[_RESET_AT] = now + reset
+        if int(granted) <= 0:
+            self.rejected += 1
+            retry_after = int(value) / 1000
+            lease[_TOKENS] = 0
+            lease[_EXPIRES] = now + retry_after
+            lease[_BLOCKED_UNTIL] = now + retry_after
+            return RateLimitResult(False, retry_after, 0, reset)
+
+        tokens = int(granted) - 1
+        lease[_TOKENS] = tokens
+        lease[_EXPIRES] = now + self.window
+        lease[_BATCH] = batch
+        lease[_REMAINING] = int(value)
+        self.allowed += 1
+        return RateLimitResult(True, 0.0, int(value) + tokens, reset)
+
+    def refund(self, key: str, now: Optional[float] = None) -> None:
+        """
+        Hoàn request vừa được cho qua: token trả về lease local của key (token
+        đó đã được trừ trong Redis, worker này vẫn giữ đến hết lease).
+        """
+        if now is None:
+            now = time.monotonic()
+        if not self._use_redis or now < self._redis_down_until:
+            self._fallback.refund(key)
+            return
+        lease = self._leases.get(key)
+        if lease is not None and lease[_EXPIRES] > now:
+            lease[_TOKENS] += 1
+            self.allowed -= 1
+
+    def _evict(self, now: float) -> None:
+        leases = self._leases
+        for _ in range(self.EVICT_PER_HIT):
+            if not leases:
+                return
+            oldest = next(iter(leases.values()))
+            if oldest[_EXPIRES] > now - self.window and len(leases) <= self.max_keys:
+                return
+            leases.popitem(last=False)
+
+    def stats(self) -> dict:
+        return {
+            "backend": "redis" if self._use_redis and time.monotonic() >= self._redis_down_until else "local",
+            "leases": len(self._leases),
+            "allowed": self.allowed,
+            "rejected": self.rejected,
+            "local_hits": self.local_hits,
+            "redis_calls": self.redis_calls,
+            "fallbacks": self.fallbacks,
+            "local": self._fallback.stats(),
+        }
+
+
+class QuotaPolicy:
+    """
+    Quota cho một route class.
+
+    - name: tên policy (Redis key prefix, metrics)
+    - route_class: auth / write / read / export (xem classify_route)
+    - key: "ip", "sub" (user đã xác thực) hoặc "ip+sub"; policy có sub chỉ
+      áp dụng cho request đã có principal, request chưa đăng nhập bỏ qua
+    - limit / window: số request mỗi window giây (tốc độ hồi quota)
+    - burst: số request tối đa gửi dồn (mặc định = limit)
+    """
+
+    KEYS = ("ip", "sub", "ip+sub")
+
+    def __init__(self, name: str, route_class: str, key: str, limit: int, window: float = 1.0,
+                 burst: Optional[int] = None, use_redis: bool = is_redis_available):
+        if key not in self.KEYS:
+            raise ValueError(f"Unknown quota key: {key}")
+        self.name = name
+        self.route_class = route_class
+        self.key = key
+        self.limit = limit
+        self.window = window
+        self.burst = burst or limit
+        self.limiter = GCRALimiter(limit=limit, window=window, name=name, burst=self.burst, use_redis=use_redis)
+
+    @property
+    def per_principal(self) -> bool:
+        return self.key != "ip"
+
+    def client_key(self, ip: str, sub: Optional[str]) -> str:
+        if self.key == "ip":
+            return ip
+        if self.key == "sub":
+            return f"u:{sub}"
+        return f"{ip}|u:{sub}"
+
+    @property
+    def header(self) -> str:
+        return f"{self.limit};w={self.window:g};burst={self.burst}"
+
+
+# Path bcrypt (login, tạo user): rẻ với attacker, đắt với server
+AUTH_PATHS = ("/auth/login", "/auth/register", "/auth/create")
+# Bulk export/import
+EXPORT_PATTERN = re.compile(r"/(export|import)(/|$)")
+
+
+def classify_route(method: str, path: str) -> str:
+    """Route class của request (path đầy đủ, kể cả prefix /api)"""
+    if path.startswith(AUTH_PATHS):
+        return "auth"
+    if EXPORT_PATTERN.search(path):
+        return "export"
+    if method in ("GET", "HEAD", "OPTIONS"):
+        return "read"
+    return "write"
+
+
+# Quota mặc định. Request phải qua mọi policy của route class.
+# Quota theo user là chính; quota theo IP chỉ là trần rộng cho cả NAT (một trường học).
+QUOTA_POLICIES = [
+    QuotaPolicy("auth-ip", "auth", key="ip", limit=120, window=60, burst=60),
+    QuotaPolicy("read-user", "read", key="sub", limit=20, window=1, burst=40),
+    QuotaPolicy("read-ip", "read", key="ip", limit=300, window=1, burst=600),
+    QuotaPolicy("write-user", "write", key="sub", limit=10, window=1, burst=20),
+    QuotaPolicy("write-ip", "write", key="ip", limit=100, window=1, burst=200),
+    QuotaPolicy("export-user", "export", key="sub", limit=5, window=60, burst=3),
+]
+
+
+class QuotaLimiter:
+    """Áp dụng các QuotaPolicy, giữ số liệu allowed/rejected theo policy"""
+
+    def __init__(self, policies: List[QuotaPolicy]):
+        self.policies = policies
+        # (route class, per principal) -> policies
+        self._by_class: Dict[Tuple[str, bool], List[QuotaPolicy]] = {}
+        for policy in policies:
+            self._by_class.setdefault((policy.route_class, policy.per_principal), []).append(policy)
+        # Theo policy, tính cả khi limiter đang fallback in-process
+        self.checked: Dict[str, int] = {policy.name: 0 for policy in policies}
+        self.rejected: Dict[str, int] = {policy.name: 0 for policy in policies}
+
+    def _policies(self, route_class: str, sub: Optional[str]) -> List[QuotaPolicy]:
+        """sub None: policies theo IP; có sub: policies theo user (sub, ip+sub)"""
+        return self._by_class.get((route_class, sub is not None), [])
+
+    async def check(self, route_class: str, ip: str, sub: Optional[str] = None) -> Tuple[Optional[QuotaPolicy], Optional[RateLimitResult]]:
+        """
+        Áp dụng policies theo IP (sub None) hoặc theo user của route class.
+        Returns (policy, result) của policy quyết định: policy từ chối request,
+        hoặc policy còn ít quota nhất khi mọi policy đều cho qua.
+        (None, None) nếu route class không có policy.
+
+        Bị từ chối thì các policy đã cho qua được hoàn token.
+        """
+        decisive, decisive_result = None, None
+        passed = []
+        for policy in self._policies(route_class, sub):
+            self.checked[policy.name] += 1
+            key = policy.client_key(ip, sub)
+            result = await policy.limiter.hit(key)
+            if not result.allowed:
+                self.rejected[policy.name] += 1
+                for passed_policy, passed_key in passed:
+                    passed_policy.limiter.refund(passed_key)
+                return policy, result
+            passed.append((policy, key))
+            if decisive_result is None or result.remaining < decisive_result.remaining:
+                decisive, decisive_result = policy, result
+        return decisive, decisive_result
+
+    def refund(self, route_class: str, ip: str, sub: Optional[str] = None) -> None:
+        """Hoàn token của một check() đã cho qua (request bị policy theo user từ chối sau đó)"""
+        for policy in self._policies(route_class, sub):
+            policy.limiter.refund(policy.client_key(ip, sub))
+
+    def stats(self) -> dict:
+        return {
+            policy.name: {
+                "route_class": policy.route_class,
+                "key": policy.key,
+                "policy": policy.header,
+                "checked": self.checked[policy.name],
+                "rejected": self.rejected[policy.name],
+                "limiter": policy.limiter.stats(),
+            }
+            for policy in self.policies
+        }
+
+
+# Singleton limiter instance (metrics đọc từ đây)
+quota_limiter = QuotaLimiter(QUOTA_POLICIES)
+
+
+def rate_limit_headers(policy: QuotaPolicy, result: RateLimitResult) -> dict:
+    """RateLimit-* headers (IETF draft) + Retry-After khi bị từ chối"""
+    headers = {
+        "RateLimit-Limit": str(policy.burst),
+        "RateLimit-Remaining": str(result.remaining),
+        "RateLimit-Reset": str(math.ceil(result.reset)),
+        "RateLimit-Policy": policy.header,
+    }
+    if not result.allowed:
+        headers["Retry-After"] = str(max(1, math.ceil(result.retry_after)))
+    return headers
+
 
 class RateLimitMiddleware(BaseHTTPMiddleware):
-    def __init__(self, app, requests_per_second=10):
+    """
+    Rate Limit Middleware
+
+    - Phân loại request theo route class, áp dụng quota policy của class đó
+    - per_principal=False (main app, ngoài cùng): policies theo IP cho mọi request
+    - per_principal=True (protected app, sau JWTAuthMiddleware): policies theo
+      user, key lấy từ principal JWT middleware đã resolve (request.state.user),
+      không decode token lại; request chưa có principal bỏ qua
+    - Limit dùng chung giữa mọi worker (Redis), fallback in-process
+    - Returns 429 + Retry-After; mọi response có RateLimit-* headers của
+      policy còn ít quota nhất
+    """
+
+    IGNORE_PATHS = ["/api/docs", "/docs", "/openapi.json", "/health"]
+
+    def __init__(self, app, limiter: QuotaLimiter = None, per_principal: bool = False):
         super().__init__(app)
-        self.requests_per_second = requests_per_second
-        self.requests = defaultdict(list)
-        self.lock = Lock()
-        
+        self.limiter = limiter or quota_limiter
+        self.per_principal = per_principal
+
     async def dispatch(self, request: Request, call_next):
-        # Get client identifier (IP hoặc user ID from token)
-        client_id = request.client.host if request.client else "unknown"
-        
-        # Bỏ qua rate limit cho một số paths
-        ignore_paths = ["/api/docs", "/docs", "/openapi.json", "/health"]
-        if any(request.url.path.startswith(path) for path in ignore_paths):
+        path = request.url.path
+        if any(path.startswith(p) for p in self.IGNORE_PATHS):
             return await call_next(request)
-        
-        current_time = time.time()
-        
-        with self.lock:
-            # Clean old requests (older than 1 second)
-            self.requests[client_id] = [
-                req_time for req_time in self.requests[client_id]
-                if current_time - req_time < 1.0
-            ]
-            
-            # Check rate limit
-            if len(self.requests[client_id]) >= self.requests_per_second:
-                return JSONResponse(
-                    status_code=429,
-                    content={
-                        "detail": "Too many requests. Please slow down.",
-                        "retry_after": 1
-                    }
-                )
-            
-            # Add current request
-            self.requests[client_id].append(current_time)
-        
+
+        sub = None
+        if self.per_principal:
+            user = getattr(request.state, "user", None)
+            if user is None:
+                return await call_next(request)
+            sub = str(user.id)
+
+        ip = request.client.host if request.client else "unknown"
+        route_class = classify_route(request.method, path)
+        policy, result = await self.limiter.check(route_class, ip, sub)
+        if policy is None:
+            return await call_next(request)
+
+        headers = rate_limit_headers(policy, result)
+        if not result.allowed:
+            # Middleware theo IP (ngoài) hoàn token của request này
+            request.state.rate_limited = True
+            return JSONResponse(
+                status_code=429,
+                content={
+                    "detail": "Too many requests. Please slow down.",
+                    "retry_after": int(headers["Retry-After"]),
+                    "policy": policy.name,
+                },
+                headers=headers,
+            )
+
         response = await call_next(request)
+        if not self.per_principal and getattr(request.state, "rate_limited", False):
+            # Policy theo user đã từ chối: không tính request vào quota IP
+            self.limiter.refund(route_class, ip)
+            return response
+        remaining = response.headers.get("RateLimit-Remaining")
+        if remaining is None or result.remaining < int(remaining):
+            response.headers.update(headers)
         return response
@@ -0,0 +1,136 @@
+from starlette.middleware.base import BaseHTTPMiddleware
+from fastapi import Request, Response
+from cache.response_cache import response_cache, make_etag
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+# Route headers không được copy: body được dựng lại từ cache (length/encoding),
+# media_type lưu riêng, cookie không được replay cho các HIT sau
+_SKIP_HEADERS = {b"content-length", b"content-encoding", b"transfer-encoding", b"content-type", b"set-cookie"}
+# Header do cache đặt, thay thế giá trị của route
+_CACHE_HEADERS = {"etag", "cache-control", "vary", "x-cache"}
+
+
+class CacheRule:
+    """
+    Opt-in rule for a cacheable GET route.
+
+    - pattern: regex matched against the request path
+    - tags: function (match, principal) -> list of invalidation tags
+    - per_principal: key entries by principal; skip caching when unauthenticated
+    """
+
+    def __init__(self, pattern: str, tags, per_principal: bool = True):
+        self.pattern = re.compile(pattern)
+        self.tags = tags
+        self.per_principal = per_principal
+
+
+# Opted-in routes. Paths inside the mounted /api app may or may not keep the prefix.
+CACHE_RULES = [
+    CacheRule(r"^/auth/roles$", lambda m, user: ["roles"], per_principal=False),
+    CacheRule(r"^(/api)?/users/me$", lambda m, user: [f"user:{user.id}", "roles"]),
+    CacheRule(r"^(/api)?/users/(?P<user_id>\d+)$", lambda m, user: [f"user:{m['user_id']}", "roles"]),
+    CacheRule(r"^(/api)?/bootstrap$", lambda m, user: [f"user:{user.id}", "roles"]),
+]
+
+
+class ResponseCacheMiddleware(BaseHTTPMiddleware):
+    """
+    Response Cache Middleware
+
+    - Serves opted-in GET routes from the two-level response cache
+    - Adds strong ETags and answers If-None-Match with 304
+    - Must run inside JWTAuthMiddleware so request.state.user is available
+    """
+
+    def __init__(self, app, rules: list = None):
+        super().__init__(app)
+        self.rules = rules if rules is not None else CACHE_RULES
+
+    def _match_rule(self, path: str):
+        for rule in self.rules:
+            match = rule.pattern.match(path)
+            if match:
+                return rule, match
+        return None, None
+
+    async def dispatch(self, request: Request, call_next):
+        if request.method != "GET":
+            return await call_next(request)
+
+        path = request.url.path
+        rule, match = self._match_rule(path)
+        if rule is None:
+            return await call_next(request)
+
+        user = getattr(request.state, "user", None)
+        if rule.per_principal and user is None:
+            return await call_next(request)
+
+        key = response_cache.build_key(
+            request.method,
+            path,
+            str(request.query_params),
+            str(user.id) if rule.per_principal else None,
+        )
+
+        try:
+            entry = await response_cache.aget(key)
+            if entry is not None:
+                return self._respond(request, entry, "HIT")
+            tag_versions = await response_cache.atag_versions(rule.tags(match, user))
+        except Exception as e:
+            logger.error(f"Response cache lookup error: {e}")
+            return await call_next(request)
+
+        response = await call_next(request)
+        if response.status_code != 200:
+            return response
+
+        body = b"".join([chunk async for chunk in response.body_iterator])
+        entry = {
+            "etag": make_etag(body),
+            "body": body.decode("utf-8"),
+            "media_type": response.headers.get("content-type", "application/json"),
+            "headers": [
+                [name.decode("latin-1"), value.decode("latin-1")]
+                for name, value in response.headers.raw
+                if name.lower() not in _SKIP_HEADERS
+            ],
+        }
+        try:
+            await response_cache.aput(key, entry, tag_versions)
+        except Exception as e:
+            logger.error(f"Response cache store error: {e}")
+
+        cached = self._respond(request, entry, "MISS")
+        # Cookie của route chỉ gửi trong response gốc
+        for name, value in response.headers.raw:
+            if name.lower() == b"set-cookie":
+                cached.raw_headers.append((name, value))
+        return cached
+
+    @staticmethod
+    def _respond(request: Request, entry: dict, cache_status: str) -> Response:
+        etag = entry["etag"]
+        headers = {
+            "ETag": etag,
+            "Cache-Control": "private, no-cache",
+            "Vary": "Cookie, Authorization",
+            "X-Cache": cache_status,
+        }
+
+        if_none_match = request.headers.get("If-None-Match")
+        if if_none_match:
+            candidates = [tag.strip() for tag in if_none_match.split(",")]
+            if etag in candidates or "*" in candidates:
+                return Response(status_code=304, headers=headers)
+
+        response = Response(content=entry["body"], media_type=entry["media_type"], headers=headers)
+        for name, value in entry.get("headers", ()):
+            if name.lower() not in _CACHE_HEADERS:
+                response.headers.append(name, value)
+        return response
@@ -1,21 +1,45 @@
+import base64
+import hashlib
+import hmac
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta, timezone
 from typing import Optional
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 from core.config import settings
+from core.password_pool import password_pool
+from core.serialization import loads
+from core.server_timing import timed
 
 # Secret key (in production, use env var)
 SECRET_KEY = settings.SECRET_KEY
 ALGORITHM = settings.ALGORITHM
 ACCESS_TOKEN_EXPIRE_MINUTES = settings.ACCESS_TOKEN_EXPIRE_MINUTES
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
+# bcrypt chạy trên password_pool (process riêng), raise PasswordPoolBusy khi quá tải
+@timed("bcrypt")
 def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+    return password_pool.verify(plain_password, hashed_password)
 
+@timed("bcrypt")
 def get_password_hash(password):
-    return pwd_context.hash(password)
+    return password_pool.hash(password)
+
+def password_needs_rehash(hashed_password):
+    """True nếu hash có cost thấp hơn cost chung của deployment"""
+    return password_pool.needs_rehash(hashed_password)
+
+@timed("bcrypt")
+async def averify_password(plain_password, hashed_password):
+    return await password_pool.averify(plain_password, hashed_password)
+
+@timed("bcrypt")
+async def aget_password_hash(password):
+    return await password_pool.ahash(password)
+
+async def apassword_needs_rehash(hashed_password):
+    return await password_pool.aneeds_rehash(hashed_password)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -23,9 +47,128 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode.update({"exp": expire})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
-def decode_access_token(token: str):
+
+# VERIFIED-TOKEN CACHE + FAST HS256 PATH
+
+# HMAC state with the key already absorbed; copy() per token instead of re-keying
+_HS256_MAC = hmac.new(SECRET_KEY.encode("utf-8"), digestmod=hashlib.sha256)
+
+# Returned by _verify_hs256 for tokens the lean path does not handle (falls back to jose)
+_UNSUPPORTED = object()
+
+
+class VerifiedTokenCache:
+    """
+    Bounded LRU from token digest to verified payload.
+    Entries expire with the token's own `exp`.
+    """
+
+    def __init__(self, max_entries: int = settings.TOKEN_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[bytes, tuple]" = OrderedDict()  # digest -> (exp, payload)
+        self._lock = threading.Lock()  # used from the event loop and the threadpool
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _digest(token: str) -> bytes:
+        return hashlib.sha256(token.encode("utf-8")).digest()
+
+    def get(self, token: str) -> Optional[dict]:
+        key = self._digest(token)
+        with self._lock:
+            item = self._entries.get(key)
+            if item is not None:
+                if item[0] > time.time():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return item[1]
+                del self._entries[key]
+            self.misses += 1
+        return None
+
+    def put(self, token: str, payload: dict) -> None:
+        exp = payload.get("exp")
+        if not isinstance(exp, (int, float)):
+            return  # never cache tokens without expiry
+        key = self._digest(token)
+        with self._lock:
+            self._entries[key] = (exp, payload)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+token_cache = VerifiedTokenCache()
+
+
+def _b64url_decode(segment: str) -> bytes:
+    return base64.urlsafe_b64decode(segment + "=" * (-len(segment) % 4))
+
+
+def _verify_hs256(token: str):
+    """
+    Lean HS256 verification: one HMAC with the precomputed key, constant-time
+    compare, exp/nbf checks. Returns the payload, None if invalid, or
+    _UNSUPPORTED for tokens that need full jose validation (e.g. "aud").
+    """
+    try:
+        header_b64, payload_b64, signature_b64 = token.split(".")
+        header = loads(_b64url_decode(header_b64))
+        if not isinstance(header, dict) or header.get("alg") != "HS256":
+            return None
+
+        mac = _HS256_MAC.copy()
+        mac.update(f"{header_b64}.{payload_b64}".encode("ascii"))
+        if not hmac.compare_digest(mac.digest(), _b64url_decode(signature_b64)):
+            return None
+
+        payload = loads(_b64url_decode(payload_b64))
+    except (ValueError, TypeError, UnicodeError):
+        return None
+
+    if not isinstance(payload, dict) or "aud" in payload:
+        return _UNSUPPORTED if isinstance(payload, dict) else None
+
+    now = time.time()
+    exp = payload.get("exp")
+    if exp is not None and (not isinstance(exp, (int, float)) or exp <= now):
+        return None
+    nbf = payload.get("nbf")
+    if nbf is not None and (not isinstance(nbf, (int, float)) or nbf > now):
+        return None
+    return payload
+
+
+def _decode_with_jose(token: str):
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return payload
+        return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
     except JWTError:
-        return None
\ No newline at end of file
+        return None
+
+
+@timed("jwt")
+def decode_access_token(token: str):
+    """
+    Decode and verify an access token.
+    Cache hit: one SHA-256 + dict lookup. Miss: lean HS256 path (jose for other algorithms).
+    Returns a copy of the payload or None if the token is invalid/expired.
+    """
+    payload = token_cache.get(token)
+    if payload is None:
+        payload = _verify_hs256(token) if ALGORITHM == "HS256" else _UNSUPPORTED
+        if payload is _UNSUPPORTED:
+            payload = _decode_with_jose(token)
+        if payload is None:
+            return None
+        token_cache.put(token, payload)
+    return dict(payload)
\ No newline at end of file
@@ -0,0 +1,57 @@
+"""
+Fast JSON serialization layer.
+
+Dùng chung cho response, audit log và cache:
+- orjson nếu được cài đặt (nhanh hơn nhiều lần), fallback về stdlib json
+- FastJSONResponse: default response class của app
+"""
+
+import json
+from typing import Any, Union
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+
+def _default(obj: Any) -> Any:
+    """Fallback cho các kiểu encoder không hỗ trợ sẵn"""
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump(mode="json")
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(obj: Any) -> bytes:
+    """Serialize object thành JSON bytes (UTF-8, không escape unicode)"""
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=_default).encode("utf-8")
+
+
+def dumps_str(obj: Any) -> str:
+    """Serialize object thành JSON str"""
+    return dumps(obj).decode("utf-8")
+
+
+def loads(data: Union[str, bytes, bytearray]) -> Any:
+    """
+    Parse JSON.
+
+    Raises:
+        ValueError: nếu data không phải JSON hợp lệ
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse dùng encoder nhanh"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
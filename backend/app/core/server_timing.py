@@ -0,0 +1,144 @@
+"""
+Server-Timing: phase timers cho từng request.
+
+Mỗi request có một RequestTimings lưu trong contextvar. Các phase (jwt, db.*,
+redis, bcrypt, handler, audit...) cộng dồn thời gian vào đó; khi không có
+request nào đang được đo, timer chỉ tốn một lần contextvar lookup.
+"""
+
+import contextvars
+import functools
+import inspect
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+from starlette.middleware.base import BaseHTTPMiddleware
+from fastapi import Request
+from fastapi.routing import APIRoute
+from core.config import settings
+
+
+class RequestTimings:
+    """Accumulated duration (ms) and call count per phase"""
+
+    __slots__ = ("phases",)
+
+    def __init__(self):
+        self.phases: Dict[str, list] = {}
+
+    def add(self, name: str, duration_ms: float) -> None:
+        entry = self.phases.get(name)
+        if entry is None:
+            self.phases[name] = [duration_ms, 1]
+        else:
+            entry[0] += duration_ms
+            entry[1] += 1
+
+    def as_dict(self) -> Dict[str, float]:
+        return {name: round(total, 2) for name, (total, _) in self.phases.items()}
+
+    def header_value(self) -> str:
+        parts = []
+        for name, (total, count) in self.phases.items():
+            desc = f';desc="x{count}"' if count > 1 else ""
+            parts.append(f"{name};dur={total:.2f}{desc}")
+        return ", ".join(parts)
+
+
+_current_timings: contextvars.ContextVar[Optional[RequestTimings]] = contextvars.ContextVar(
+    "request_timings", default=None
+)
+
+
+def current_timings() -> Optional[RequestTimings]:
+    """Timings của request hiện tại (None nếu ngoài request)"""
+    return _current_timings.get()
+
+
+@contextmanager
+def phase(name: str):
+    """Đo một block code: `with phase("audit"): ...`"""
+    timings = _current_timings.get()
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, (time.perf_counter() - start) * 1000)
+
+
+def timed(name: str):
+    """Decorator đo thời gian một function (sync hoặc async) dưới tên phase `name`"""
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                timings = _current_timings.get()
+                if timings is None:
+                    return await func(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    timings.add(name, (time.perf_counter() - start) * 1000)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            timings = _current_timings.get()
+            if timings is None:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                timings.add(name, (time.perf_counter() - start) * 1000)
+        return wrapper
+    return decorator
+
+
+class TimedRoute(APIRoute):
+    """APIRoute ghi lại phase "handler" (dependencies + endpoint + serialization)"""
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+
+        async def timed_handler(request: Request):
+            with phase("handler"):
+                return await handler(request)
+
+        return timed_handler
+
+
+class ServerTimingMiddleware(BaseHTTPMiddleware):
+    """
+    Server-Timing Middleware
+
+    - Starts a RequestTimings for every request
+    - Emits the Server-Timing header when enabled by config or for admin principals
+    """
+
+    async def dispatch(self, request: Request, call_next):
+        timings = RequestTimings()
+        token = _current_timings.set(timings)
+        start_time = time.perf_counter()
+        try:
+            response = await call_next(request)
+        finally:
+            _current_timings.reset(token)
+        timings.add("total", (time.perf_counter() - start_time) * 1000)
+
+        if settings.SERVER_TIMING_ENABLED or self._is_admin(request):
+            response.headers["Server-Timing"] = timings.header_value()
+        return response
+
+    @staticmethod
+    def _is_admin(request: Request) -> bool:
+        user = getattr(request.state, "user", None)
+        try:
+            return bool(user is not None and user.is_admin)
+        except Exception:
+            return False
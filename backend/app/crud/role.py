@@ -2,28 +2,36 @@ from sqlalchemy.orm import Session
 from typing import List, Optional
 from models.role import Role, DEFAULT_ROLES
 from schemas.role import RoleCreate, RoleUpdate
+from cache.response_cache import invalidate_tags
+from cache.role_registry import reload_role_registry
+from core.server_timing import timed
 
 
+@timed("db.get_role")
 def get_role(db: Session, role_id: int) -> Optional[Role]:
     """Lấy role theo ID"""
     return db.query(Role).filter(Role.id == role_id).first()
 
 
+@timed("db.get_role_by_name")
 def get_role_by_name(db: Session, name: str) -> Optional[Role]:
     """Lấy role theo tên"""
     return db.query(Role).filter(Role.name == name).first()
 
 
+@timed("db.get_roles")
 def get_roles(db: Session, skip: int = 0, limit: int = 100) -> List[Role]:
     """Lấy danh sách roles"""
     return db.query(Role).filter(Role.is_active == True).offset(skip).limit(limit).all()
 
 
+@timed("db.get_all_roles")
 def get_all_roles(db: Session) -> List[Role]:
     """Lấy tất cả roles (bao gồm inactive)"""
     return db.query(Role).all()
 
 
+@timed("db.create_role")
 def create_role(db: Session, role: RoleCreate) -> Role:
     """Tạo role mới"""
     db_role = Role(
@@ -34,9 +42,12 @@ def create_role(db: Session, role: RoleCreate) -> Role:
     db.add(db_role)
     db.commit()
     db.refresh(db_role)
+    invalidate_tags(["roles"])
+    reload_role_registry(db)
     return db_role
 
 
+@timed("db.update_role")
 def update_role(db: Session, role_id: int, role_update: RoleUpdate) -> Optional[Role]:
     """Cập nhật role"""
     db_role = get_role(db, role_id)
@@ -52,9 +63,12 @@ def update_role(db: Session, role_id: int, role_update: RoleUpdate) -> Optional[
     
     db.commit()
     db.refresh(db_role)
+    invalidate_tags(["roles"])
+    reload_role_registry(db)
     return db_role
 
 
+@timed("db.seed_default_roles")
 def seed_default_roles(db: Session) -> List[Role]:
     """
     Seed các roles mặc định vào database.
@@ -77,10 +91,13 @@ def seed_default_roles(db: Session) -> List[Role]:
         db.commit()
         for role in created_roles:
             db.refresh(role)
+        invalidate_tags(["roles"])
+        reload_role_registry(db)
     
     return created_roles
 
 
+@timed("db.get_default_role")
 def get_default_role(db: Session) -> Optional[Role]:
     """Lấy role mặc định (student) cho user mới"""
     return get_role_by_name(db, "student")
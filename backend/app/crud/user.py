@@ -1,31 +1,63 @@
-from sqlalchemy.orm import Session
-from typing import List, Optional
-from models.user import User
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, joinedload
+from typing import Dict, List, Optional
+from models.user import User, generate_user_code
+from models.audit_log import AuditLog
 from schemas.user import UserCreate, UserUpdate
 from core.security import get_password_hash
 from crud.role import get_default_role, get_role
+from crud.user_stats import apply_users_created, apply_role_changed, apply_user_deleted
+from cache.response_cache import invalidate_tags
+from cache.principal_cache import invalidate_principal
+from cache.token_versions import bump_token_version
+from cache.email_filter import email_filter
+from cache.user_search import user_search_index
+from core.server_timing import timed
 
 
+def _after_user_commit(user_id: int, role_changed: bool = False) -> None:
+    """Invalidate các cache phụ thuộc vào user sau khi commit"""
+    invalidate_tags([f"user:{user_id}"])
+    invalidate_principal(user_id)
+    if role_changed:
+        # Thu hồi token mang role cũ
+        bump_token_version(user_id)
+
+
+@timed("db.get_user")
 def get_user(db: Session, user_id: int) -> Optional[User]:
-    """Get user by ID"""
-    return db.query(User).filter(User.id == user_id).first()
+    """Get user by ID (role eager-loaded, still usable after the session closes)"""
+    return db.query(User).options(joinedload(User.role)).filter(User.id == user_id).first()
+
+
+@timed("db.get_users_by_ids")
+def get_users_by_ids(db: Session, user_ids: List[int]) -> List[User]:
+    """Get users by IDs in one IN query (role eager-loaded, any order)"""
+    if not user_ids:
+        return []
+    return db.query(User).options(joinedload(User.role)).filter(User.id.in_(user_ids)).all()
 
 
+@timed("db.get_user_by_email")
 def get_user_by_email(db: Session, email: str) -> Optional[User]:
     """Get user by email address"""
     return db.query(User).filter(User.email == email).first()
 
 
+@timed("db.get_users")
 def get_users(db: Session, skip: int = 0, limit: int = 100) -> List[User]:
     """Lấy danh sách users với phân trang"""
     return db.query(User).offset(skip).limit(limit).all()
 
 
+@timed("db.get_users_by_role")
 def get_users_by_role(db: Session, role_id: int, skip: int = 0, limit: int = 100) -> List[User]:
     """Lấy danh sách users theo role"""
     return db.query(User).filter(User.role_id == role_id).offset(skip).limit(limit).all()
 
 
+@timed("db.create_user")
 def create_user(db: Session, user: UserCreate) -> User:
     """
     Tạo user mới.
@@ -46,11 +78,15 @@ def create_user(db: Session, user: UserCreate) -> User:
         role_id=role_id
     )
     db.add(db_user)
+    apply_users_created(db, [role_id])
     db.commit()
     db.refresh(db_user)
+    email_filter.add(db_user.email)
+    user_search_index.upsert_users([db_user])
     return db_user
 
 
+@timed("db.update_user")
 def update_user(db: Session, user_id: int, user_update: UserUpdate) -> Optional[User]:
     """Cập nhật thông tin user"""
     db_user = get_user(db, user_id)
@@ -59,16 +95,24 @@ def update_user(db: Session, user_id: int, user_update: UserUpdate) -> Optional[
     
     if user_update.name is not None:
         db_user.name = user_update.name
+    email_changed = user_update.email is not None and user_update.email != db_user.email
     if user_update.email is not None:
         db_user.email = user_update.email
-    if user_update.role_id is not None:
+    role_changed = user_update.role_id is not None and user_update.role_id != db_user.role_id
+    if role_changed:
+        apply_role_changed(db, db_user.role_id, user_update.role_id)
         db_user.role_id = user_update.role_id
     
     db.commit()
     db.refresh(db_user)
+    _after_user_commit(db_user.id, role_changed=role_changed)
+    user_search_index.upsert_users([db_user])
+    if email_changed:
+        email_filter.add(db_user.email)
     return db_user
 
 
+@timed("db.update_user_role")
 def update_user_role(db: Session, user_id: int, role_id: int) -> Optional[User]:
     """Cập nhật role cho user"""
     db_user = get_user(db, user_id)
@@ -80,7 +124,100 @@ def update_user_role(db: Session, user_id: int, role_id: int) -> Optional[User]:
     if not role:
         return None
     
+    role_changed = db_user.role_id != role_id
+    if role_changed:
+        apply_role_changed(db, db_user.role_id, role_id)
     db_user.role_id = role_id
     db.commit()
     db.refresh(db_user)
-    return db_user
\ No newline at end of file
+    _after_user_commit(db_user.id, role_changed=role_changed)
+    user_search_index.upsert_users([db_user])
+    return db_user
+
+
+@timed("db.has_audit_history")
+def has_audit_history(db: Session, user_id: int) -> bool:
+    """True nếu audit log có dòng của user (user đó không được xóa)"""
+    return db.query(AuditLog.id).filter(AuditLog.user_id == user_id).first() is not None
+
+
+@timed("db.delete_user")
+def delete_user(db: Session, user_id: int) -> bool:
+    """
+    Xóa user chưa có audit history (audit log không bao giờ bị sửa;
+    kiểm tra has_audit_history trước khi gọi).
+    """
+    db_user = db.query(User).filter(User.id == user_id).first()
+    if not db_user:
+        return False
+    
+    apply_user_deleted(db, db_user.role_id, db_user.created_at)
+    db.delete(db_user)
+    db.commit()
+    # Thu hồi token đang có, xóa khỏi các cache
+    _after_user_commit(user_id, role_changed=True)
+    user_search_index.remove_users([user_id])
+    return True
+
+
+@timed("db.get_existing_emails")
+def get_existing_emails(db: Session, emails: List[str]) -> set:
+    """Các email (lowercase) trong danh sách đã tồn tại, một query IN"""
+    if not emails:
+        return set()
+    rows = db.query(User.email).filter(User.email.in_(emails)).all()
+    return {email.lower() for (email,) in rows}
+
+
+def _assign_user_codes(db: Session, users: List[dict]) -> None:
+    """Gán user_code không trùng trong batch lẫn trong DB (một query IN mỗi vòng)"""
+    pending = users
+    taken = set()
+    while pending:
+        for u in pending:
+            code = generate_user_code()
+            while code in taken:
+                code = generate_user_code()
+            u["user_code"] = code
+            taken.add(code)
+        codes = [u["user_code"] for u in pending]
+        existing = {code for (code,) in db.query(User.user_code).filter(User.user_code.in_(codes)).all()}
+        pending = [u for u in pending if u["user_code"] in existing]
+
+
+@timed("db.bulk_insert_users")
+def bulk_insert_users(db: Session, users: List[dict], max_attempts: int = 3) -> Dict[str, dict]:
+    """
+    Insert nhiều user bằng một multi-row INSERT + một commit.
+
+    Args:
+        users: dict có name, email, hashed_password, role_id (email đã được kiểm tra trùng)
+
+    Returns:
+        dict email (lowercase) -> {"id", "user_code"} của các user đã tạo.
+        Email bị tạo đồng thời bởi request khác (IntegrityError) không có trong kết quả.
+    """
+    users = list(users)
+    for attempt in range(max_attempts):
+        if not users:
+            return {}
+        _assign_user_codes(db, users)
+        try:
+            db.execute(insert(User), users)
+            apply_users_created(db, [u["role_id"] for u in users])
+            db.commit()
+            break
+        except IntegrityError:
+            # Race với insert khác (email hoặc user_code): loại email đã tồn tại, sinh lại code
+            db.rollback()
+            if attempt == max_attempts - 1:
+                raise
+            existing = get_existing_emails(db, [u["email"] for u in users])
+            users = [u for u in users if u["email"].lower() not in existing]
+
+    emails = [u["email"] for u in users]
+    rows = db.query(User.id, User.user_code, User.name, User.email, User.role_id).filter(User.email.in_(emails)).all()
+    for email in emails:
+        email_filter.add(email)
+    user_search_index.upsert_users(rows)
+    return {row.email.lower(): {"id": row.id, "user_code": row.user_code} for row in rows}
@@ -0,0 +1,107 @@
+"""
+User-count aggregates (user_role_counts, user_signups_daily).
+
+Các hàm apply_* chỉ execute, không commit: gọi trước db.commit() của thay
+đổi trên bảng users để aggregate commit/rollback cùng transaction.
+reconcile_user_stats đếm lại từ bảng users (job định kỳ).
+"""
+
+from collections import Counter
+from datetime import date
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import func
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.orm import Session
+
+from models.user import User
+from models.user_stats import UserRoleCount, UserSignupDaily
+from core.server_timing import timed
+
+NO_ROLE = 0  # role_id lưu cho user chưa gán role
+
+
+def _increment(db: Session, model, deltas: List[dict]) -> None:
+    """Multi-row upsert: count += delta (tạo row nếu chưa có)"""
+    if not deltas:
+        return
+    stmt = mysql_insert(model).values(deltas)
+    stmt = stmt.on_duplicate_key_update(count=model.count + stmt.inserted.count)
+    db.execute(stmt)
+
+
+def _role_key(role_id: Optional[int]) -> int:
+    return NO_ROLE if role_id is None else role_id
+
+
+def apply_users_created(db: Session, role_ids: Iterable[Optional[int]]) -> None:
+    """+1 cho role của mỗi user mới và cho số đăng ký hôm nay"""
+    counts = Counter(_role_key(role_id) for role_id in role_ids)
+    if not counts:
+        return
+    _increment(db, UserRoleCount, [{"role_id": r, "count": n} for r, n in counts.items()])
+    # CURRENT_DATE cùng đồng hồ với default created_at (func.now()) của DB
+    _increment(db, UserSignupDaily, [{"day": func.current_date(), "count": sum(counts.values())}])
+
+
+def apply_role_changed(db: Session, old_role_id: Optional[int], new_role_id: Optional[int]) -> None:
+    if _role_key(old_role_id) == _role_key(new_role_id):
+        return
+    _increment(db, UserRoleCount, [
+        {"role_id": _role_key(old_role_id), "count": -1},
+        {"role_id": _role_key(new_role_id), "count": 1},
+    ])
+
+
+def apply_user_deleted(db: Session, role_id: Optional[int], created_at) -> None:
+    _increment(db, UserRoleCount, [{"role_id": _role_key(role_id), "count": -1}])
+    if created_at is not None:
+        db.query(UserSignupDaily).filter(UserSignupDaily.day == created_at.date()) \
+            .update({UserSignupDaily.count: UserSignupDaily.count - 1}, synchronize_session=False)
+
+
+@timed("db.get_role_counts")
+def get_role_counts(db: Session) -> Dict[int, int]:
+    return {row.role_id: row.count for row in db.query(UserRoleCount).all()}
+
+
+@timed("db.get_daily_signups")
+def get_daily_signups(db: Session, since: date) -> Dict[date, int]:
+    rows = db.query(UserSignupDaily).filter(UserSignupDaily.day >= since).order_by(UserSignupDaily.day).all()
+    return {row.day: row.count for row in rows}
+
+
+@timed("db.reconcile_user_stats")
+def reconcile_user_stats(db: Session) -> int:
+    """
+    Đếm lại aggregate từ bảng users và ghi đè phần lệch.
+    Returns số row đã sửa (0 nếu aggregate đang đúng).
+    """
+    # Khóa aggregate trước khi đếm: increment đồng thời chờ reconcile commit thay vì bị ghi đè
+    stored_roles = {row.role_id: row for row in db.query(UserRoleCount).with_for_update().all()}
+    stored_days = {row.day: row for row in db.query(UserSignupDaily).with_for_update().all()}
+
+    role_key = func.coalesce(User.role_id, NO_ROLE)
+    actual_roles = {r: n for r, n in db.query(role_key, func.count(User.id)).group_by(role_key).all()}
+    day_key = func.date(User.created_at)
+    actual_days = {d: n for d, n in db.query(day_key, func.count(User.id)).group_by(day_key).all()}
+
+    fixed = 0
+    for model, key, stored, actual in (
+        (UserRoleCount, "role_id", stored_roles, actual_roles),
+        (UserSignupDaily, "day", stored_days, actual_days),
+    ):
+        for k, row in stored.items():
+            if k not in actual:
+                db.delete(row)
+                fixed += 1
+        for k, n in actual.items():
+            row = stored.get(k)
+            if row is None:
+                db.add(model(**{key: k, "count": n}))
+                fixed += 1
+            elif row.count != n:
+                row.count = n
+                fixed += 1
+    db.commit()
+    return fixed
@@ -7,6 +7,10 @@ from core.security import decode_access_token
 from crud.user import get_user
 from typing import Optional
 from models.user import User
+from cache.principal_cache import Principal
+from cache.role_registry import role_registry
+from core.permissions import Permission
+from services.auth_service import resolve_principal
 
 COOKIE_NAME = "access_token"
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login", auto_error=False)
@@ -70,6 +74,42 @@ def get_current_user(
     return user
 
 
+def get_current_principal(
+    request: Request,
+    header_token: Optional[str] = Depends(oauth2_scheme)
+) -> Principal:
+    """
+    Retrieves the current authenticated principal without touching the database
+    in the steady state.
+
+    Reuses request.state.user set by JWTAuthMiddleware when available, otherwise
+    decodes the token and reads the principal cache.
+
+    Raises:
+        HTTPException: If the token is invalid, expired, or the user does not exist (status_code 401).
+    """
+    principal = getattr(request.state, "user", None)
+    if isinstance(principal, Principal):
+        return principal
+    
+    credentials_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Could not validate credentials"
+    )
+    
+    token = _extract_token(request, header_token)
+    if not token:
+        raise credentials_exception
+    
+    payload = decode_access_token(token)
+    if payload is None or "sub" not in payload:
+        raise credentials_exception
+    principal = resolve_principal(payload)
+    if principal is None:
+        raise credentials_exception
+    return principal
+
+
 def get_current_user_optional(
     request: Request,
     header_token: Optional[str] = Depends(oauth2_scheme),
@@ -135,13 +175,14 @@ def get_optional_auth(request: Request, db: Session = Depends(get_db)) -> Option
 
 
 # ROLE-BASED PERMISSION DEPENDENCIES
+# Authorize from principal.role_id via the role registry bitmasks, no DB access
 
-def require_admin(current_user: User = Depends(get_current_user)) -> User:
+def require_admin(current_user: Principal = Depends(get_current_principal)) -> Principal:
     """
     Dependency để yêu cầu user phải có role admin.
     Sử dụng: current_user = Depends(require_admin)
     """
-    if not current_user.is_admin:
+    if not role_registry.has_permission(current_user.role_id, Permission.MANAGE_SYSTEM):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Admin permission required"
@@ -149,12 +190,12 @@ def require_admin(current_user: User = Depends(get_current_user)) -> User:
     return current_user
 
 
-def require_teacher(current_user: User = Depends(get_current_user)) -> User:
+def require_teacher(current_user: Principal = Depends(get_current_principal)) -> Principal:
     """
     Dependency để yêu cầu user phải có role teacher hoặc admin.
     Sử dụng: current_user = Depends(require_teacher)
     """
-    if not current_user.has_any_role(["admin", "teacher"]):
+    if not role_registry.has_permission(current_user.role_id, Permission.MANAGE_CONTENT):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Teacher permission required"
@@ -162,7 +203,7 @@ def require_teacher(current_user: User = Depends(get_current_user)) -> User:
     return current_user
 
 
-def require_teacher_or_admin(current_user: User = Depends(get_current_user)) -> User:
+def require_teacher_or_admin(current_user: Principal = Depends(get_current_principal)) -> Principal:
     """Alias cho require_teacher"""
     return require_teacher(current_user)
 
@@ -173,18 +214,19 @@ class RoleChecker:
     
     Sử dụng:
         @router.get("/admin-only")
-        def admin_endpoint(user: User = Depends(RoleChecker(["admin"]))):
+        def admin_endpoint(user: Principal = Depends(RoleChecker(["admin"]))):
             ...
         
         @router.get("/teacher-or-admin")
-        def teacher_endpoint(user: User = Depends(RoleChecker(["admin", "teacher"]))):
+        def teacher_endpoint(user: Principal = Depends(RoleChecker(["admin", "teacher"]))):
             ...
     """
     def __init__(self, allowed_roles: list):
-        self.allowed_roles = allowed_roles
+        self.allowed_roles = tuple(allowed_roles)
     
-    def __call__(self, current_user: User = Depends(get_current_user)) -> User:
-        if not current_user.has_any_role(self.allowed_roles):
+    def __call__(self, current_user: Principal = Depends(get_current_principal)) -> Principal:
+        mask = role_registry.role_mask(self.allowed_roles)
+        if not role_registry.in_roles(current_user.role_id, mask):
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail=f"Permission denied. Required roles: {', '.join(self.allowed_roles)}"
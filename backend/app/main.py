@@ -1,25 +1,86 @@
-from fastapi import FastAPI
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 
 # Route imports
-from routes import auth
-from routes.api import user
+from routes import auth, info
+from routes.api import user, bootstrap
 
 # Middleware imports
 from core.jwt_middleware import JWTAuthMiddleware
 from core.rate_limit import RateLimitMiddleware
 from core.audit_middleware import AuditMiddleware
+from core.admission_control import AdmissionControlMiddleware
+from core.response_cache_middleware import ResponseCacheMiddleware
+from core.serialization import FastJSONResponse
+from core.server_timing import ServerTimingMiddleware
+from core.password_pool import PasswordPoolBusy, password_pool
+from cache.role_registry import role_registry
+from cache.email_filter import email_filter
+from cache.user_search import user_search_index
+from cache.redis_client import close_async_cache
+from cache.activity_tracker import activity_tracker
+from services.user_stats_service import reconcile_periodically
+
+logger = logging.getLogger(__name__)
+
+
+# LIFESPAN
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Warm up in-memory registries before serving traffic, flush write-behind buffers on shutdown"""
+    # Tạo bcrypt pool từ main thread, trước khi threadpool có thread nào
+    password_pool.start()
+    try:
+        password_pool.rounds  # Cost chung của deployment (Redis), calibrate nếu chưa có
+    except Exception as e:
+        # Resolve lại lazily ở lần hash đầu tiên
+        logger.error(f"bcrypt cost calibration failed: {e}")
+    try:
+        role_registry.load()
+    except Exception as e:
+        # Registry tự load lazily ở request đầu tiên
+        logger.error(f"Role registry warm-up failed: {e}")
+    try:
+        email_filter.build()
+    except Exception as e:
+        # Chưa có filter thì check-email dùng DB như cũ
+        logger.error(f"Email filter build failed: {e}")
+    try:
+        user_search_index.build()
+    except Exception as e:
+        # Chưa có index thì search fallback về DB
+        logger.error(f"User search index build failed: {e}")
+    activity_flusher = asyncio.create_task(activity_tracker.run())
+    stats_reconciler = asyncio.create_task(reconcile_periodically())
+    role_refresher = asyncio.create_task(role_registry.run())
+    yield
+    activity_flusher.cancel()
+    stats_reconciler.cancel()
+    role_refresher.cancel()
+    try:
+        activity_tracker.flush()
+    except Exception as e:
+        logger.error(f"Activity flush on shutdown failed: {e}")
+    await close_async_cache()
+    password_pool.shutdown()
 
 
 # APP INITIALIZATION
 
-app = FastAPI(title="Backend API", version="1.0.0")
+app = FastAPI(title="Backend API", version="1.0.0", default_response_class=FastJSONResponse, lifespan=lifespan)
 
 protected_app = FastAPI(
     title="Protected API",
     description="JWT-protected endpoints",
     version="1.0.0",
     docs_url="/docs",
+    default_response_class=FastJSONResponse,
 )
 
 
@@ -36,35 +97,73 @@ ALLOWED_ORIGINS = [
     "http://127.0.0.1:5175",
 ]
 
-# Apply middlewares (order matters: first added = outermost)
-# Protected app: JWT → Audit → RateLimit → CORS
+# Apply middlewares (order matters: last added = outermost)
+# Protected app: ResponseCache → RateLimit (per user) → JWT → Audit → CORS
+# ResponseCache runs inside JWT so it can key entries by principal
+# Per-user quotas run right after JWT, keyed by the principal it resolved
+protected_app.add_middleware(ResponseCacheMiddleware)
+protected_app.add_middleware(RateLimitMiddleware, per_principal=True)
 protected_app.add_middleware(JWTAuthMiddleware)
 protected_app.add_middleware(AuditMiddleware)
-protected_app.add_middleware(RateLimitMiddleware, requests_per_second=20)
 protected_app.add_middleware(
     CORSMiddleware,
     allow_origins=ALLOWED_ORIGINS,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing", "RateLimit-Limit", "RateLimit-Remaining", "RateLimit-Reset", "RateLimit-Policy", "Retry-After"],
 )
 
-# Main app: Audit → RateLimit → CORS
+# Main app: ResponseCache → Audit → ServerTiming → AdmissionControl → RateLimit → CORS
+# AdmissionControl covers the mounted /api app too and sheds load before audit writes
+# ServerTiming wraps Audit so the audit insert shows up as a phase
+app.add_middleware(ResponseCacheMiddleware)
 app.add_middleware(AuditMiddleware)
-app.add_middleware(RateLimitMiddleware, requests_per_second=20)
+app.add_middleware(ServerTimingMiddleware)
+app.add_middleware(AdmissionControlMiddleware)
+# Quota policies: core.rate_limit.QUOTA_POLICIES; per-IP here (also covers the
+# mounted /api app), per-user inside protected_app
+app.add_middleware(RateLimitMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=ALLOWED_ORIGINS,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing", "RateLimit-Limit", "RateLimit-Remaining", "RateLimit-Reset", "RateLimit-Policy", "Retry-After"],
 )
 
 
+# EXCEPTION HANDLERS
+
+# Login, register, /auth/create và bulk import đều hash trên cùng pool
+PASSWORD_POOL_BUSY_DETAIL = {
+    429: "Password hashing is busy. Please retry shortly.",
+    503: "Password hashing timed out. Please retry shortly.",
+}
+
+
+async def password_pool_busy_handler(request: Request, exc: PasswordPoolBusy):
+    """bcrypt queue full (429) or job timed out (503): reject fast instead of stalling the worker"""
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={
+            "detail": PASSWORD_POOL_BUSY_DETAIL.get(exc.status_code, PASSWORD_POOL_BUSY_DETAIL[429]),
+            "retry_after": exc.retry_after
+        },
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+app.add_exception_handler(PasswordPoolBusy, password_pool_busy_handler)
+protected_app.add_exception_handler(PasswordPoolBusy, password_pool_busy_handler)
+
+
 # ROUTER MOUNTING
 
 # Protected routes (require JWT)
 protected_app.include_router(user.router, prefix="/users", tags=["users"])
+protected_app.include_router(bootstrap.router, prefix="/bootstrap", tags=["bootstrap"])
+protected_app.include_router(info.router, prefix="/info", tags=["info"])
 
 # Public routes (no JWT required)
 app.include_router(auth.router, prefix="/auth", tags=["auth"])
@@ -2,6 +2,7 @@
 from .user import User, generate_user_code
 from .role import Role, DEFAULT_ROLES
 from .audit_log import AuditLog, AuditAction
+from .user_stats import UserRoleCount, UserSignupDaily
 
 # Danh sách tất cả models để export
 __all__ = [
@@ -11,4 +12,6 @@ __all__ = [
     "DEFAULT_ROLES",
     "AuditLog",
     "AuditAction",
+    "UserRoleCount",
+    "UserSignupDaily",
 ]
@@ -1,8 +1,10 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, func
+from sqlalchemy import BigInteger, Column, Integer, String, DateTime, ForeignKey, func
 from sqlalchemy.orm import relationship
 from database.session import Base
+from core.permissions import DEFAULT_ROLE_NAME
 import secrets
 import string
+from typing import Optional
 
 
 def generate_user_code() -> str:
@@ -32,6 +34,8 @@ class User(Base):
     - hashed_password: Bcrypt hashed password
     - role_id: Foreign key to Role table
     - created_at: Account creation timestamp
+    - last_active_at: Last authenticated request (write-behind, cache.activity_tracker)
+    - token_version: Claims token version (cache.token_versions), source of truth for revocation
     
     Relationships:
     - role: Many-to-one with Role
@@ -45,14 +49,21 @@ class User(Base):
     hashed_password = Column(String(256))
     role_id = Column(Integer, ForeignKey("roles.id"), nullable=True)
     created_at = Column(DateTime(timezone=True), default=func.now(), nullable=False)
+    last_active_at = Column(DateTime(timezone=True), nullable=True)
+    token_version = Column(BigInteger, nullable=False, default=0, server_default="0")
     
     # Relationship với Role
     role = relationship("Role", back_populates="users")
     
     @property
-    def role_name(self) -> str:
-        """Trả về tên role của user, mặc định là 'student' nếu chưa gán"""
-        return self.role.name if self.role else "student"
+    def role_name(self) -> Optional[str]:
+        """
+        Trả về tên role của user, 'student' nếu chưa gán, None nếu role không tồn tại.
+        Đọc qua relationship (có thể lazy-load): hot path dùng role_registry.role_name(role_id).
+        """
+        if self.role_id is None:
+            return DEFAULT_ROLE_NAME
+        return self.role.name if self.role else None
     
     @property
     def is_admin(self) -> bool:
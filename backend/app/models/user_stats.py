@@ -0,0 +1,36 @@
+from sqlalchemy import Column, Integer, Date
+from database.session import Base
+
+
+class UserRoleCount(Base):
+    """
+    Số user theo role (aggregate, cập nhật cùng transaction với bảng users)
+
+    Fields:
+    - role_id: Role của user (0 = chưa gán role)
+    - count: Số user
+    """
+    __tablename__ = "user_role_counts"
+
+    role_id = Column(Integer, primary_key=True, autoincrement=False)
+    count = Column(Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<UserRoleCount(role_id={self.role_id}, count={self.count})>"
+
+
+class UserSignupDaily(Base):
+    """
+    Số user đăng ký mới theo ngày (aggregate, ngày theo DATE(users.created_at))
+
+    Fields:
+    - day: Ngày đăng ký
+    - count: Số user tạo trong ngày
+    """
+    __tablename__ = "user_signups_daily"
+
+    day = Column(Date, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<UserSignupDaily(day={self.day}, count={self.count})>"
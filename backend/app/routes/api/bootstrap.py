@@ -0,0 +1,55 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy.orm import Session
+from typing import Optional
+
+from dependencies.deps import get_db, get_current_principal
+from schemas.bootstrap import BootstrapRead
+from schemas.serializers import BOOTSTRAP_READ, render
+from services.role_service import get_role_catalog
+from services.user_service import principal_to_user_read
+from core.server_timing import TimedRoute
+
+router = APIRouter(route_class=TimedRoute)
+
+PORTALS = ("admin", "teacher", "student")
+
+# Portal-specific initial data loaders: portal -> loader(db, current_user) -> dict.
+# Frontend hiện chỉ fetch /users/me và /auth/roles lúc load trang (đã có trong
+# payload chung) nên chưa portal nào cần loader; data = {} cho đến khi có
+PORTAL_LOADERS = {}
+
+
+@router.get("", response_model=BootstrapRead)
+def read_bootstrap(
+    portal: Optional[str] = Query(None, description="admin/teacher/student, mặc định theo role của user"),
+    current_user = Depends(get_current_principal),
+    db: Session = Depends(get_db)
+):
+    """
+    Gộp các call khởi tạo portal (/users/me, /auth/roles, ...) thành một request.
+    Role không có portal riêng (role tạo qua create_role) nhận payload chung
+    (user + roles, portal = null) như /users/me trước đây.
+    """
+    role_name = current_user.role_name
+    if portal is None:
+        portal = role_name if role_name in PORTALS else None
+    if portal is not None and portal not in PORTALS:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Unknown portal: {portal}")
+    if portal is not None and portal != role_name:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=f"Access denied. This portal is for {portal} only."
+        )
+    
+    loader = PORTAL_LOADERS.get(portal)
+    return render(BOOTSTRAP_READ, {
+        "user": principal_to_user_read(db, current_user),
+        "roles": get_role_catalog(),
+        "portal": portal,
+        "permissions": {
+            "is_admin": current_user.is_admin,
+            "is_teacher": current_user.is_teacher,
+            "is_student": current_user.is_student,
+        },
+        "data": loader(db, current_user) if loader else {},
+    })
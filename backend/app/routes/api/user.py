@@ -1,37 +1,127 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
 from sqlalchemy.orm import Session
-from schemas.user import UserCreate, UserRead, Token
-from services.user_service import service_create_user, service_get_user
+from schemas.user import UserCreate, UserUpdate, UserRead, UserBatchRead, UserBatchRequest, UserStatsRead, Token
+from services.user_service import service_create_user, service_get_user, service_get_users_by_ids, principal_to_user_read
+from crud.user import update_user, delete_user, has_audit_history
+from services.user_stats_service import get_user_stats
+from schemas.serializers import USER_READ, USER_READ_LIST, USER_BATCH_READ, render
+from core.server_timing import TimedRoute
 from services.auth_service import authenticate_user, login_for_access_token
-from dependencies.deps import get_db, get_current_user
+from dependencies.deps import get_db, get_current_user, get_current_principal, require_admin
+from services.user_import import import_users, detect_format
+from services.user_service import search_users_db, user_search_document
+from cache.user_search import user_search_index
+from cache.role_registry import role_registry
+from typing import List, Optional
+from core.config import settings
 from fastapi.security import OAuth2PasswordRequestForm
 
-router = APIRouter()
+router = APIRouter(route_class=TimedRoute)
+
+def _check_batch_size(ids: List[int]) -> None:
+    if len(ids) > settings.USER_LOOKUP_MAX_IDS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {settings.USER_LOOKUP_MAX_IDS} ids per request"
+        )
+
+@router.get("", response_model=UserBatchRead)
+def read_users_batch(
+    ids: str = Query(..., description="Danh sách user id, phân cách bằng dấu phẩy (vd. 3,1,2)"),
+    db: Session = Depends(get_db)
+):
+    """Batch lookup: users theo thứ tự ids, id không tồn tại nằm trong `missing`"""
+    try:
+        user_ids = [int(part) for part in ids.split(",") if part.strip()]
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="ids must be comma-separated integers")
+    _check_batch_size(user_ids)
+    return render(USER_BATCH_READ, service_get_users_by_ids(db, user_ids))
+
+@router.post("/batch", response_model=UserBatchRead)
+def read_users_batch_post(body: UserBatchRequest, db: Session = Depends(get_db)):
+    """Batch lookup cho danh sách id lớn (giống GET /users?ids=)"""
+    _check_batch_size(body.ids)
+    return render(USER_BATCH_READ, service_get_users_by_ids(db, body.ids))
 
 @router.get("/me", response_model=UserRead)
-def read_current_user(current_user = Depends(get_current_user)):
-    return current_user
+def read_current_user(current_user = Depends(get_current_principal), db: Session = Depends(get_db)):
+    return render(USER_READ, principal_to_user_read(db, current_user))
+
+@router.get("/search", response_model=List[UserRead])
+def search_users(
+    q: str = Query(..., min_length=1, max_length=100, description="Tên, email hoặc user code (prefix, không dấu)"),
+    role: Optional[str] = Query(None, description="Lọc theo role (admin/teacher/student)"),
+    limit: int = Query(20, ge=1, le=100),
+    current_user = Depends(require_admin),
+    db: Session = Depends(get_db)
+):
+    """User directory search (admin), phục vụ từ in-memory index"""
+    role_id = None
+    if role is not None:
+        entry = role_registry.get_by_name(role)
+        if entry is None:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Unknown role: {role}")
+        role_id = entry.id
+    
+    results = user_search_index.search(q, role_id=role_id, limit=limit)
+    if results is None:
+        # Index chưa build xong: fallback LIKE trên DB
+        results = search_users_db(db, q, role_id=role_id, limit=limit)
+    return render(USER_READ_LIST, [user_search_document(doc) for doc in results])
+
+@router.get("/stats", response_model=UserStatsRead)
+def read_user_stats(
+    days: int = Query(30, ge=1, le=366, description="Số ngày thống kê đăng ký"),
+    current_user = Depends(require_admin),
+    db: Session = Depends(get_db)
+):
+    """Số user theo role + đăng ký mỗi ngày (admin dashboard), đọc từ bảng aggregate"""
+    return get_user_stats(db, days=days)
+
+@router.post("/import")
+async def import_users_endpoint(
+    request: Request,
+    format: str = Query(None, description="csv/ndjson, mặc định theo Content-Type"),
+    current_user = Depends(require_admin),
+    db: Session = Depends(get_db)
+):
+    """
+    Bulk import users (admin).
+    Body: CSV (header name,email,password[,role]) hoặc NDJSON, mỗi user một dòng.
+    Trả về report theo từng dòng; dòng lỗi không làm hỏng các dòng khác.
+    """
+    fmt = detect_format(request.headers.get("content-type"), format)
+    if fmt is None:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail="Send text/csv or application/x-ndjson (or ?format=csv|ndjson)"
+        )
+    return await import_users(request.stream(), fmt, db)
 
 @router.get("/{user_id}", response_model=UserRead)
 def read_user(user_id: int, db: Session = Depends(get_db)):
     db_user = service_get_user(db, user_id)
     if db_user is None:
         raise HTTPException(status_code=404, detail="User not found")
-    return db_user
+    return render(USER_READ, db_user)
+
+@router.delete("/{user_id}", status_code=status.HTTP_204_NO_CONTENT)
+def delete_user_endpoint(user_id: int, current_user = Depends(require_admin), db: Session = Depends(get_db)):
+    """Xóa user (admin). User đã có audit history thì không xóa được: audit log giữ nguyên liên kết."""
+    if user_id == current_user.id:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Cannot delete your own account")
+    if has_audit_history(db, user_id):
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="User has audit history and cannot be deleted")
+    if not delete_user(db, user_id):
+        raise HTTPException(status_code=404, detail="User not found")
 
 @router.put("/me", response_model=UserRead)
-def update_current_user(user: UserCreate, current_user = Depends(get_current_user), db: Session = Depends(get_db)):
-    db_user = service_get_user(db, current_user.id)
+def update_current_user(user: UserCreate, current_user = Depends(get_current_principal), db: Session = Depends(get_db)):
+    # Update user details (through crud so cache invalidation hooks run)
+    # Note: Password update logic should be handled separately for security reasons
+    db_user = update_user(db, current_user.id, UserUpdate(name=user.name, email=user.email))
     if db_user is None:
         raise HTTPException(status_code=404, detail="User not found")
     
-    # Update user details
-    db_user.name = user.name
-    db_user.email = user.email
-    # Note: Password update logic should be handled separately for security reasons
-    
-    db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
-    
-    return db_user
+    return render(USER_READ, db_user)
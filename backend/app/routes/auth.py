@@ -1,32 +1,38 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Response
+from fastapi import APIRouter, Depends, HTTPException, status, Request, Response
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 from fastapi.security import OAuth2PasswordRequestForm
+from starlette.concurrency import run_in_threadpool
 from typing import Optional
 
-from services.auth_service import authenticate_user, login_for_access_token
-from services.user_service import service_create_user
+from services.auth_service import aauthenticate_user, login_for_access_token
+from cache.token_versions import bump_token_version
+from core.security import decode_access_token
+from services.user_service import service_create_user, email_exists
 from services.lockout_service import (
-    check_account_locked,
-    record_failed_attempt,
-    reset_failed_attempts,
-    get_lockout_status,
+    acheck_account_locked,
+    arecord_failed_attempt,
+    areset_failed_attempts,
+    aget_lockout_status,
     AccountLockout
 )
 from schemas.user import UserCreate, UserRead, Token
+from schemas.serializers import USER_READ, ROLE_SIMPLE_LIST, render
 from dependencies.deps import get_db
-from crud.user import get_user_by_email
-from crud.role import get_role_by_name
+from cache.role_registry import role_registry
+from services.role_service import get_role_catalog
 from core.config import settings
 from core.password_policy import validate_password, get_password_strength
+from core.server_timing import TimedRoute
 
-router = APIRouter()
+router = APIRouter(route_class=TimedRoute)
 
 # Cookie configuration
 COOKIE_NAME = "access_token"
 COOKIE_MAX_AGE = settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60
 
 
-def _login_with_role(
+async def _login_with_role(
     response: Response,
     form_data: OAuth2PasswordRequestForm,
     db: Session,
@@ -34,6 +40,7 @@ def _login_with_role(
 ) -> dict:
     """
     Login helper function với kiểm tra role và account lockout.
+    Lockout dùng async Redis; bcrypt await trên password pool, DB chạy trong threadpool.
     
     Args:
         required_role: Tên role yêu cầu (admin/teacher/student). None = không check role.
@@ -41,7 +48,7 @@ def _login_with_role(
     email = form_data.username
     
     # Check account lockout TRƯỚC khi check password
-    is_locked, remaining_seconds = check_account_locked(email)
+    is_locked, remaining_seconds, failed_attempts = await acheck_account_locked(email)
     if is_locked:
         minutes = remaining_seconds // 60 + 1
         raise HTTPException(
@@ -50,11 +57,11 @@ def _login_with_role(
         )
     
     # Authenticate user
-    user = authenticate_user(db, form_data.username, form_data.password)
+    user = await aauthenticate_user(db, form_data.username, form_data.password)
     
     if not user:
         # Ghi nhận failed attempt
-        failed_count, is_now_locked = record_failed_attempt(email)
+        failed_count, is_now_locked = await arecord_failed_attempt(email)
         remaining = AccountLockout.MAX_FAILED_ATTEMPTS - failed_count
         
         if is_now_locked:
@@ -72,20 +79,23 @@ def _login_with_role(
             detail=detail
         )
     
-    # Login thành công - reset failed attempts
-    reset_failed_attempts(email)
+    # Login thành công - reset failed attempts (bỏ qua round trip nếu chưa sai lần nào)
+    if failed_attempts:
+        await areset_failed_attempts(email)
     
     # Kiểm tra role nếu có yêu cầu
+    # Role mới tạo ở worker khác: registry reload trong threadpool, không chặn loop
+    await role_registry.aensure(user.role_id)
+    role_name = role_registry.role_name(user.role_id)
     if required_role:
-        user_role = user.role_name if user.role else None
-        
-        if user_role != required_role:
+        # role_name là None nếu role của user không tồn tại
+        if role_name != required_role:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail=f"Access denied. This portal is for {required_role} only."
             )
     
-    access_token = login_for_access_token(user)
+    access_token = await run_in_threadpool(login_for_access_token, user)
     
     # Set HttpOnly cookie với SameSite=Strict (CSRF protection)
     response.set_cookie(
@@ -106,7 +116,7 @@ def _login_with_role(
             "user_code": user.user_code,
             "name": user.name,
             "email": user.email,
-            "role": user.role_name
+            "role": role_name
         }
     }
 
@@ -114,51 +124,66 @@ def _login_with_role(
 # LOGIN ENDPOINTS
 
 @router.post("/login", response_model=Token)
-def login(
+async def login(
     response: Response,
     form_data: OAuth2PasswordRequestForm = Depends(),
     db: Session = Depends(get_db)
 ):
     """Login chung - không kiểm tra role (backward compatible)"""
-    result = _login_with_role(response, form_data, db, required_role=None)
+    result = await _login_with_role(response, form_data, db, required_role=None)
     return {"access_token": result["access_token"], "token_type": result["token_type"]}
 
 
 @router.post("/login/admin")
-def login_admin(
+async def login_admin(
     response: Response,
     form_data: OAuth2PasswordRequestForm = Depends(),
     db: Session = Depends(get_db)
 ):
     """Login cho Admin Portal - Chỉ admin được phép đăng nhập"""
-    return _login_with_role(response, form_data, db, required_role="admin")
+    return await _login_with_role(response, form_data, db, required_role="admin")
 
 
 @router.post("/login/teacher")
-def login_teacher(
+async def login_teacher(
     response: Response,
     form_data: OAuth2PasswordRequestForm = Depends(),
     db: Session = Depends(get_db)
 ):
     """Login cho Teacher Portal - Chỉ teacher được phép đăng nhập"""
-    return _login_with_role(response, form_data, db, required_role="teacher")
+    return await _login_with_role(response, form_data, db, required_role="teacher")
 
 
 @router.post("/login/student")
-def login_student(
+async def login_student(
     response: Response,
     form_data: OAuth2PasswordRequestForm = Depends(),
     db: Session = Depends(get_db)
 ):
     """Login cho Student Portal - Chỉ student được phép đăng nhập"""
-    return _login_with_role(response, form_data, db, required_role="student")
+    return await _login_with_role(response, form_data, db, required_role="student")
 
 
 # LOGOUT
 
 @router.post("/logout")
-def logout(response: Response):
-    """Clear the authentication cookie"""
+def logout(request: Request, response: Response):
+    """
+    Clear the authentication cookie.
+
+    Claims tokens (AUTH_CLAIMS_TOKENS) are revoked by bumping the user's token
+    version, so logout is global: every claims token of the user, on every
+    device, stops working. Legacy tokens (sub only) are not revoked server-side,
+    as before; they expire with the cookie.
+    """
+    token = request.cookies.get(COOKIE_NAME)
+    authorization = request.headers.get("Authorization")
+    if not token and authorization and authorization.startswith("Bearer "):
+        token = authorization.split(" ")[1]
+    payload = decode_access_token(token) if token else None
+    if payload and "sub" in payload and "ver" in payload:
+        bump_token_version(int(payload["sub"]))
+    
     response.delete_cookie(
         key=COOKIE_NAME,
         path="/",
@@ -190,9 +215,8 @@ def register(user: UserCreate, db: Session = Depends(get_db)):
             }
         )
     
-    # Check if email already exists
-    existing_user = get_user_by_email(db, user.email)
-    if existing_user:
+    # Check if email already exists (Bloom filter trước, DB khi filter nói "có thể")
+    if email_exists(db, user.email):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Email already registered"
@@ -200,12 +224,20 @@ def register(user: UserCreate, db: Session = Depends(get_db)):
     
     # Nếu không có role_id, gán role student mặc định
     if user.role_id is None:
-        student_role = get_role_by_name(db, "student")
+        student_role = role_registry.get_by_name("student")
         if student_role:
             user.role_id = student_role.id
     
-    new_user = service_create_user(db, user)
-    return UserRead.model_validate(new_user)
+    try:
+        new_user = service_create_user(db, user)
+    except IntegrityError:
+        # Unique constraint vẫn là nguồn sự thật (đăng ký đồng thời cùng email)
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Email already registered"
+        )
+    return render(USER_READ, new_user)
 
 
 # Backward compatible alias
@@ -219,17 +251,14 @@ def create_user(user: UserCreate, db: Session = Depends(get_db)):
 
 @router.get("/check-email/{email}")
 def check_email_exists(email: str, db: Session = Depends(get_db)):
-    """Check if email exists in database"""
-    user = get_user_by_email(db, email)
-    return {"exists": user is not None}
+    """Check if email exists (definite negatives answered by the email filter, no DB)"""
+    return {"exists": email_exists(db, email)}
 
 
 @router.get("/roles")
-def get_available_roles(db: Session = Depends(get_db)):
-    """Lấy danh sách roles để frontend hiển thị"""
-    from crud.role import get_roles
-    roles = get_roles(db)
-    return [{"id": r.id, "name": r.name, "display_name": r.display_name} for r in roles]
+def get_available_roles():
+    """Lấy danh sách roles để frontend hiển thị (từ role registry, không query DB)"""
+    return render(ROLE_SIMPLE_LIST, get_role_catalog())
 
 
 @router.post("/validate-password")
@@ -249,9 +278,9 @@ def validate_password_strength(password: str):
 
 
 @router.get("/lockout-status/{email}")
-def get_account_lockout_status(email: str):
+async def get_account_lockout_status(email: str):
     """
     Kiểm tra trạng thái lockout của tài khoản.
     (Chỉ dùng cho debug/admin)
     """
-    return get_lockout_status(email)
\ No newline at end of file
+    return await aget_lockout_status(email)
\ No newline at end of file
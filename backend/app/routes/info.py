@@ -0,0 +1,40 @@
+from fastapi import APIRouter, Depends
+
+from dependencies.deps import require_admin
+from core.admission_control import admission_limiter
+from core.rate_limit import quota_limiter
+from cache.redis_client import cache_stats
+from cache.response_cache import response_cache
+from cache.principal_cache import principal_cache
+from core.security import token_cache
+from core.password_pool import password_pool
+from core.breached_passwords import breached_passwords
+from cache.role_registry import role_registry
+from cache.email_filter import email_filter
+from cache.user_search import user_search_index
+from cache.activity_tracker import activity_tracker
+from core.server_timing import TimedRoute
+
+router = APIRouter(route_class=TimedRoute)
+
+
+@router.get("/metrics")
+def read_metrics(current_user = Depends(require_admin)):
+    """
+    Runtime metrics của worker xử lý request này.
+    (Mỗi worker có số liệu riêng)
+    """
+    return {
+        "admission": admission_limiter.stats(),
+        "rate_limit": quota_limiter.stats(),
+        "cache": cache_stats(),
+        "response_cache": response_cache.stats(),
+        "principal_cache": principal_cache.stats(),
+        "token_cache": token_cache.stats(),
+        "password_pool": password_pool.stats(),
+        "breached_passwords": breached_passwords.stats(),
+        "role_registry": role_registry.stats(),
+        "email_filter": email_filter.stats(),
+        "user_search": user_search_index.stats(),
+        "activity": activity_tracker.stats(),
+    }
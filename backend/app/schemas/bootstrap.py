@@ -0,0 +1,13 @@
+from pydantic import BaseModel
+from typing import Any, Dict, List, Optional
+from schemas.user import UserRead
+from schemas.role import RoleSimple
+
+
+class BootstrapRead(BaseModel):
+    """Dữ liệu khởi tạo portal, trả về trong một response"""
+    user: UserRead
+    roles: List[RoleSimple]
+    portal: Optional[str] = None  # None: role không có portal riêng
+    permissions: Dict[str, bool]
+    data: Dict[str, Any] = {}
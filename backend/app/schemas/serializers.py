@@ -0,0 +1,31 @@
+"""
+Precompiled serializers cho các response model được gọi nhiều.
+
+TypeAdapter được build một lần khi import; validate từ ORM object và dump
+thẳng ra JSON bytes trong pydantic-core, bỏ qua jsonable_encoder.
+"""
+
+from typing import Any, List
+
+from fastapi import Response
+from pydantic import TypeAdapter
+
+from schemas.user import UserRead, UserBatchRead
+from schemas.role import RoleSimple
+from schemas.bootstrap import BootstrapRead
+
+USER_READ = TypeAdapter(UserRead)
+USER_READ_LIST = TypeAdapter(List[UserRead])
+USER_BATCH_READ = TypeAdapter(UserBatchRead)
+ROLE_SIMPLE_LIST = TypeAdapter(List[RoleSimple])
+BOOTSTRAP_READ = TypeAdapter(BootstrapRead)
+
+
+def serialize(adapter: TypeAdapter, obj: Any) -> bytes:
+    """Validate obj (ORM object, dict hoặc model) và trả về JSON bytes"""
+    return adapter.dump_json(adapter.validate_python(obj, from_attributes=True))
+
+
+def render(adapter: TypeAdapter, obj: Any, status_code: int = 200) -> Response:
+    """Response JSON đã serialize sẵn (FastAPI không encode lại)"""
+    return Response(content=serialize(adapter, obj), status_code=status_code, media_type="application/json")
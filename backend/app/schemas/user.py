@@ -1,5 +1,6 @@
 from pydantic import BaseModel
-from typing import Optional
+from datetime import date
+from typing import List, Optional
 from schemas.role import RoleSimple
 
 
@@ -40,6 +41,35 @@ class UserWithRole(UserRead):
         from_attributes = True
 
 
+class UserBatchRequest(BaseModel):
+    ids: List[int]
+
+
+class UserBatchRead(BaseModel):
+    """Kết quả batch lookup: users theo thứ tự id được yêu cầu, id không tồn tại nằm trong missing"""
+    users: List[UserRead]
+    missing: List[int] = []
+
+
+class RoleUserCount(BaseModel):
+    id: Optional[int] = None  # None = user chưa gán role
+    name: Optional[str] = None
+    display_name: Optional[str] = None
+    count: int
+
+
+class DailySignupCount(BaseModel):
+    date: date
+    count: int
+
+
+class UserStatsRead(BaseModel):
+    """Số user theo role và số đăng ký mỗi ngày (từ bảng aggregate)"""
+    total: int
+    by_role: List[RoleUserCount]
+    signups: List[DailySignupCount]
+
+
 class Token(BaseModel):
     access_token: str
     token_type: str
@@ -1,24 +1,134 @@
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 from typing import Optional
+import logging
 
-from crud.user import get_user_by_email
-from core.security import verify_password, create_access_token
+from crud.user import get_user, get_user_by_email
+from core.security import (
+    verify_password,
+    create_access_token,
+    get_password_hash,
+    password_needs_rehash,
+    averify_password,
+    aget_password_hash,
+    apassword_needs_rehash,
+)
 from models.user import User
+from database.session import SessionLocal
+from cache.principal_cache import Principal, principal_cache
+from cache.role_registry import role_registry
+from cache.token_versions import CLAIMS_TOKENS_ENABLED, get_token_version, aget_token_version
+
+logger = logging.getLogger(__name__)
 
 
 def authenticate_user(db: Session, email: str, password: str) -> Optional[User]:
     """
     Authenticate user by email and password.
     Returns User if valid, None otherwise.
+    Hashes whose bcrypt cost is below the deployment target are rehashed.
     """
     user = get_user_by_email(db, email)
     if not user or not verify_password(password, user.hashed_password):
         return None
+    if password_needs_rehash(user.hashed_password):
+        _rehash_password(db, user, password)
+    return user
+
+
+def _rehash_password(db: Session, user: User, password: str) -> None:
+    """Lưu lại hash với cost hiện tại. Lỗi không làm hỏng login (thử lại lần sau)."""
+    try:
+        user.hashed_password = get_password_hash(password)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.warning(f"Password rehash failed for user {user.id}: {e}")
+
+
+async def aauthenticate_user(db: Session, email: str, password: str) -> Optional[User]:
+    """
+    Async authenticate_user for the login routes.
+    bcrypt is awaited on the password pool, so no threadpool thread is held
+    while a hash is queued or running; only the DB calls use the threadpool.
+    """
+    user = await run_in_threadpool(get_user_by_email, db, email)
+    if not user or not await averify_password(password, user.hashed_password):
+        return None
+    if await apassword_needs_rehash(user.hashed_password):
+        try:
+            user.hashed_password = await aget_password_hash(password)
+            await run_in_threadpool(db.commit)
+        except Exception as e:
+            await run_in_threadpool(db.rollback)
+            logger.warning(f"Password rehash failed for user {user.id}: {e}")
     return user
 
 
 def login_for_access_token(user: User) -> str:
     """
     Generate access token for authenticated user.
+    With AUTH_CLAIMS_TOKENS (and Redis available) the token also carries role
+    and token version claims.
+    """
+    data = {"sub": str(user.id)}
+    if CLAIMS_TOKENS_ENABLED:
+        data.update({
+            "email": user.email,
+            "role": role_registry.role_name(user.role_id),
+            "rid": user.role_id,
+            "ver": user.token_version or 0,
+        })
+    return create_access_token(data=data)
+
+
+def _user_loader(user_id: int):
+    def load_user():
+        db = SessionLocal()
+        try:
+            return get_user(db, user_id)
+        finally:
+            db.close()
+    return load_user
+
+
+def get_principal(user_id: int) -> Optional[Principal]:
+    """
+    Get the principal for a user id.
+    Served from the principal cache; MySQL is only queried on a miss.
+    """
+    return principal_cache.get_or_load(user_id, _user_loader(user_id))
+
+
+def resolve_principal(payload: dict) -> Optional[Principal]:
+    """
+    Resolve the principal for a decoded token payload.
+
+    - Claims tokens: authorized from the claims after one token-version lookup
+      (None if the token was revoked; a version missing from Redis is read from the DB)
+    - Legacy tokens (sub only): principal cache
+    """
+    user_id = int(payload["sub"])
+    if "role" in payload and "ver" in payload:
+        if get_token_version(user_id) != payload["ver"]:
+            return None
+        principal = Principal.from_claims(payload)
+        role_registry.ensure(principal.role_id)
+        return principal
+    return get_principal(user_id)
+
+
+async def aresolve_principal(payload: dict) -> Optional[Principal]:
+    """
+    Async resolve_principal for the JWT middleware.
+    Redis lookups use the async client; a cache miss loads the user in the threadpool.
     """
-    return create_access_token(data={"sub": str(user.id)})
\ No newline at end of file
+    user_id = int(payload["sub"])
+    if "role" in payload and "ver" in payload:
+        if await aget_token_version(user_id) != payload["ver"]:
+            return None
+        principal = Principal.from_claims(payload)
+        # Quyền tính theo role_id: role lạ (vừa tạo ở worker khác) reload trong threadpool
+        await role_registry.aensure(principal.role_id)
+        return principal
+    return await principal_cache.aget_or_load(user_id, _user_loader(user_id))
@@ -1,12 +1,26 @@
 """
 Account lockout service.
 Khóa tài khoản sau nhiều lần đăng nhập sai để chống brute-force.
+
+Mỗi email dùng 2 key Redis native (không còn JSON blob + ISO timestamp):
+- lockout:{email}:fails  counter (INCR), TTL = RESET_ATTEMPTS_AFTER_MINUTES
+- lockout:{email}:lock   tồn tại khi đang khóa, TTL = LOCKOUT_DURATION_MINUTES
+
+Check / fail / reset là các Lua script chạy atomic trên server: mỗi thao tác
+đúng một round trip và các lần sai đồng thời không bị mất update.
+Khi không có Redis, in-process fallback giữ đúng semantics trên.
+
+Các hàm a* (acheck_account_locked...) chạy script qua async Redis client
+(binary client; script chỉ trả về số nên không ảnh hưởng),
+dùng trong route async (login); hàm sync giữ cho code chạy trong threadpool.
 """
 
 import logging
+import threading
+import time
 from datetime import datetime, timedelta
 from typing import Optional, Tuple
-from cache.redis_client import get_cache, set_cache, delete_cache
+from cache.redis_client import redis_client, async_redis_client, is_redis_available
 
 logger = logging.getLogger(__name__)
 
@@ -20,112 +34,269 @@ class AccountLockout:
     RESET_ATTEMPTS_AFTER_MINUTES = 30  # Reset đếm sau bao lâu không có attempt mới
 
 
-def _get_lockout_key(email: str) -> str:
-    """Generate cache key cho lockout data"""
-    return f"lockout:{email.lower()}"
+def _get_lockout_keys(email: str) -> list:
+    """Generate cache keys cho lockout data: [lock, fails]"""
+    base = f"lockout:{email.lower()}"
+    return [f"{base}:lock", f"{base}:fails"]
+
+
+# LUA SCRIPTS
+# Trả về {lock_pttl_ms, failed_attempts}; lock_pttl_ms <= 0 nghĩa là không khóa
+
+# KEYS: lock, fails
+_CHECK_SCRIPT = """
+local pttl = redis.call('PTTL', KEYS[1])
+local fails = tonumber(redis.call('GET', KEYS[2]) or '0')
+return {pttl, fails}
+"""
+
+# KEYS: lock, fails | ARGV: max_attempts, window_ms, lockout_ms
+# Khi khóa, counter hết hạn cùng lúc với lock -> mở khóa xong đếm lại từ 0
+_FAIL_SCRIPT = """
+local fails = redis.call('INCR', KEYS[2])
+if fails >= tonumber(ARGV[1]) then
+    redis.call('SET', KEYS[1], '1', 'PX', ARGV[3])
+    redis.call('PEXPIRE', KEYS[2], ARGV[3])
+    return {tonumber(ARGV[3]), fails}
+end
+redis.call('PEXPIRE', KEYS[2], ARGV[2])
+return {-2, fails}
+"""
+
+# KEYS: lock, fails
+_RESET_SCRIPT = """
+return redis.call('DEL', KEYS[1], KEYS[2])
+"""
+
+
+class _LocalLockoutStore:
+    """In-process fallback với cùng semantics như các Lua script (một worker)"""
+
+    def __init__(self):
+        self._entries = {}  # email -> [fails, fails_expire_at, locked_until] (monotonic)
+        self._lock = threading.Lock()
+
+    def _get(self, key: str, now: float) -> Optional[list]:
+        entry = self._entries.get(key)
+        if entry is not None and entry[1] <= now:
+            del self._entries[key]
+            return None
+        return entry
+
+    def check(self, key: str) -> Tuple[int, int]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._get(key, now)
+            if entry is None:
+                return -2, 0
+            pttl = int((entry[2] - now) * 1000) if entry[2] > now else -2
+            return pttl, entry[0]
+
+    def fail(self, key: str, max_attempts: int, window_ms: int, lockout_ms: int) -> Tuple[int, int]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._get(key, now) or [0, 0.0, 0.0]
+            entry[0] += 1
+            if entry[0] >= max_attempts:
+                entry[1] = entry[2] = now + lockout_ms / 1000
+                self._entries[key] = entry
+                return lockout_ms, entry[0]
+            entry[1] = now + window_ms / 1000
+            self._entries[key] = entry
+            return -2, entry[0]
+
+    def reset(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+class LockoutStore:
+    """Lockout counters trên Redis (Lua scripts), fallback in-process khi Redis không có"""
+
+    def __init__(self):
+        self._local = _LocalLockoutStore()
+        self._use_redis = is_redis_available
+        if self._use_redis:
+            self._check = redis_client.register_script(_CHECK_SCRIPT)
+            self._fail = redis_client.register_script(_FAIL_SCRIPT)
+            self._reset = redis_client.register_script(_RESET_SCRIPT)
+            self._acheck = async_redis_client.register_script(_CHECK_SCRIPT)
+            self._afail = async_redis_client.register_script(_FAIL_SCRIPT)
+            self._areset = async_redis_client.register_script(_RESET_SCRIPT)
+
+    @staticmethod
+    def _fail_args() -> list:
+        return [
+            AccountLockout.MAX_FAILED_ATTEMPTS,
+            AccountLockout.RESET_ATTEMPTS_AFTER_MINUTES * 60 * 1000,
+            AccountLockout.LOCKOUT_DURATION_MINUTES * 60 * 1000,
+        ]
+
+    def check(self, email: str) -> Tuple[int, int]:
+        """(lock_pttl_ms, failed_attempts)"""
+        keys = _get_lockout_keys(email)
+        if self._use_redis:
+            try:
+                pttl, fails = self._check(keys=keys)
+                return int(pttl), int(fails)
+            except Exception as e:
+                logger.error(f"Lockout check error: {e}")
+        return self._local.check(keys[1])
+
+    def fail(self, email: str) -> Tuple[int, int]:
+        """Tăng counter, khóa nếu đạt ngưỡng. Trả về (lock_pttl_ms, failed_attempts)"""
+        keys = _get_lockout_keys(email)
+        args = self._fail_args()
+        if self._use_redis:
+            try:
+                pttl, fails = self._fail(keys=keys, args=args)
+                return int(pttl), int(fails)
+            except Exception as e:
+                logger.error(f"Lockout record error: {e}")
+        return self._local.fail(keys[1], *args)
+
+    def reset(self, email: str) -> None:
+        keys = _get_lockout_keys(email)
+        if self._use_redis:
+            try:
+                self._reset(keys=keys)
+                return
+            except Exception as e:
+                logger.error(f"Lockout reset error: {e}")
+        self._local.reset(keys[1])
+
+    # Async variants (cùng script, async client)
+
+    async def acheck(self, email: str) -> Tuple[int, int]:
+        keys = _get_lockout_keys(email)
+        if self._use_redis:
+            try:
+                pttl, fails = await self._acheck(keys=keys)
+                return int(pttl), int(fails)
+            except Exception as e:
+                logger.error(f"Lockout check error: {e}")
+        return self._local.check(keys[1])
+
+    async def afail(self, email: str) -> Tuple[int, int]:
+        keys = _get_lockout_keys(email)
+        args = self._fail_args()
+        if self._use_redis:
+            try:
+                pttl, fails = await self._afail(keys=keys, args=args)
+                return int(pttl), int(fails)
+            except Exception as e:
+                logger.error(f"Lockout record error: {e}")
+        return self._local.fail(keys[1], *args)
 
+    async def areset(self, email: str) -> None:
+        keys = _get_lockout_keys(email)
+        if self._use_redis:
+            try:
+                await self._areset(keys=keys)
+                return
+            except Exception as e:
+                logger.error(f"Lockout reset error: {e}")
+        self._local.reset(keys[1])
 
-def check_account_locked(email: str) -> Tuple[bool, Optional[int]]:
+
+lockout_store = LockoutStore()
+
+
+def _lock_state(pttl: int, failed_attempts: int) -> Tuple[bool, Optional[int], int]:
+    if pttl > 0:
+        return True, pttl // 1000, failed_attempts
+    return False, None, failed_attempts
+
+
+def _fail_result(email: str, pttl: int, failed_attempts: int) -> Tuple[int, bool]:
+    is_locked = pttl > 0
+    if is_locked:
+        logger.warning(f"Account locked: {email} - Too many failed attempts")
+    return failed_attempts, is_locked
+
+
+def check_account_locked(email: str) -> Tuple[bool, Optional[int], int]:
     """
-    Kiểm tra tài khoản có bị khóa không.
-    
+    Kiểm tra tài khoản có bị khóa không (1 round trip).
+
     Args:
         email: Email cần kiểm tra
-        
+
     Returns:
-        Tuple (is_locked, remaining_seconds)
+        Tuple (is_locked, remaining_seconds, failed_attempts)
         - is_locked: True nếu tài khoản đang bị khóa
         - remaining_seconds: Số giây còn lại trước khi unlock (None nếu không khóa)
+        - failed_attempts: Số lần sai hiện tại (0 thì không cần reset khi login thành công)
     """
-    key = _get_lockout_key(email)
-    data = get_cache(key)
-    
-    if not data:
-        return False, None
-    
-    locked_until = data.get("locked_until")
-    if locked_until:
-        locked_until_dt = datetime.fromisoformat(locked_until)
-        if datetime.now() < locked_until_dt:
-            remaining = int((locked_until_dt - datetime.now()).total_seconds())
-            return True, remaining
-        else:
-            # Lockout đã hết hạn, reset
-            delete_cache(key)
-            return False, None
-    
-    return False, None
+    return _lock_state(*lockout_store.check(email))
 
 
 def record_failed_attempt(email: str) -> Tuple[int, bool]:
     """
-    Ghi nhận lần đăng nhập sai.
-    
+    Ghi nhận lần đăng nhập sai (atomic, 1 round trip).
+
     Args:
         email: Email đăng nhập sai
-        
+
     Returns:
         Tuple (failed_count, is_now_locked)
     """
-    key = _get_lockout_key(email)
-    data = get_cache(key) or {"failed_attempts": 0, "locked_until": None}
-    
-    # Tăng số lần sai
-    data["failed_attempts"] = data.get("failed_attempts", 0) + 1
-    data["last_attempt"] = datetime.now().isoformat()
-    
-    # Kiểm tra có đủ để khóa không
-    is_locked = False
-    if data["failed_attempts"] >= AccountLockout.MAX_FAILED_ATTEMPTS:
-        lockout_until = datetime.now() + timedelta(minutes=AccountLockout.LOCKOUT_DURATION_MINUTES)
-        data["locked_until"] = lockout_until.isoformat()
-        is_locked = True
-        logger.warning(f"Account locked: {email} - Too many failed attempts")
-    
-    # Lưu vào cache (ttl sau RESET_ATTEMPTS_AFTER_MINUTES)
-    set_cache(key, data, ttl=AccountLockout.RESET_ATTEMPTS_AFTER_MINUTES * 60)
-    
-    return data["failed_attempts"], is_locked
+    return _fail_result(email, *lockout_store.fail(email))
 
 
 def reset_failed_attempts(email: str) -> None:
     """
     Reset số lần đăng nhập sai sau khi login thành công.
-    
+
     Args:
         email: Email cần reset
     """
-    key = _get_lockout_key(email)
-    delete_cache(key)
+    lockout_store.reset(email)
     logger.info(f"Reset failed attempts for: {email}")
 
 
 def get_lockout_status(email: str) -> dict:
     """
     Lấy thông tin trạng thái lockout.
-    
+
     Returns:
         dict với các thông tin lockout
     """
-    key = _get_lockout_key(email)
-    data = get_cache(key)
-    
-    if not data:
-        return {
-            "is_locked": False,
-            "failed_attempts": 0,
-            "remaining_attempts": AccountLockout.MAX_FAILED_ATTEMPTS,
-            "locked_until": None,
-            "remaining_seconds": None
-        }
-    
-    is_locked, remaining_seconds = check_account_locked(email)
-    failed_attempts = data.get("failed_attempts", 0)
-    
+    return _lockout_status(*check_account_locked(email))
+
+
+def _lockout_status(is_locked: bool, remaining_seconds: Optional[int], failed_attempts: int) -> dict:
+    locked_until = None
+    if is_locked:
+        locked_until = (datetime.now() + timedelta(seconds=remaining_seconds)).isoformat()
+
     return {
         "is_locked": is_locked,
         "failed_attempts": failed_attempts,
         "remaining_attempts": max(0, AccountLockout.MAX_FAILED_ATTEMPTS - failed_attempts),
-        "locked_until": data.get("locked_until"),
+        "locked_until": locked_until,
         "remaining_seconds": remaining_seconds
     }
+
+
+# ASYNC API (route async, không block event loop)
+
+async def acheck_account_locked(email: str) -> Tuple[bool, Optional[int], int]:
+    """Async check_account_locked"""
+    return _lock_state(*await lockout_store.acheck(email))
+
+
+async def arecord_failed_attempt(email: str) -> Tuple[int, bool]:
+    """Async record_failed_attempt"""
+    return _fail_result(email, *await lockout_store.afail(email))
+
+
+async def areset_failed_attempts(email: str) -> None:
+    """Async reset_failed_attempts"""
+    await lockout_store.areset(email)
+    logger.info(f"Reset failed attempts for: {email}")
+
+
+async def aget_lockout_status(email: str) -> dict:
+    """Async get_lockout_status"""
+    return _lockout_status(*await acheck_account_locked(email))
@@ -0,0 +1,18 @@
+"""
+Role service.
+
+Role catalog được phục vụ từ role registry in-memory (cache.role_registry),
+registry tự reload khi version tag "roles" đổi (crud.role bump sau mỗi commit).
+"""
+
+from typing import List
+
+from cache.role_registry import role_registry
+
+
+def get_role_catalog() -> List[dict]:
+    """
+    Lấy danh sách roles đang active (id, name, display_name).
+    Không query DB (trừ lần load registry đầu tiên).
+    """
+    return role_registry.catalog()
@@ -0,0 +1,258 @@
+"""
+Bulk user import (CSV / NDJSON).
+
+Body được đọc dạng stream và xử lý theo batch:
+    parse -> validate (validate_password, email, role) -> hash song song trên
+    password_pool (mọi core) -> một multi-row INSERT + commit mỗi batch
+
+Trùng email (trong file hoặc với DB) và trùng user_code được xử lý theo batch;
+kết quả trả về là report theo từng dòng.
+"""
+
+import asyncio
+import csv
+import logging
+import re
+from typing import AsyncIterator, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from cache.email_filter import email_filter, normalize_email
+from cache.role_registry import role_registry
+from core.config import settings
+from core.password_policy import validate_password
+from core.password_pool import password_pool, hash_many_job, PasswordPoolBusy, PasswordPoolTimeout
+from core.serialization import loads
+from crud.user import bulk_insert_users, get_existing_emails
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ("csv", "ndjson")
+EMAIL_PATTERN = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
+NAME_MAX_LENGTH = 64
+EMAIL_MAX_LENGTH = 120
+HASH_TIMEOUT_RETRIES = 2  # Slice quá timeout bao nhiêu lần thì bỏ (các dòng thành lỗi)
+
+
+class ImportRow:
+    """Một dòng trong file import và kết quả xử lý của nó"""
+
+    __slots__ = ("row", "name", "email", "password", "role_id", "hashed_password", "errors", "result")
+
+    def __init__(self, row: int, record: dict):
+        self.row = row
+        self.name = str(record.get("name") or "").strip()
+        self.email = str(record.get("email") or "").strip()
+        self.password = str(record.get("password") or "")
+        self.role_id = None
+        self.hashed_password = None
+        self.errors: List[str] = []
+        self.result = None
+
+    def report(self) -> dict:
+        if self.errors:
+            return {"row": self.row, "email": self.email, "status": "error", "errors": self.errors}
+        return {"row": self.row, "email": self.email, "status": "created", **self.result}
+
+
+def detect_format(content_type: Optional[str], fmt: Optional[str]) -> Optional[str]:
+    """Format từ query param hoặc Content-Type"""
+    if fmt:
+        return fmt if fmt in FORMATS else None
+    content_type = (content_type or "").split(";")[0].strip().lower()
+    if content_type in ("text/csv", "application/csv"):
+        return "csv"
+    if content_type in ("application/x-ndjson", "application/ndjson", "application/jsonl"):
+        return "ndjson"
+    return None
+
+
+async def _iter_lines(stream: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """Tách body stream thành từng dòng (UTF-8, bỏ BOM)"""
+    buffer = b""
+    first = True
+    async for chunk in stream:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            text = line.decode("utf-8", errors="replace").rstrip("\r")
+            if first:
+                text, first = text.lstrip("\ufeff"), False
+            yield text
+    if buffer:
+        text = buffer.decode("utf-8", errors="replace").rstrip("\r")
+        yield text.lstrip("\ufeff") if first else text
+
+
+async def iter_records(stream: AsyncIterator[bytes], fmt: str) -> AsyncIterator[Tuple[int, Optional[dict], Optional[str]]]:
+    """
+    (row number, record, parse error) cho từng dòng dữ liệu.
+    CSV: dòng đầu là header (name,email,password[,role]), mỗi record một dòng.
+    """
+    header = None
+    row = 0
+    async for line in _iter_lines(stream):
+        if not line.strip():
+            continue
+        if fmt == "csv":
+            fields = next(csv.reader([line]))
+            if header is None:
+                header = [field.strip().lower() for field in fields]
+                continue
+            row += 1
+            if len(fields) != len(header):
+                yield row, None, f"Expected {len(header)} columns, got {len(fields)}"
+                continue
+            yield row, dict(zip(header, fields)), None
+        else:
+            row += 1
+            try:
+                record = loads(line)
+            except ValueError:
+                yield row, None, "Invalid JSON"
+                continue
+            if not isinstance(record, dict):
+                yield row, None, "Each line must be a JSON object"
+                continue
+            yield row, record, None
+
+
+def validate_row(item: ImportRow, record: dict, seen_emails: set) -> None:
+    """Validate một dòng (ghi lỗi vào item.errors)"""
+    if not item.name:
+        item.errors.append("Name is required")
+    elif len(item.name) > NAME_MAX_LENGTH:
+        item.errors.append(f"Name must not exceed {NAME_MAX_LENGTH} characters")
+
+    if not EMAIL_PATTERN.match(item.email) or len(item.email) > EMAIL_MAX_LENGTH:
+        item.errors.append("Invalid email address")
+    elif normalize_email(item.email) in seen_emails:
+        item.errors.append("Duplicate email in file")
+    else:
+        seen_emails.add(normalize_email(item.email))
+
+    is_valid, errors = validate_password(item.password)
+    if not is_valid:
+        item.errors.extend(errors)
+
+    role_name = str(record.get("role") or "").strip().lower()
+    role = role_registry.get_by_name(role_name) if role_name else role_registry.get(None)
+    if role is None or not role.is_active:
+        item.errors.append(f"Unknown role: {role_name}")
+    else:
+        item.role_id = role.id
+
+
+async def hash_rows(rows: List[ImportRow]) -> None:
+    """
+    Hash password song song trên password_pool.
+    Mỗi job hash một slice nhỏ và tối đa `workers` job chạy cùng lúc, để login
+    vẫn được phục vụ xen kẽ thay vì xếp hàng sau cả batch.
+
+    Lỗi của một slice (timeout quá HASH_TIMEOUT_RETRIES lần, pool hỏng...) chỉ
+    làm các dòng của slice đó thành lỗi, không làm hỏng cả request: các batch
+    trước đã commit.
+    """
+    slice_size = settings.USER_IMPORT_HASH_SLICE
+    slices = [rows[i:i + slice_size] for i in range(0, len(rows), slice_size)]
+    semaphore = asyncio.Semaphore(max(password_pool.workers, 1))
+    rounds = await run_in_threadpool(lambda: password_pool.rounds)
+
+    def fail(part: List[ImportRow], error: str):
+        for item in part:
+            item.errors.append(error)
+            item.password = None
+
+    async def run(part: List[ImportRow]):
+        timeouts = 0
+        async with semaphore:
+            while True:
+                try:
+                    hashes = await password_pool.run_async(hash_many_job, [r.password for r in part], rounds)
+                    break
+                except PasswordPoolTimeout as e:
+                    timeouts += 1
+                    if timeouts > HASH_TIMEOUT_RETRIES:
+                        return fail(part, "Password hashing timed out")
+                    await asyncio.sleep(e.retry_after)
+                except PasswordPoolBusy as e:
+                    # Pool đang phục vụ login: nhường rồi thử lại
+                    await asyncio.sleep(e.retry_after)
+                except Exception as e:
+                    logger.error(f"User import hash error: {e}")
+                    return fail(part, "Password hashing failed")
+        for item, hashed in zip(part, hashes):
+            item.hashed_password = hashed
+            item.password = None
+
+    await asyncio.gather(*(run(part) for part in slices))
+
+
+def mark_existing(db: Session, rows: List[ImportRow]) -> None:
+    """Đánh dấu email đã đăng ký (trước khi hash): filter loại phần lớn, còn lại một query IN"""
+    maybe_existing = [r.email for r in rows if email_filter.might_contain(r.email)]
+    existing = get_existing_emails(db, maybe_existing)
+    for item in rows:
+        if item.email.lower() in existing:
+            item.errors.append("Email already registered")
+
+
+def insert_rows(db: Session, rows: List[ImportRow]) -> None:
+    """Insert cả batch bằng một multi-row INSERT (chạy trong threadpool)"""
+    valid = [r for r in rows if not r.errors]
+    created = bulk_insert_users(db, [
+        {"name": r.name, "email": r.email, "hashed_password": r.hashed_password, "role_id": r.role_id}
+        for r in valid
+    ])
+    for item in valid:
+        item.result = created.get(item.email.lower())
+        if item.result is None:
+            item.errors.append("Email already registered")
+
+
+async def import_users(stream: AsyncIterator[bytes], fmt: str, db: Session) -> dict:
+    """Import users từ body stream, trả về summary + report từng dòng"""
+    batch_size = settings.USER_IMPORT_BATCH_SIZE
+    max_rows = settings.USER_IMPORT_MAX_ROWS
+    report: List[dict] = []
+    seen_emails: set = set()
+    batch: List[ImportRow] = []
+    truncated = False
+
+    async def flush(batch: List[ImportRow]):
+        valid = [r for r in batch if not r.errors]
+        if valid:
+            await run_in_threadpool(mark_existing, db, valid)
+            valid = [r for r in valid if not r.errors]
+        if valid:
+            await hash_rows(valid)
+            await run_in_threadpool(insert_rows, db, valid)
+        report.extend(item.report() for item in batch)
+
+    async for row, record, error in iter_records(stream, fmt):
+        if row > max_rows:
+            truncated = True
+            break
+        if record is None:
+            report.append({"row": row, "email": None, "status": "error", "errors": [error]})
+            continue
+        item = ImportRow(row, record)
+        validate_row(item, record, seen_emails)
+        batch.append(item)
+        if len(batch) >= batch_size:
+            await flush(batch)
+            batch = []
+    if batch:
+        await flush(batch)
+
+    report.sort(key=lambda r: r["row"])
+    created = sum(1 for r in report if r["status"] == "created")
+    logger.info(f"User import: {created} created, {len(report) - created} failed")
+    return {
+        "total": len(report),
+        "created": created,
+        "failed": len(report) - created,
+        "truncated": truncated,
+        "results": report,
+    }
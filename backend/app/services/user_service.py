@@ -1,9 +1,14 @@
+from sqlalchemy import or_
 from sqlalchemy.orm import Session
-from typing import Optional, List
+from typing import Optional, List, Iterable
 
-from crud.user import get_user, create_user, get_users
+from crud.user import get_user, get_user_by_email, create_user, get_users, get_users_by_ids
 from schemas.user import UserCreate
 from models.user import User
+from cache.principal_cache import Principal, principal_cache
+from cache.role_registry import role_registry
+from cache.email_filter import email_filter
+from services.auth_service import get_principal
 
 
 def service_create_user(db: Session, user: UserCreate) -> User:
@@ -14,6 +19,19 @@ def service_create_user(db: Session, user: UserCreate) -> User:
     return create_user(db, user)
 
 
+def email_exists(db: Session, email: str) -> bool:
+    """
+    Email đã được đăng ký chưa.
+    Bloom filter trả lời "chắc chắn chưa" không cần DB, còn lại hỏi DB.
+    """
+    if not email_filter.might_contain(email):
+        return False
+    exists = get_user_by_email(db, email) is not None
+    if not exists:
+        email_filter.record_false_positive()
+    return exists
+
+
 def service_get_user(db: Session, user_id: int) -> Optional[User]:
     """
     Lấy user theo ID.
@@ -22,6 +40,27 @@ def service_get_user(db: Session, user_id: int) -> Optional[User]:
     return get_user(db, user_id)
 
 
+def service_get_users_by_ids(db: Session, user_ids: Iterable[int]) -> dict:
+    """
+    Batch lookup theo ID: principal cache trước, phần còn lại một query IN
+    (role eager-loaded) rồi đưa vào cache.
+    Returns {"users": [...] theo thứ tự yêu cầu, "missing": [id không tồn tại]}.
+    """
+    ids = list(dict.fromkeys(user_ids))  # Bỏ trùng, giữ thứ tự
+    epoch = principal_cache.epoch
+    principals, generations = principal_cache.lookup_many(ids)
+    to_load = [user_id for user_id in ids if user_id not in principals]
+    if to_load:
+        loaded = [Principal.from_user(user) for user in get_users_by_ids(db, to_load)]
+        principal_cache.put_many(loaded, generations, epoch)
+        principals.update((principal.id, principal) for principal in loaded)
+
+    return {
+        "users": [principal_to_user_read(db, principals[user_id]) for user_id in ids if user_id in principals],
+        "missing": [user_id for user_id in ids if user_id not in principals],
+    }
+
+
 def service_get_users(
     db: Session,
     skip: int = 0,
@@ -30,4 +69,40 @@ def service_get_users(
     """
     Lấy danh sách users với phân trang.
     """
-    return get_users(db, skip=skip, limit=limit)
\ No newline at end of file
+    return get_users(db, skip=skip, limit=limit)
+
+
+def principal_to_user_read(db: Session, principal: Principal) -> dict:
+    """
+    Dựng dữ liệu UserRead từ principal cache + role registry (không query DB).
+    Principal từ claims token không có profile nên được lấy lại qua principal cache.
+    """
+    if principal.name is None:
+        principal = get_principal(principal.id) or principal
+    entry = role_registry.get(principal.role_id) if principal.role_id is not None else None
+    role = entry.to_simple() if entry else None
+    return {
+        "id": principal.id,
+        "user_code": principal.user_code,
+        "name": principal.name,
+        "email": principal.email,
+        "role_id": principal.role_id,
+        "role": role,
+    }
+
+
+def user_search_document(doc) -> dict:
+    """Dữ liệu UserRead cho một kết quả search (role từ role registry)"""
+    entry = role_registry.get(doc["role_id"]) if doc["role_id"] is not None else None
+    return dict(doc, role=entry.to_simple() if entry else None)
+
+
+def search_users_db(db: Session, query: str, role_id: Optional[int] = None, limit: int = 20) -> List[dict]:
+    """Fallback khi search index chưa sẵn sàng: LIKE trên name/email/user_code"""
+    pattern = f"%{query.strip()}%"
+    q = db.query(User.id, User.user_code, User.name, User.email, User.role_id).filter(
+        or_(User.name.like(pattern), User.email.like(pattern), User.user_code.like(pattern))
+    )
+    if role_id is not None:
+        q = q.filter(User.role_id == role_id)
+    return [row._asdict() for row in q.order_by(User.name).limit(limit).all()]
@@ -0,0 +1,78 @@
+"""
+User stats service.
+
+Số user theo role và số đăng ký theo ngày được đọc từ bảng aggregate
+(crud.user_stats) thay vì COUNT(*) trên users: chi phí không phụ thuộc số user.
+Aggregate được cập nhật cùng transaction với mỗi lần ghi users; job
+reconcile định kỳ đếm lại để sửa sai lệch (ví dụ thay đổi ngoài app).
+"""
+
+import asyncio
+import logging
+from datetime import date, timedelta
+
+from sqlalchemy.orm import Session
+
+from cache.redis_client import redis_client, is_redis_available
+from cache.role_registry import role_registry
+from core.config import settings
+from crud.user_stats import get_role_counts, get_daily_signups, reconcile_user_stats, NO_ROLE
+from database.session import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+RECONCILE_LOCK_KEY = "userstats:reconcile:lock"
+
+
+def get_user_stats(db: Session, days: int = 30) -> dict:
+    """
+    Tổng số user, số user theo role (mọi role, kể cả 0 user) và số đăng ký
+    mỗi ngày trong `days` ngày gần nhất (ngày không có đăng ký = 0).
+    """
+    counts = get_role_counts(db)
+    by_role = [
+        {**entry.to_simple(), "count": counts.get(entry.id, 0)}
+        for entry in role_registry.all_roles()
+    ]
+    if counts.get(NO_ROLE):
+        by_role.append({"id": None, "name": None, "display_name": None, "count": counts[NO_ROLE]})
+
+    today = date.today()
+    since = today - timedelta(days=days - 1)
+    signups = get_daily_signups(db, since)
+    # Ngày mới nhất có thể lệch today theo timezone của DB: lấy theo dữ liệu nếu lớn hơn
+    last = max([today, *signups])
+    daily = []
+    day = since
+    while day <= last:
+        daily.append({"date": day, "count": signups.get(day, 0)})
+        day += timedelta(days=1)
+
+    return {"total": sum(counts.values()), "by_role": by_role, "signups": daily}
+
+
+def run_reconciliation() -> int:
+    """Reconcile một lần (chỉ một worker mỗi interval khi có Redis)"""
+    if is_redis_available and not redis_client.set(
+        RECONCILE_LOCK_KEY, 1, nx=True, ex=max(settings.USER_STATS_RECONCILE_INTERVAL - 1, 1)
+    ):
+        return 0
+    db = SessionLocal()
+    try:
+        fixed = reconcile_user_stats(db)
+    finally:
+        db.close()
+    if fixed:
+        logger.warning(f"User stats reconciliation corrected {fixed} aggregate rows")
+    return fixed
+
+
+async def reconcile_periodically() -> None:
+    """Background task trong lifespan: reconcile lúc startup rồi mỗi interval"""
+    loop = asyncio.get_running_loop()
+    while True:
+        try:
+            await loop.run_in_executor(None, run_reconciliation)
+        except Exception as e:
+            logger.error(f"User stats reconciliation failed: {e}")
+        await asyncio.sleep(settings.USER_STATS_RECONCILE_INTERVAL)
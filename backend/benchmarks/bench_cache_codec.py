@@ -0,0 +1,96 @@
+"""
+Benchmark: cache codec (cache.codec) so với đường JSON cũ của set_cache/get_cache.
+
+Đường cũ: set_cache JSON-encode giá trị không phải scalar, lưu scalar raw;
+get_cache thử JSON parse mọi giá trị đọc được (str "123" trở thành int).
+
+Đo encode, decode (us/op) và số byte lưu trong Redis cho các giá trị app
+thực sự cache: token version, principal, response cache entry nhỏ / lớn.
+
+Chạy:
+    cd backend && python benchmarks/bench_cache_codec.py
+"""
+
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "app"))
+
+from cache.codec import decode, encode  # noqa: E402
+from core.serialization import dumps, dumps_str, loads  # noqa: E402
+
+ROUNDS = 20_000
+
+
+def legacy_encode(value) -> bytes:
+    # set_cache cũ + encoding của redis-py (str -> UTF-8)
+    stored = dumps_str(value) if not isinstance(value, (str, int, float, bool)) else value
+    return str(stored).encode("utf-8")
+
+
+def legacy_decode(data: bytes):
+    # get_cache cũ: decode_responses=True rồi thử JSON
+    value = data.decode("utf-8")
+    try:
+        return loads(value)
+    except ValueError:
+        return value
+
+
+def _user(i: int) -> dict:
+    return {
+        "id": i,
+        "name": f"Nguyễn Văn {i}",
+        "email": f"user{i}@school.edu.vn",
+        "user_code": f"HS{i:08d}",
+        "role_id": 3,
+        "role": {"id": 3, "name": "student", "display_name": "Học sinh"},
+    }
+
+
+def _entry(users: int) -> dict:
+    body = dumps([_user(i) for i in range(users)]).decode("utf-8")
+    return {"etag": '"' + "a" * 32 + '"', "body": body, "media_type": "application/json",
+            "tags": {f"user:{i}": 1729000000000000000 + i for i in range(min(users, 3))} | {"roles": 1}}
+
+
+SAMPLES = [
+    ("token version (int)", 1729000000123456789),
+    ("short str", "teacher"),
+    ("principal (dict)", {"id": 42, "email": "a@x.com", "name": "Trần Thị B", "user_code": "GV00000042",
+                          "role_id": 2, "role_name": "teacher", "version": 1729000000123}),
+    ("response entry, 1 user", _entry(1)),
+    ("response entry, 50 users", _entry(50)),
+    ("response entry, 500 users", _entry(500)),
+]
+
+
+def _per_op_us(fn, arg, rounds: int) -> float:
+    started = time.perf_counter()
+    for _ in range(rounds):
+        fn(arg)
+    return (time.perf_counter() - started) / rounds * 1e6
+
+
+def main():
+    # Tính đúng: type được giữ nguyên, giá trị cũ vẫn đọc được
+    for value in ("123", "true", "", 0, -(2 ** 70), 1.5, True, None, b"\x00\xc1", [1, "2"], {"k": "Việt"}):
+        assert decode(encode(value)) == value and type(decode(encode(value))) is type(value), value
+    assert legacy_decode(legacy_encode("123")) == 123  # Lỗi của đường cũ
+    assert decode(legacy_encode({"a": 1})) == {"a": 1} and decode(b"plain text") == "plain text"
+
+    print(f"{'value':<28}{'json bytes':>12}{'codec bytes':>13}{'json enc us':>13}{'codec enc us':>14}"
+          f"{'json dec us':>13}{'codec dec us':>14}")
+    for name, value in SAMPLES:
+        rounds = max(200, ROUNDS // max(1, len(legacy_encode(value)) // 1000))
+        old, new = legacy_encode(value), encode(value)
+        print(
+            f"{name:<28}{len(old):>12}{len(new):>13}"
+            f"{_per_op_us(legacy_encode, value, rounds):>13.2f}{_per_op_us(encode, value, rounds):>14.2f}"
+            f"{_per_op_us(legacy_decode, old, rounds):>13.2f}{_per_op_us(decode, new, rounds):>14.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Benchmark: chi phí verify access token mỗi request.
+
+So sánh python-jose jwt.decode (đường cũ) với lean HS256 verify (cache miss)
+và verified-token cache (cache hit).
+
+Chạy:
+    cd backend && python benchmarks/bench_jwt.py
+"""
+
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "app"))
+
+from jose import jwt  # noqa: E402
+
+from core.security import (  # noqa: E402
+    ALGORITHM,
+    SECRET_KEY,
+    VerifiedTokenCache,
+    _verify_hs256,
+    create_access_token,
+    decode_access_token,
+    token_cache,
+)
+
+TOKEN = create_access_token({"sub": "42", "email": "user42@school.edu.vn", "role": "student", "rid": 3})
+
+
+def jose_decode():
+    return jwt.decode(TOKEN, SECRET_KEY, algorithms=[ALGORITHM])
+
+
+def fast_miss():
+    return _verify_hs256(TOKEN)
+
+
+def cache_hit():
+    return decode_access_token(TOKEN)
+
+
+CASES = [
+    ("lean HS256 (cache miss)", fast_miss),
+    ("decode_access_token (hit)", cache_hit),
+]
+
+
+def bench(fn, number):
+    return min(timeit.repeat(fn, number=number, repeat=5)) / number * 1e6
+
+
+def main():
+    if ALGORITHM != "HS256":
+        print(f"ALGORITHM={ALGORITHM}: fast path disabled, decode falls back to jose")
+        return
+
+    expected = jose_decode()
+    assert fast_miss() == expected and cache_hit() == expected
+
+    number = 20000
+    base_us = bench(jose_decode, number)
+    print(f"{'path':<28}{'us/token':>10}{'speedup':>10}")
+    print(f"{'jose jwt.decode':<28}{base_us:>10.2f}{'1.0x':>10}")
+    for name, fn in CASES:
+        us = bench(fn, number)
+        print(f"{name:<28}{us:>10.2f}{base_us / us:>9.1f}x")
+
+    # Bounded: distinct tokens never hold more than max_entries
+    cache = VerifiedTokenCache(max_entries=1000)
+    for i in range(5000):
+        cache.put(f"token-{i}", {"sub": str(i), "exp": 2**40})
+    assert cache.stats()["entries"] == 1000
+    print(f"cache stats: {token_cache.stats()}")
+
+
+if __name__ == "__main__":
+    main()
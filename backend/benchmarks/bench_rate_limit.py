@@ -0,0 +1,103 @@
+"""
+Benchmark: memory và latency của rate limiter khi số client tăng.
+
+So sánh limiter cũ (list timestamp mỗi IP trong defaultdict, lock, không
+bao giờ xóa IP) với SlidingWindowLimiter (state cố định mỗi key, evict key idle).
+
+100k client phân biệt, mỗi client gửi vài request rồi im lặng (như NAT /
+mobile IP đổi liên tục); thời gian được giả lập để chạy nhanh.
+
+Chạy:
+    cd backend && python benchmarks/bench_rate_limit.py
+"""
+
+import sys
+import time
+import tracemalloc
+from collections import defaultdict
+from pathlib import Path
+from threading import Lock
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "app"))
+
+from core.rate_limit import SlidingWindowLimiter  # noqa: E402
+
+CLIENTS = 100_000
+REQUESTS_PER_CLIENT = 3
+CLIENTS_PER_SECOND = 2_000  # Client mới mỗi giây (giả lập)
+LIMIT = 20
+CHECKPOINTS = 5
+
+
+class ListLimiter:
+    """Limiter cũ (RateLimitMiddleware trước đây)"""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.requests = defaultdict(list)
+        self.lock = Lock()
+
+    def hit(self, key: str, now: float):
+        with self.lock:
+            self.requests[key] = [t for t in self.requests[key] if now - t < 1.0]
+            if len(self.requests[key]) >= self.limit:
+                return False, 1
+            self.requests[key].append(now)
+        return True, 0
+
+
+def _drive(limiter, on_checkpoint):
+    step = CLIENTS // CHECKPOINTS
+    for chunk in range(CHECKPOINTS):
+        started = time.perf_counter()
+        for i in range(chunk * step, (chunk + 1) * step):
+            now = i / CLIENTS_PER_SECOND
+            key = f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}"
+            for r in range(REQUESTS_PER_CLIENT):
+                limiter.hit(key, now + r * 0.01)
+        on_checkpoint((chunk + 1) * step, (time.perf_counter() - started) / (step * REQUESTS_PER_CLIENT) * 1e6)
+
+
+def _keys(limiter) -> int:
+    return len(limiter.requests if isinstance(limiter, ListLimiter) else limiter._state)
+
+
+def run(factory):
+    """(clients seen, keys held, memory MB, us/request) tại mỗi checkpoint"""
+    # Latency đo riêng: tracemalloc làm chậm mọi allocation
+    latencies = []
+    _drive(factory(), lambda seen, us: latencies.append(us))
+
+    rows = []
+    limiter = factory()
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+
+    def checkpoint(seen, _):
+        memory = (tracemalloc.get_traced_memory()[0] - base) / 1e6
+        rows.append((seen, _keys(limiter), memory, latencies[len(rows)]))
+
+    _drive(limiter, checkpoint)
+    tracemalloc.stop()
+    return rows
+
+
+def main():
+    # Tính đúng: client vượt limit trong 1s bị chặn, window sau được gửi tiếp
+    limiter = SlidingWindowLimiter(limit=5, window=1.0)
+    assert [limiter.hit("a", 10.0 + i * 0.01)[0] for i in range(7)] == [True] * 5 + [False] * 2
+    assert limiter.hit("a", 12.5)[0]
+
+    for name, factory in (
+        ("list + lock (old)", lambda: ListLimiter(LIMIT)),
+        ("sliding window", lambda: SlidingWindowLimiter(limit=LIMIT, window=1.0)),
+    ):
+        print(name)
+        print(f"{'clients seen':>14}{'keys held':>12}{'memory MB':>12}{'us/request':>12}")
+        for seen, keys, memory, us in run(factory):
+            print(f"{seen:>14}{keys:>12}{memory:>12.2f}{us:>12.2f}")
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Benchmark: chi phí serialize response theo endpoint.
+
+So sánh đường mặc định của FastAPI (model_validate + jsonable_encoder + json.dumps)
+với TypeAdapter precompiled (validate + dump_json) và FastJSONResponse.
+
+Chạy:
+    cd backend && python benchmarks/bench_serialization.py
+"""
+
+import json
+import sys
+import timeit
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "app"))
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+
+from schemas.user import UserRead  # noqa: E402
+from schemas.role import RoleSimple  # noqa: E402
+from schemas.serializers import USER_READ, USER_READ_LIST, ROLE_SIMPLE_LIST, serialize  # noqa: E402
+from core.serialization import dumps  # noqa: E402
+
+ROLES = [
+    SimpleNamespace(id=1, name="admin", display_name="Quản trị viên"),
+    SimpleNamespace(id=2, name="teacher", display_name="Giảng viên"),
+    SimpleNamespace(id=3, name="student", display_name="Sinh viên"),
+]
+
+
+def make_user(i: int):
+    role = ROLES[i % 3]
+    return SimpleNamespace(
+        id=i,
+        user_code=f"AB{i:08d}",
+        name=f"Nguyễn Văn {i}",
+        email=f"user{i}@school.edu.vn",
+        role_id=role.id,
+        role=role,
+    )
+
+
+USER = make_user(1)
+USERS = [make_user(i) for i in range(100)]
+
+
+def default_path(model, obj, many=False):
+    """FastAPI default: validate → jsonable_encoder → json.dumps"""
+    if many:
+        data = [model.model_validate(o, from_attributes=True) for o in obj]
+    else:
+        data = model.model_validate(obj, from_attributes=True)
+    return json.dumps(jsonable_encoder(data), ensure_ascii=False).encode("utf-8")
+
+
+def fast_dict_path(obj):
+    """Dict response rendered by FastJSONResponse"""
+    return dumps([{"id": r.id, "name": r.name, "display_name": r.display_name} for r in obj])
+
+
+CASES = [
+    ("GET /api/users/me", lambda: default_path(UserRead, USER), lambda: serialize(USER_READ, USER)),
+    ("GET /auth/roles", lambda: default_path(RoleSimple, ROLES, many=True), lambda: serialize(ROLE_SIMPLE_LIST, ROLES)),
+    ("GET /auth/roles (dict)", lambda: json.dumps([{"id": r.id, "name": r.name, "display_name": r.display_name} for r in ROLES]).encode(), lambda: fast_dict_path(ROLES)),
+    ("100 x UserRead", lambda: default_path(UserRead, USERS, many=True), lambda: serialize(USER_READ_LIST, USERS)),
+]
+
+
+def bench(fn, number):
+    return min(timeit.repeat(fn, number=number, repeat=5)) / number * 1e6
+
+
+def main():
+    print(f"{'endpoint':<26}{'default (us)':>14}{'fast (us)':>12}{'speedup':>10}")
+    for name, baseline, fast in CASES:
+        assert json.loads(baseline()) == json.loads(fast())
+        number = 200 if "100" in name else 5000
+        base_us = bench(baseline, number)
+        fast_us = bench(fast, number)
+        print(f"{name:<26}{base_us:>14.2f}{fast_us:>12.2f}{base_us / fast_us:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
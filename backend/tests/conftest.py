@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# Module của app import theo gốc backend/app (giống benchmarks)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "app"))
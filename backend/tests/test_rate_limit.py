@@ -0,0 +1,140 @@
+"""
+Quota semantics của core.rate_limit (in-process limiter, không cần Redis).
+
+Chạy:
+    cd backend && python -m pytest -q tests
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+from starlette.middleware.base import BaseHTTPMiddleware
+
+from core.rate_limit import QuotaLimiter, QuotaPolicy, RateLimitMiddleware
+
+
+def make_limiter(*policies) -> QuotaLimiter:
+    return QuotaLimiter(list(policies))
+
+
+def ip_policy(name="read-ip", burst=5):
+    # limit 1 / 60s: quota không hồi trong lúc chạy test
+    return QuotaPolicy(name, "read", key="ip", limit=1, window=60, burst=burst, use_redis=False)
+
+
+def user_policy(name="read-user", burst=2):
+    return QuotaPolicy(name, "read", key="sub", limit=1, window=60, burst=burst, use_redis=False)
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+class FakeAuthMiddleware(BaseHTTPMiddleware):
+    """Thay JWTAuthMiddleware: header X-User -> request.state.user"""
+
+    async def dispatch(self, request: Request, call_next):
+        user_id = request.headers.get("X-User")
+        if user_id:
+            request.state.user = SimpleNamespace(id=int(user_id))
+        return await call_next(request)
+
+
+def make_client(limiter: QuotaLimiter) -> TestClient:
+    """Cùng layout với main.py: quota theo IP ở app ngoài, quota theo user sau auth trong /api"""
+    inner = FastAPI()
+
+    @inner.get("/items")
+    def items():
+        return {"ok": True}
+
+    inner.add_middleware(RateLimitMiddleware, limiter=limiter, per_principal=True)
+    inner.add_middleware(FakeAuthMiddleware)
+
+    app = FastAPI()
+
+    @app.get("/auth/roles")
+    def roles():
+        return []
+
+    app.mount("/api", inner)
+    app.add_middleware(RateLimitMiddleware, limiter=limiter)
+    return TestClient(app)
+
+
+def test_rejection_refunds_policies_that_passed():
+    wide, narrow = ip_policy("wide", burst=10), ip_policy("narrow", burst=1)
+    limiter = make_limiter(wide, narrow)
+
+    assert run(limiter.check("read", "1.1.1.1"))[1].allowed
+    for _ in range(5):
+        policy, result = run(limiter.check("read", "1.1.1.1"))
+        assert not result.allowed and policy is narrow
+
+    # Chỉ request đầu tiên được tính vào policy rộng
+    assert wide.limiter.stats()["local"]["allowed"] == 1
+    assert limiter.rejected == {"wide": 0, "narrow": 5}
+
+
+def test_user_policies_skipped_without_principal():
+    limiter = make_limiter(user_policy(burst=2), ip_policy(burst=50))
+
+    policy, result = run(limiter.check("read", "1.1.1.1"))
+    assert result.allowed and policy.name == "read-ip"
+    assert limiter.checked["read-user"] == 0
+
+
+def test_anonymous_requests_only_use_ip_quota():
+    client = make_client(make_limiter(user_policy(burst=2), ip_policy(burst=5)))
+
+    # Nhiều hơn burst của read-user: request chưa đăng nhập không chia chung bucket theo user
+    for _ in range(5):
+        response = client.get("/auth/roles")
+        assert response.status_code == 200
+        assert response.headers["RateLimit-Limit"] == "5"
+    response = client.get("/auth/roles")
+    assert response.status_code == 429
+    assert response.json()["policy"] == "read-ip"
+
+
+def test_user_key_comes_from_principal_not_token():
+    client = make_client(make_limiter(user_policy(burst=2), ip_policy(burst=50)))
+
+    # Token không được decode lại: không có principal thì không có quota theo user
+    for _ in range(4):
+        response = client.get("/api/items", headers={"Authorization": "Bearer not-a-token"})
+        assert response.status_code == 200
+
+    assert client.get("/api/items", headers={"X-User": "7"}).status_code == 200
+    assert client.get("/api/items", headers={"X-User": "7"}).status_code == 200
+    response = client.get("/api/items", headers={"X-User": "7"})
+    assert response.status_code == 429
+    assert response.json()["policy"] == "read-user"
+    # User khác cùng IP có bucket riêng
+    assert client.get("/api/items", headers={"X-User": "8"}).status_code == 200
+
+
+def test_user_rejection_does_not_drain_ip_quota():
+    ip = ip_policy(burst=4)
+    client = make_client(make_limiter(user_policy(burst=2), ip))
+
+    assert client.get("/api/items", headers={"X-User": "7"}).status_code == 200
+    assert client.get("/api/items", headers={"X-User": "7"}).status_code == 200
+    # User hết quota retry liên tục: quota IP không bị tiêu
+    for _ in range(10):
+        assert client.get("/api/items", headers={"X-User": "7"}).status_code == 429
+
+    assert client.get("/auth/roles").status_code == 200
+    assert client.get("/auth/roles").status_code == 200
+    assert client.get("/auth/roles").status_code == 429
+
+
+def test_headers_report_policy_with_least_remaining():
+    client = make_client(make_limiter(user_policy(burst=3), ip_policy(burst=50)))
+
+    response = client.get("/api/items", headers={"X-User": "7"})
+    assert response.status_code == 200
+    assert response.headers["RateLimit-Limit"] == "3"
+    assert response.headers["RateLimit-Remaining"] == "2"
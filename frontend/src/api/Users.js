@@ -8,6 +8,17 @@ export default {
         })
     },
 
+    /**
+     * Dữ liệu khởi tạo portal trong một request:
+     * user hiện tại, danh sách roles và dữ liệu riêng của portal
+     */
+    getBootstrap() {
+        return Send({
+            url: '/api/bootstrap',
+            method: 'GET',
+        })
+    },
+
     getUserById(id) {
         return Send({
             url: `/api/users/${id}`,
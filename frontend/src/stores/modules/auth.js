@@ -9,6 +9,8 @@ const useAuthStore = defineStore('auth', () => {
     // userData in localStorage is only for UI display, NOT for auth verification
     const user = ref(JSON.parse(localStorage.getItem(USER_DATA) || 'null'))
     const authVerified = ref(false) // Track if we've verified with server this session
+    const roles = ref([])
+    const portalData = ref({})
 
     // Getters
     const isAuthenticated = computed(() => authVerified.value && !!user.value)
@@ -78,10 +80,14 @@ const useAuthStore = defineStore('auth', () => {
 
     const fetchUser = async () => {
         try {
-            const response = await UsersApi.getCurrentUser()
-            setUser(response.data)
+            // One bootstrap call instead of /users/me + /auth/roles + portal data
+            const response = await UsersApi.getBootstrap()
+            const { user: userData, roles: roleList, data } = response.data
+            setUser(userData)
+            roles.value = roleList
+            portalData.value = data
             authVerified.value = true
-            return response.data
+            return userData
         } catch (error) {
             // Only log if it's not a 401 (which is expected when not authenticated)
             if (error.response?.status !== 401) {
@@ -117,6 +123,8 @@ const useAuthStore = defineStore('auth', () => {
     return {
         user,
         authVerified,
+        roles,
+        portalData,
         isAuthenticated,
         currentUser,
         setUser,